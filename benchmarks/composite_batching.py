@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compares the per-chunk overhead of computing composites for a batch of chunks (leading ``chunk`` dimension)
+with ``xr.apply_ufunc(..., vectorize=True)`` (``np.vectorize`` loop over the chunks, the previous implementation)
+and with the natively batched composite kernel.
+"""
+
+import timeit
+
+import click
+import numpy as np
+import xarray as xr
+
+from efast_openeo.algorithms.udf.udf_temporal_score_aggregate import (
+    _compute_combined_score_no_intermediates,
+    _compute_normalized_composite,
+    compute_temporal_score,
+)
+
+
+def composite_vectorized(distance_score, temporal_score, bands):
+    return xr.apply_ufunc(
+        _compute_normalized_composite,
+        distance_score,
+        temporal_score,
+        bands,
+        input_core_dims=[["t", "y", "x"], ["t_target", "t"], ["t", "bands", "y", "x"]],
+        output_core_dims=[["t_target", "bands", "y", "x"]],
+        vectorize=True,
+    )
+
+
+def make_inputs(n_chunks, n_t, n_t_target, n_bands, chunk_size, seed=0):
+    rng = np.random.default_rng(seed)
+    t = xr.date_range("2022-01-01", periods=n_t, freq="3D")
+    t_target = xr.date_range("2022-01-01", periods=n_t_target, freq="6D")
+    temporal_score = compute_temporal_score(t, t_target, 10)
+    shape = (n_chunks, n_t, chunk_size, chunk_size)
+    distance_score = xr.DataArray(
+        rng.uniform(size=shape), dims=["chunk", "t", "y", "x"], coords={"t": t}
+    )
+    bands = rng.uniform(size=(n_chunks, n_t, n_bands, chunk_size, chunk_size))
+    bands[rng.uniform(size=bands.shape) < 0.3] = np.nan
+    bands = xr.DataArray(bands, dims=["chunk", "t", "bands", "y", "x"], coords={"t": t})
+    return distance_score, temporal_score, bands
+
+
+@click.command()
+@click.option("--n-chunks", type=int, default=64, show_default=True)
+@click.option("--n-t", type=int, default=60, show_default=True)
+@click.option("--n-t-target", type=int, default=30, show_default=True)
+@click.option("--n-bands", type=int, default=4, show_default=True)
+@click.option("--chunk-size", type=int, multiple=True, default=[1, 4, 16, 32])
+@click.option("--repeat", type=int, default=5, show_default=True)
+def main(n_chunks, n_t, n_t_target, n_bands, chunk_size, repeat):
+    print(
+        f"{'chunk size':>10} {'vectorize=True [ms/chunk]':>26} {'batched [ms/chunk]':>19} {'speedup':>8}"
+    )
+    for size in chunk_size:
+        inputs = make_inputs(n_chunks, n_t, n_t_target, n_bands, size)
+        results = {}
+        for name, function in [
+            ("vectorized", composite_vectorized),
+            ("batched", _compute_combined_score_no_intermediates),
+        ]:
+            seconds = min(
+                timeit.repeat(lambda: function(*inputs), number=1, repeat=repeat)
+            )
+            results[name] = seconds / n_chunks * 1e3
+        print(
+            f"{size:>10} {results['vectorized']:>26.3f} {results['batched']:>19.3f} "
+            f"{results['vectorized'] / results['batched']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
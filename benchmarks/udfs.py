@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Runtime and peak memory of the UDFs (on a single chunk, as processed by one UDF invocation on the backend) and of
+the construction of the ``efast_openeo`` process graph, for a grid of chunk sizes, time series lengths and band
+counts. The inputs are generated with ``efast_openeo.synthetic``.
+
+The runtime is the minimum over ``--repeat`` calls, after a warm-up call (which fills the caches of the time axis
+artifacts, as for all but the first chunk processed by a worker). The peak memory is measured with ``tracemalloc``
+(numpy reports its allocations to it) in a separate call. The results are written as JSON, together with the
+commit they were measured on. Passing the JSON file of an earlier run as ``--compare`` prints the ratios of the
+new to the old results, to spot regressions between commits.
+"""
+
+import json
+import logging
+import platform
+import subprocess
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+from itertools import product
+from pathlib import Path
+
+import click
+import numpy as np
+import openeo
+import xarray as xr
+from openeo.udf import XarrayDataCube
+
+from efast_openeo import constants
+from efast_openeo.algorithms.udf import (
+    udf_distance_transform,
+    udf_fusion,
+    udf_temporal_interpolation,
+    udf_temporal_score_aggregate,
+)
+from efast_openeo.efast import efast_openeo
+from efast_openeo.synthetic import synthetic_cubes
+from efast_openeo.util.log import logger
+
+T_START = np.datetime64("2022-06-01")
+INTERVAL_DAYS = 5
+MAX_DISTANCE_SCORE_PIXELS = 5000 / constants.S3_RESOLUTION_M
+
+
+def _band_names(prefix, n_bands):
+    return [f"{prefix}{i}" for i in range(n_bands)]
+
+
+def _temporal_extent(n_t):
+    return [str(T_START), str(T_START + np.timedelta64(n_t, "D"))]
+
+
+def _s3_chunk(chunk_size, n_t, n_bands, cloud_pattern="blobs"):
+    """
+    Daily S3 chunk of ``chunk_size`` x ``chunk_size`` pixels with ``n_bands`` bands, cloudy pixels are NaN.
+    """
+    _, s3 = synthetic_cubes(
+        (chunk_size, chunk_size),
+        temporal_extent=_temporal_extent(n_t),
+        s2_revisit_days=n_t,
+        s2_resolution_m=constants.S3_RESOLUTION_M,
+        s2_bands=_band_names("B", n_bands),
+        s3_bands=_band_names("Oa", n_bands),
+        cloud_pattern=cloud_pattern,
+    )
+    flags = s3.sel(bands=constants.S3_FLAG_BAND)
+    return s3.drop_sel(bands=constants.S3_FLAG_BAND).where(flags == 0)
+
+
+def setup_distance_transform(chunk_size, n_t, n_bands):
+    cloud_mask = _s3_chunk(chunk_size, n_t, 1).isel(bands=0).isnull()
+    cube = XarrayDataCube(cloud_mask.drop_vars("bands"))
+    context = {
+        "max_distance": None,
+        "output": "distance_score",
+        "max_distance_score": MAX_DISTANCE_SCORE_PIXELS,
+    }
+    return lambda: udf_distance_transform.apply_datacube(cube, context)
+
+
+def setup_composite(chunk_size, n_t, n_bands):
+    bands = _s3_chunk(chunk_size, n_t, n_bands)
+    score = udf_distance_transform.apply_datacube(
+        XarrayDataCube(bands.isel(bands=0).isnull().drop_vars("bands")),
+        {"output": "distance_score", "max_distance_score": MAX_DISTANCE_SCORE_PIXELS},
+    ).get_array()
+    cube = xr.concat(
+        [bands, score.expand_dims(bands=["distance_score"], axis=1)], dim="bands"
+    )
+    context = dict(
+        temporal_extent_input=_temporal_extent(n_t),
+        temporal_extent_target=None,
+        interval_days=INTERVAL_DAYS,
+        sigma_doy=constants.S3_TEMPORAL_SCORE_STDDEV,
+    )
+    return lambda: udf_temporal_score_aggregate.apply_datacube(cube, context)
+
+
+def setup_interpolation(chunk_size, n_t, n_bands):
+    # the S3 composites, interpolated to the daily time series
+    cube = _s3_chunk(chunk_size, n_t, n_bands, cloud_pattern="none")
+    cube = cube.isel(t=slice(None, None, INTERVAL_DAYS))
+    context = dict(
+        temporal_extent_input=_temporal_extent(n_t),
+        temporal_extent_target=None,
+        interval_days=1,
+        target_band_name_suffix=constants.S3_INTERPOLATION_BAND_NAME_SUFFIX,
+    )
+    return lambda: udf_temporal_interpolation.apply_datacube(cube, context)
+
+
+def setup_fusion(chunk_size, n_t, n_bands):
+    # high and low resolution composites, and the interpolated low resolution bands on the target time series
+    s3 = _s3_chunk(chunk_size, n_t, n_bands, cloud_pattern="none")
+    s3 = s3.isel(t=slice(None, None, INTERVAL_DAYS))
+    hr_bands = _band_names("B", n_bands)
+    lr_bands = list(s3.bands.values)
+    lr_interpolated_bands = [
+        f"{band}{constants.S3_INTERPOLATION_BAND_NAME_SUFFIX}" for band in lr_bands
+    ]
+    cube = xr.concat(
+        [
+            s3.assign_coords(bands=hr_bands) * 1.1,
+            s3,
+            s3.assign_coords(bands=lr_interpolated_bands) * 0.9,
+        ],
+        dim="bands",
+    )
+    context = {
+        "lr_mosaic_bands": lr_bands,
+        "hr_mosaic_bands": hr_bands,
+        "lr_interpolated_band_name_suffix": constants.S3_INTERPOLATION_BAND_NAME_SUFFIX,
+    }
+    return lambda: udf_fusion.apply_datacube(cube, context)
+
+
+class OfflineConnection:
+    """
+    Stand-in for an openEO connection, which builds ``load_collection`` nodes without collection metadata, so that
+    the process graph can be built without a backend.
+    """
+
+    def describe_collection(self, collection_id):
+        return {}
+
+    def load_collection(self, collection_id, **kwargs):
+        return openeo.DataCube.load_collection(collection_id, connection=None, **kwargs)
+
+
+def setup_graph(chunk_size, n_t, n_bands):
+    connection = OfflineConnection()
+    parameters = dict(
+        max_distance_to_cloud_m=5000,
+        temporal_extent=_temporal_extent(n_t),
+        bbox=dict(west=10.0, south=50.0, east=10.5, north=50.5),
+        s3_data_bands=_band_names("Syn_Oa", n_bands),
+        s2_data_bands=_band_names("B", n_bands),
+        fused_band_names=None,
+        output_dir=".",
+        save_intermediates=False,
+        synchronous=False,
+        skip_intermediates=[],
+        file_format="netcdf",
+        cloud_tolerance_percentage=0.05,
+        temporal_extent_target=None,
+        interval_days=INTERVAL_DAYS,
+        temporal_score_stddev=constants.S2_TEMPORAL_SCORE_STDDEV,
+        output_ndvi=False,
+    )
+    return lambda: efast_openeo(connection, **parameters).flat_graph()
+
+
+# name: (setup function, parameters the benchmark depends on)
+BENCHMARKS = {
+    "distance_transform": (setup_distance_transform, ["chunk_size", "n_t"]),
+    "composite": (setup_composite, ["chunk_size", "n_t", "n_bands"]),
+    "interpolation": (setup_interpolation, ["chunk_size", "n_t", "n_bands"]),
+    "fusion": (setup_fusion, ["chunk_size", "n_t", "n_bands"]),
+    "graph": (setup_graph, ["n_t", "n_bands"]),
+}
+
+
+def peak_memory_mb(function):
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2**20
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return result["benchmark"], tuple(sorted(result["params"].items()))
+
+
+@click.command()
+@click.option(
+    "-b",
+    "--benchmark",
+    type=click.Choice(list(BENCHMARKS)),
+    multiple=True,
+    help="Benchmarks to run (default: all).",
+)
+@click.option("--chunk-size", type=int, multiple=True, default=[64, 128, 256])
+@click.option("--n-t", type=int, multiple=True, default=[30, 90])
+@click.option("--n-bands", type=int, multiple=True, default=[2, 4])
+@click.option("--repeat", type=int, default=3, show_default=True)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="JSON file for the results (default: benchmark_results/<commit>.json).",
+)
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="JSON file of an earlier run to compare with.",
+)
+def main(benchmark, chunk_size, n_t, n_bands, repeat, output, compare):
+    logger.setLevel(logging.WARNING)
+    commit = git_commit()
+    grid = dict(chunk_size=chunk_size, n_t=n_t, n_bands=n_bands)
+    baseline = {}
+    if compare is not None:
+        baseline = {
+            result_key(result): result
+            for result in json.loads(compare.read_text())["results"]
+        }
+
+    print(
+        f"{'benchmark':<20} {'parameters':<36} {'time [ms]':>10} {'peak [MB]':>10}"
+        + (f" {'time ratio':>10} {'peak ratio':>10}" if baseline else "")
+    )
+    results = []
+    for name in benchmark or BENCHMARKS:
+        setup, param_names = BENCHMARKS[name]
+        for values in product(*(grid[param] for param in param_names)):
+            params = dict(zip(param_names, values))
+            function = setup(**{**dict.fromkeys(grid), **params})
+            function()
+            seconds = timeit.repeat(function, number=1, repeat=repeat)
+            result = dict(
+                benchmark=name,
+                params=params,
+                seconds_min=min(seconds),
+                seconds_median=float(np.median(seconds)),
+                peak_memory_mb=peak_memory_mb(function),
+            )
+            results.append(result)
+
+            line = (
+                f"{name:<20} {', '.join(f'{k}={v}' for k, v in params.items()):<36} "
+                f"{result['seconds_min'] * 1e3:>10.2f} {result['peak_memory_mb']:>10.1f}"
+            )
+            old = baseline.get(result_key(result))
+            if old is not None:
+                line += (
+                    f" {result['seconds_min'] / old['seconds_min']:>10.2f}"
+                    f" {result['peak_memory_mb'] / max(old['peak_memory_mb'], 1e-9):>10.2f}"
+                )
+            print(line)
+
+    if output is None:
+        output = Path("benchmark_results") / f"{(commit or 'unknown')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps(
+            dict(
+                commit=commit,
+                timestamp=datetime.now(timezone.utc).isoformat(),
+                python=platform.python_version(),
+                numpy=np.__version__,
+                xarray=xr.__version__,
+                machine=platform.machine(),
+                repeat=repeat,
+                results=results,
+            ),
+            indent=2,
+        )
+    )
+    print(f"Results written to '{output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import importlib
 
 import openeo
 
+from efast_openeo.algorithms.udf import udf_code
 from efast_openeo.constants import S2Scl, S3SynCloudFlags
 
 UDF_DISTANCE_TRANSFORM_PATH = importlib.resources.files(
@@ -30,6 +31,10 @@ def distance_to_cloud(
     max_distance_pixels: int | None = None,
     pixel_size_native_units: int | float | None = None,
     max_distance_native_units: int | float | None = None,
+    distance_bound_pixels: int | float | None = None,
+    chunk_days: int = 1,
+    dtype: str | None = None,
+    instrumentation: dict | None = None,
 ):
     """
     Compute the distance to cloud on a binary ``cloud_mask``. Distance is computed for all ``False`` pixels to all ``True`` pixels.
@@ -47,6 +52,13 @@ def distance_to_cloud(
     :param max_distance_native_units: Maximum cloud distance that can be detected in the native units of the raster.
     :param pixel_size_native_units: Length of one pixel in the raster in its native units, assumed to be constant.
         If this parameter is specified, the distance to cloud is returned in native units.
+    :param distance_bound_pixels: If set, only distances up to ``distance_bound_pixels`` pixels are computed exactly,
+        larger distances are returned as ``inf``. This is cheaper for chunks with few clouds and is sufficient if
+        the distances are clipped afterwards (e.g. in ``compute_distance_score``).
+    :param chunk_days: Number of days processed by one UDF invocation. The distance is computed for each day separately,
+        but larger chunks reduce the per-invocation overhead for small areas of interest.
+    :param dtype: Data type (e.g. ``"float32"``) of the distance computed in the UDF, ``float64`` if not set.
+    :param instrumentation: If set, the UDF invocations are instrumented (see ``efast_openeo.instrumentation``).
 
     :return distance the nearest cloud (value of ``True`` in ``cloud_mask`` for each pixel that is ``False`` in
         ``cloud_mask``, either in native units (if ``pixel_size_native_units`` is set) or in pixels otherwise.
@@ -68,6 +80,10 @@ def distance_to_cloud(
         cloud_mask,
         image_size_pixels=image_size_pixels,
         border_pixels=max_distance_pixels,
+        max_distance=distance_bound_pixels,
+        chunk_days=chunk_days,
+        dtype=dtype,
+        instrumentation=instrumentation,
     )
     if (
         max_distance_native_units is not None
@@ -78,7 +94,15 @@ def distance_to_cloud(
 
 
 def euclidean_distance_transform(
-    band: openeo.DataCube, image_size_pixels, border_pixels
+    band: openeo.DataCube,
+    image_size_pixels,
+    border_pixels,
+    max_distance: int | float | None = None,
+    chunk_days: int = 1,
+    output: str = "distance",
+    max_distance_score: int | float | None = None,
+    dtype: str | None = None,
+    instrumentation: dict | None = None,
 ) -> openeo.DataCube:
     """
     Computes the distance (in pixels) to the closest background pixel value of ``False``.
@@ -88,14 +112,33 @@ def euclidean_distance_transform(
     This means, the maximum possible distance to be computed is ``border_pixels + image_size_pixels - 1``.
     from a pixel of interest (``False``) situated on one edge of the border to the edge of the image (without border)
     on the opposite side.
+
+    Each UDF invocation processes ``chunk_days`` days, the distance is computed separately for each day.
+
+    If ``max_distance`` is set, distances larger than ``max_distance`` pixels are not computed and returned as ``inf``.
+
+    If ``output`` is ``"distance_score"``, the distance score ``clip((d - 1) / max_distance_score, 0, 1)``
+    (see ``compute_distance_score``) is returned instead of the distance ``d``.
+
+    The distance is computed as ``dtype`` (``float64`` if not set).
+
+    If ``instrumentation`` is set, the UDF invocations are instrumented (see ``efast_openeo.instrumentation``).
     """
-    udf = openeo.UDF.from_file(
-        UDF_DISTANCE_TRANSFORM_PATH, runtime="Python"
+    udf = openeo.UDF(
+        code=udf_code(UDF_DISTANCE_TRANSFORM_PATH), runtime="Python"
     )  # , version="3")
+    context = {
+        "dtype": dtype,
+        "max_distance": max_distance,
+        "output": output,
+        "max_distance_score": max_distance_score,
+    }
+    if instrumentation is not None:
+        context["instrumentation"] = instrumentation
     dt = band.apply_neighborhood(
         udf,
         size=[
-            {"dimension": "t", "value": "P1D"},
+            {"dimension": "t", "value": f"P{chunk_days}D"},
             {"dimension": "x", "value": image_size_pixels, "unit": "px"},
             {"dimension": "y", "value": image_size_pixels, "unit": "px"},
         ],
@@ -103,10 +146,49 @@ def euclidean_distance_transform(
             {"dimension": "x", "value": border_pixels, "unit": "px"},
             {"dimension": "y", "value": border_pixels, "unit": "px"},
         ],
+        context=context,
     )
     return dt
 
 
+def distance_score_to_cloud(
+    cloud_mask: openeo.DataCube,
+    image_size_pixels: int,
+    *,
+    max_distance_pixels: int,
+    max_distance_score_pixels: int | float,
+    chunk_days: int = 1,
+    dtype: str | None = None,
+    instrumentation: dict | None = None,
+) -> openeo.DataCube:
+    """
+    Compute the distance score (see ``compute_distance_score``) of the distance to cloud (see ``distance_to_cloud``)
+    in a single UDF. Distances are computed in pixels, and only up to ``max_distance_score_pixels + 1``, beyond which
+    the score is 1. This avoids the full-size distance cube and the arithmetic nodes of ``compute_distance_score``.
+
+    :param cloud_mask: The cloud mask (``True`` means cloud)
+    :param image_size_pixels: Chunk size for the computation. Should be larger than ``max_distance_pixels``.
+    :param max_distance_pixels: Maximum cloud distance that can be detected, given as the number of pixels from the cloud.
+    :param max_distance_score_pixels: Distance (in pixels) from which the distance score is 1.
+    :param chunk_days: Number of days processed by one UDF invocation.
+    :param dtype: Data type (e.g. ``"float32"``) of the score computed in the UDF, ``float64`` if not set.
+    :param instrumentation: If set, the UDF invocations are instrumented (see ``efast_openeo.instrumentation``).
+
+    :return: distance score with a single ``distance_score`` band
+    """
+    score = euclidean_distance_transform(
+        cloud_mask,
+        image_size_pixels=image_size_pixels,
+        border_pixels=max_distance_pixels,
+        chunk_days=chunk_days,
+        output="distance_score",
+        max_distance_score=max_distance_score_pixels,
+        dtype=dtype,
+        instrumentation=instrumentation,
+    )
+    return score.add_dimension("bands", "distance_score", type="bands")
+
+
 def compute_distance_score(
     distance_to_cloud: openeo.DataCube, max_distance
 ) -> openeo.DataCube:
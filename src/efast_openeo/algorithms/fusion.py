@@ -2,6 +2,9 @@ import importlib
 from typing import List
 import openeo
 
+from efast_openeo import constants
+from efast_openeo.algorithms.udf import udf_code
+
 
 UDF_FUSION_SCORE = importlib.resources.files("efast_openeo.algorithms.udf").joinpath(
     "udf_fusion.py"
@@ -15,6 +18,8 @@ def fusion(
     low_resolution_interpolated_band_name_suffix: str,
     output_ndvi: bool,
     target_band_names: List[str] | None = None,
+    dtype: str | None = None,
+    instrumentation: dict | None = None,
 ):
     """
     The EFAST fusion procedure combines two temporally and spatially weighted composites (called "mosaics") of
@@ -41,19 +46,62 @@ def fusion(
         matched to ``low_resolution_band_names``.
     :param target_band_names: Names to be assigned to the output data cube, same order as
         ``low_resolution_band_names`` and ``high_resolution_band_names``.
+    :param output_ndvi: If set, only the ``constants.NDVI_NIR_BAND`` and ``constants.NDVI_RED_BAND`` target bands
+        are fused and the NDVI is returned as the only band (``ndvi``).
+    :param dtype: data type (e.g. ``"float32"``) in which the fusion is computed and returned. The data type of the
+        input cube is kept if not set.
+    :param instrumentation: If set, the UDF invocations are instrumented (see ``efast_openeo.instrumentation``).
     """
 
-    udf = openeo.UDF.from_file(
-        UDF_FUSION_SCORE, context={"from_parameter": "context"}, runtime="Python"
+    udf = openeo.UDF(
+        code=udf_code(UDF_FUSION_SCORE),
+        context={"from_parameter": "context"},
+        runtime="Python",
     )  # , version="3")
     context = {
         "lr_mosaic_bands": low_resolution_mosaic_band_names,
         "hr_mosaic_bands": high_resolution_mosaic_band_names,
         "lr_interpolated_band_name_suffix": low_resolution_interpolated_band_name_suffix,
         "output_ndvi": output_ndvi,
+        "ndvi_bands": [constants.NDVI_NIR_BAND, constants.NDVI_RED_BAND],
+        "dtype": dtype,
     }
     if target_band_names is not None:
         context["target_bands"] = target_band_names
+    if instrumentation is not None:
+        context["instrumentation"] = instrumentation
 
     fused = cube.apply_dimension(process=udf, dimension="bands", context=context)
     return fused
+
+
+def select_ndvi_bands(
+    high_resolution_mosaic_band_names: List[str],
+    low_resolution_mosaic_band_names: List[str],
+    target_band_names: List[str] | None = None,
+) -> tuple[List[str], List[str], List[str]]:
+    """
+    Select the matching high resolution, low resolution and target bands which are needed to compute the NDVI
+    in ``fusion`` (the ``constants.NDVI_NIR_BAND`` and ``constants.NDVI_RED_BAND`` target bands), so that only
+    those bands need to be loaded.
+
+    :return: ``(high_resolution_mosaic_band_names, low_resolution_mosaic_band_names, target_band_names)``
+        restricted to the NDVI bands, in the original order.
+    """
+    if target_band_names is None:
+        target_band_names = high_resolution_mosaic_band_names
+    ndvi_bands = {constants.NDVI_NIR_BAND, constants.NDVI_RED_BAND}
+    assert ndvi_bands.issubset(target_band_names), (
+        f"The NDVI bands {ndvi_bands} must be among the fused bands, found '{target_band_names}'."
+    )
+    selected = [
+        (hr, lr, target)
+        for hr, lr, target in zip(
+            high_resolution_mosaic_band_names,
+            low_resolution_mosaic_band_names,
+            target_band_names,
+        )
+        if target in ndvi_bands
+    ]
+    hr_bands, lr_bands, target_bands = (list(bands) for bands in zip(*selected))
+    return hr_bands, lr_bands, target_bands
@@ -0,0 +1,154 @@
+import importlib
+from typing import List
+
+import openeo
+from openeo import processes
+from openeo.api.process import Parameter
+
+from efast_openeo.algorithms.udf import udf_code
+from efast_openeo.algorithms.weighted_composite import compute_weighted_composite
+
+UDF_S3_TEMPORAL_CHAIN = importlib.resources.files(
+    "efast_openeo.algorithms.udf"
+).joinpath("udf_s3_temporal_chain.py")
+
+# Must match ``S2_OBSERVATION_BAND`` of the S3 temporal chain UDF
+S2_OBSERVATION_BAND = "s2_observation"
+
+
+def s3_temporal_chain_udf_code() -> str:
+    """
+    Source of the S3 temporal chain UDF, including the source of the interpolation UDF it calls,
+    because the UDF must be shipped as a single file (see ``udf_code``).
+    """
+    return udf_code(UDF_S3_TEMPORAL_CHAIN)
+
+
+def s3_temporal_chain(
+    cube_with_distance_score: openeo.DataCube,
+    *,
+    s2_cube: openeo.DataCube,
+    temporal_extent: List[str] | Parameter | None,
+    temporal_extent_target: List[str] | Parameter | None,
+    interval_days: int,
+    sigma_doy: float,
+    smoothing_kernel,
+    target_band_name_suffix: str,
+    temporal_score_truncate: float | None = None,
+    memory_budget_mb: float | None = None,
+    engine: str = "numpy",
+    mosaic_days: int | None = None,
+    dtype: str | None = None,
+    instrumentation: dict | None = None,
+) -> openeo.DataCube:
+    """
+    Computes the weighted composite (see ``compute_weighted_composite``), smooths it spatially with
+    ``smoothing_kernel`` (``apply_kernel``) and interpolates it to the target time series (see
+    ``interpolate_time_series_to_target_extent``) and to the time stamps of ``s2_cube`` (see
+    ``interpolate_time_series_to_target_labels``) in a single UDF, so that the backend moves the smoothed composite
+    only once.
+
+    The smoothing is not computed in a UDF: ``apply_dimension`` processes spatial chunks without overlap, so that
+    smoothing within the UDF would differ from ``apply_kernel`` at the chunk borders.
+
+    The Sentinel-2 time stamps are passed to the UDF as a band (``S2_OBSERVATION_BAND``, constant 1 on the time
+    stamps of ``s2_cube``) merged into the smoothed composite, because the backend does not resolve process results
+    (such as ``dimension_labels``) nested in the UDF context. ``s2_cube`` must not have a band dimension (e.g. a
+    single band selected with ``band``), only its time stamps are used.
+
+    The result is a cube on the union of the target time series and the Sentinel-2 time stamps, with two groups of
+    bands: the interpolation to the target time series (band names suffixed with ``target_band_name_suffix``) and
+    the interpolation to the Sentinel-2 time stamps (original band names). Each group is NaN on the time stamps of
+    the other group (see ``select_target_time_series`` and ``select_s2_time_series``).
+
+    If ``instrumentation`` is set, the invocations of the UDFs are instrumented (see ``efast_openeo.instrumentation``).
+    """
+    composite = compute_weighted_composite(
+        cube_with_distance_score,
+        temporal_extent=temporal_extent,
+        temporal_extent_target=temporal_extent_target,
+        interval_days=interval_days,
+        sigma_doy=sigma_doy,
+        temporal_score_truncate=temporal_score_truncate,
+        memory_budget_mb=memory_budget_mb,
+        engine=engine,
+        mosaic_days=mosaic_days,
+        dtype=dtype,
+        instrumentation=instrumentation,
+    )
+    smoothed = composite.filter_labels(
+        dimension="bands", condition=lambda b: b != "distance_score"
+    ).apply_kernel(kernel=smoothing_kernel)
+
+    s2_observations = (
+        s2_cube.resample_cube_spatial(smoothed, method="near")
+        .apply(lambda x: processes.constant(1))
+        .add_dimension("bands", S2_OBSERVATION_BAND, type="bands")
+    )
+
+    udf = openeo.UDF(
+        code=s3_temporal_chain_udf_code(),
+        runtime="Python",
+        context={"from_parameter": "context"},
+    )
+    context = dict(
+        temporal_extent_input=temporal_extent,
+        temporal_extent_target=temporal_extent_target,
+        interval_days=interval_days,
+        dtype=dtype,
+        target_band_name_suffix=target_band_name_suffix,
+    )
+    if instrumentation is not None:
+        context["instrumentation"] = instrumentation
+    return smoothed.merge_cubes(s2_observations).apply_dimension(
+        process=udf, dimension="t", context=context
+    )
+
+
+def select_target_time_series(
+    chained: openeo.DataCube,
+    *,
+    band_names: List[str],
+    temporal_extent: List[str],
+    temporal_extent_target: List[str] | None,
+    interval_days: int,
+) -> openeo.DataCube:
+    """
+    Select the bands ``band_names`` of the output of ``s3_temporal_chain`` on the target time series (every
+    ``interval_days`` days in ``temporal_extent_target``, or ``temporal_extent`` if not set).
+
+    The time stamps are selected by comparing dates (whole multiples of ``interval_days`` days after the start of
+    the target time series), which does not depend on the format of the time labels of the backend.
+    """
+    if temporal_extent_target is None or len(temporal_extent_target) == 0:
+        temporal_extent_target = temporal_extent
+    start = temporal_extent_target[0]
+    return (
+        chained.filter_bands(band_names)
+        .filter_temporal(temporal_extent_target)
+        .filter_labels(
+            dimension="t",
+            condition=lambda t: (
+                processes.mod(
+                    processes.date_difference(start, t, unit="day"), interval_days
+                )
+                == 0
+            ),
+        )
+    )
+
+
+def select_s2_time_series(
+    chained: openeo.DataCube,
+    *,
+    band_names: List[str],
+    s2_cube: openeo.DataCube,
+) -> openeo.DataCube:
+    """
+    Select the bands ``band_names`` of the output of ``s3_temporal_chain`` on the time stamps of ``s2_cube``.
+
+    The time stamps are selected with ``resample_cube_temporal``, which takes the values of the time stamps of
+    ``chained`` equal to the ones of ``s2_cube``. The target time stamps, on which the selected bands are NaN, are
+    dropped, so that merging the result with ``s2_cube`` does not add them to its time series.
+    """
+    return chained.filter_bands(band_names).resample_cube_temporal(s2_cube)
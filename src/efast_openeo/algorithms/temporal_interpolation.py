@@ -3,6 +3,7 @@ from typing import List
 
 import openeo
 
+from efast_openeo.algorithms.udf import udf_code
 
 UDF_TEMPORAL_INTERPOLATION = importlib.resources.files(
     "efast_openeo.algorithms.udf"
@@ -15,10 +16,13 @@ def interpolate_time_series_to_target_extent(
         temporal_extent,
         interval_days,
         temporal_extent_target,
-        target_band_name_suffix=""
+        target_band_name_suffix="",
+        skip_nan: bool = False,
+        dtype: str | None = None,
+        instrumentation: dict | None = None,
     ):
-    udf = openeo.UDF.from_file(
-        UDF_TEMPORAL_INTERPOLATION,
+    udf = openeo.UDF(
+        code=udf_code(UDF_TEMPORAL_INTERPOLATION),
         context={"from_parameter": "context"},
         runtime="Python",
     )
@@ -27,14 +31,18 @@ def interpolate_time_series_to_target_extent(
         temporal_extent_target=temporal_extent_target,
         interval_days=interval_days,
         target_band_name_suffix=target_band_name_suffix,
+        skip_nan=skip_nan,
+        dtype=dtype,
     )
+    if instrumentation is not None:
+        context["instrumentation"] = instrumentation
     interpolated = cube.apply_dimension(process=udf, dimension="t", context=context)
     return interpolated
 
 
 def interpolate_time_series_to_target_labels(cube, target_labels):
-    udf = openeo.UDF.from_file(
-        UDF_TEMPORAL_INTERPOLATION,
+    udf = openeo.UDF(
+        code=udf_code(UDF_TEMPORAL_INTERPOLATION),
         context={"from_parameter": "context"},
         runtime="Python",
     )  # , version="3")
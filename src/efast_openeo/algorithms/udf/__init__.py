@@ -0,0 +1,37 @@
+import importlib.resources
+import re
+from pathlib import Path
+
+UDF_DIR = importlib.resources.files("efast_openeo.algorithms.udf")
+UDF_COMMON = UDF_DIR.joinpath("udf_common.py")
+
+_COMMON_IMPORT = re.compile(
+    r"^from efast_openeo\.algorithms\.udf\.udf_common import (\([^)]*\)|.*)$",
+    re.MULTILINE,
+)
+_UDF_IMPORT = re.compile(
+    r"^from efast_openeo\.algorithms\.udf import (\w+) as (\w+)$", re.MULTILINE
+)
+
+
+def udf_code(path: str | Path) -> str:
+    """
+    Source of the UDF in ``path``, to be shipped to the backend as a single file. The import of the helpers
+    shared by the UDFs (``udf_common``) is replaced by the source of ``udf_common``. Imports of other UDFs
+    (``from efast_openeo.algorithms.udf import <udf> as <name>``) are replaced by the execution of their
+    (shipped) source in a module ``<name>`` of its own, to avoid name clashes between the UDFs.
+    """
+    source = (Path(path) if isinstance(path, str) else path).read_text()
+    common = UDF_COMMON.read_text()
+    source = _COMMON_IMPORT.sub(lambda _: common, source, count=1)
+    return _UDF_IMPORT.sub(_inline_udf, source)
+
+
+def _inline_udf(match: re.Match) -> str:
+    udf, name = match.groups()
+    source = udf_code(UDF_DIR.joinpath(f"{udf}.py"))
+    return (
+        f"import types\n\n"
+        f"{name} = types.ModuleType({udf!r})\n"
+        f"exec(compile({source!r}, {udf!r}, 'exec'), {name}.__dict__)"
+    )
@@ -0,0 +1,158 @@
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from openeo.udf import inspect
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Helpers shared by the UDFs. The UDFs import them from this module, the import is replaced by the source of this
+# module when the UDF code is shipped to the backend (see ``efast_openeo.algorithms.udf.udf_code``).
+
+# Prefix of the instrumentation records in the logs (see ``efast_openeo.instrumentation``)
+INSTRUMENTATION_RECORD_PREFIX = "EFAST_UDF_RECORD"
+
+
+def _instrumented(function: Callable) -> Callable:
+    """
+    Opt-in instrumentation of the UDF entry point ``function(cube, context)``. If ``"instrumentation"`` is set in
+    ``context`` (``True`` or a dict), each invocation is logged with ``inspect`` as a JSON record (following
+    ``INSTRUMENTATION_RECORD_PREFIX``) with its wall time, the shapes and data types of the input and output,
+    labelled with the ``"stage"`` of the instrumentation dict and the ``UDF_NAME`` of the UDF module. The record
+    contains the peak memory allocated during the invocation (``peak_memory_mb``, traced with tracemalloc, which
+    includes numpy arrays) and the peak resident set size of the worker process over its lifetime
+    (``worker_max_rss_mb``), which includes earlier invocations.
+    If ``"profile_dir"`` is set in the instrumentation dict, the invocation is profiled with cProfile and the
+    stats are dumped to a file in this directory.
+    """
+
+    @functools.wraps(function)
+    def instrumented(cube, context):
+        instrumentation = (
+            context.get("instrumentation") if isinstance(context, dict) else None
+        )
+        if not instrumentation:
+            return function(cube, context)
+        if not isinstance(instrumentation, dict):
+            instrumentation = {}
+        # UDF modules are executed without a ``__name__`` on the backend
+        udf = function.__globals__.get("UDF_NAME") or function.__module__
+        profile_dir = instrumentation.get("profile_dir")
+        profiler = cProfile.Profile() if profile_dir else None
+        start_tracing = not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        traced_before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            if profiler is None:
+                result = function(cube, context)
+            else:
+                result = profiler.runcall(function, cube, context)
+            wall_time_s = time.perf_counter() - start
+            _, traced_peak = tracemalloc.get_traced_memory()
+        finally:
+            if start_tracing:
+                tracemalloc.stop()
+        record = {
+            "stage": instrumentation.get("stage") or udf,
+            "udf": udf,
+            "pid": os.getpid(),
+            "wall_time_s": wall_time_s,
+            **_array_info("input", cube),
+            **_array_info("output", result),
+            "peak_memory_mb": (traced_peak - traced_before) / 2**20,
+            "worker_max_rss_mb": _worker_max_rss_mb(),
+        }
+        if profiler is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+            record["profile"] = os.path.join(
+                profile_dir, f"{record['stage']}-{record['pid']}-{time.time_ns()}.prof"
+            )
+            profiler.dump_stats(record["profile"])
+        inspect(
+            data=record,
+            message=f"{INSTRUMENTATION_RECORD_PREFIX} {json.dumps(record)}",
+            level="info",
+        )
+        return result
+
+    return instrumented
+
+
+def _array_info(name: str, cube) -> dict:
+    array = cube.get_array() if hasattr(cube, "get_array") else cube
+    return {
+        f"{name}_shape": list(array.shape),
+        f"{name}_dims": list(array.dims),
+        f"{name}_dtype": str(array.dtype),
+    }
+
+
+def _worker_max_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    # ru_maxrss is given in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _LRUCache:
+    """
+    Process-local least recently used cache, counting hits and misses.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, compute: Callable):
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        self.misses += 1
+        value = compute()
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def info(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+    def clear(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries.clear()
+
+
+def _freeze(value):
+    """
+    Hashable representation of ``value`` (e.g. ``context`` or time labels), used as a cache key.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (np.ndarray, pd.Index, xr.DataArray, xr.Variable)):
+        return (str(np.asarray(value).dtype), tuple(np.asarray(value).tolist()))
+    return value
@@ -3,17 +3,144 @@ import numpy as np
 import xarray as xr
 from openeo.udf import XarrayDataCube
 
+from efast_openeo.algorithms.udf.udf_common import (
+    INSTRUMENTATION_RECORD_PREFIX,  # noqa: F401
+    _instrumented,
+)
 
+# Name of the UDF in the instrumentation records (the module has no name when run by the backend)
+UDF_NAME = "distance_transform"
+
+OUTPUTS = ["distance", "distance_score"]
+
+# Minimum width (pixels) of the tiles of the bounded distance transform
+MIN_TILE_SIZE = 16
+
+
+@_instrumented
 def apply_datacube(cube: XarrayDataCube, context: dict) -> XarrayDataCube:
     """
     Expects the cloud mask as input (in contrast to ``distance_transform_edt``).
     This is necessary, because ``apply_neighborhood`` pads the input with zeros and not ones.
+
+    The chunk may contain several time steps, the (2-D) distance transform is computed separately for each of them.
+    Time steps without clouds have a distance of ``inf``.
+
+    The distance is returned as ``float64``, unless a different data type is set as ``"dtype"`` in ``context``.
+
+    If ``"max_distance"`` (in pixels) is set in ``context``, the distance transform is bounded: distances up to
+    ``max_distance`` are exact, larger distances are returned as ``inf`` (like pixels in tiles without clouds).
+
+    If ``"output"`` is ``"distance_score"`` in ``context``, the distance score ``clip((d - 1) / max_distance_score, 0, 1)``
+    is returned instead of the distance ``d``, with ``"max_distance_score"`` (in pixels) taken from ``context``.
+    The distance transform is then bounded at ``max_distance_score + 1``, unless ``"max_distance"`` is set.
     """
     array = cube.get_array()
+    dtype = np.float64
+    max_distance = None
+    output = "distance"
+    if isinstance(context, dict):
+        if context.get("dtype") is not None:
+            dtype = np.dtype(context["dtype"])
+        max_distance = context.get("max_distance")
+        output = context.get("output") or output
+    assert output in OUTPUTS, f"Unknown output '{output}', expected one of {OUTPUTS}"
+    if output == "distance_score":
+        max_distance_score = context["max_distance_score"]
+        if max_distance is None:
+            # the score is 1 for all larger distances
+            max_distance = max_distance_score + 1
+
     # This special case appears to create some issues, so we skip it
     if not array.any():
-        return XarrayDataCube(
-            xr.DataArray(np.full_like(array, np.inf), dims=["t", "y", "x"])
-        )
-    distance = distance_transform_edt(np.logical_not(array))
-    return XarrayDataCube(xr.DataArray(distance, dims=["t", "y", "x"]))
+        distance = np.full(array.shape, np.inf)
+    elif array.all():
+        distance = np.zeros(array.shape)
+    else:
+        # The distance is computed per time slice, a 3-D transform would leak distances across days
+        mask = np.asarray(array, dtype=bool)
+        distance = np.stack(
+            [
+                distance_transform_2d(mask_slice, max_distance)
+                for mask_slice in mask.reshape(-1, *mask.shape[-2:])
+            ]
+        ).reshape(mask.shape)
+
+    if output == "distance_score":
+        distance -= 1
+        distance /= max_distance_score
+        np.clip(distance, 0, 1, out=distance)
+    return XarrayDataCube(
+        xr.DataArray(distance.astype(dtype, copy=False), dims=["t", "y", "x"])
+    )
+
+
+def distance_transform_2d(
+    cloud_mask: np.ndarray, max_distance: float | None = None
+) -> np.ndarray:
+    """
+    Distance of each pixel of the 2-D ``cloud_mask`` to the closest cloud (``True``) pixel, ``inf`` if there is no
+    cloud. If ``max_distance`` is set, distances larger than ``max_distance`` are returned as ``inf``.
+
+    The bounded distance transform is computed per tile (see ``bounded_windows``): the distances within
+    ``max_distance`` of the pixels of a tile only depend on the clouds within ``max_distance`` of the tile, so the
+    exact distance transform is only computed on the windows around tiles close to clouds. If the windows cover
+    more pixels than the image (dense clouds), the distance transform of the whole image is computed instead.
+    """
+    if not cloud_mask.any():
+        return np.full(cloud_mask.shape, np.inf)
+    if cloud_mask.all():
+        return np.zeros(cloud_mask.shape)
+    if max_distance is None:
+        return distance_transform_edt(np.logical_not(cloud_mask))
+
+    windows = bounded_windows(cloud_mask, max_distance)
+    if sum(_size(window) for _, window in windows) >= cloud_mask.size:
+        distance = distance_transform_edt(np.logical_not(cloud_mask))
+    else:
+        distance = np.full(cloud_mask.shape, np.inf)
+        for tile, window in windows:
+            window_distance = distance_transform_edt(np.logical_not(cloud_mask[window]))
+            distance[tile] = window_distance[
+                tuple(
+                    slice(t.start - w.start, t.stop - w.start)
+                    for t, w in zip(tile, window)
+                )
+            ]
+    distance[distance > max_distance] = np.inf
+    return distance
+
+
+def bounded_windows(
+    cloud_mask: np.ndarray, max_distance: float, tile_size: int | None = None
+) -> list:
+    """
+    Tiles of the 2-D ``cloud_mask`` with a cloud within ``max_distance`` pixels, each with its window (the tile
+    extended by ``max_distance`` pixels), as pairs ``(tile, window)`` of ``(y, x)`` slices. The windows contain all
+    clouds within ``max_distance`` of the pixels of their tiles.
+
+    The tiles are ``tile_size`` pixels wide, ``4 * max_distance`` by default, so that a window is at most about
+    2.25 times the area of its tile.
+    """
+    margin = int(np.floor(max_distance)) + 1
+    if tile_size is None:
+        tile_size = max(4 * margin, MIN_TILE_SIZE)
+    n_y, n_x = cloud_mask.shape
+    windows = []
+    for y in range(0, n_y, tile_size):
+        for x in range(0, n_x, tile_size):
+            tile = (
+                slice(y, min(y + tile_size, n_y)),
+                slice(x, min(x + tile_size, n_x)),
+            )
+            window = (
+                slice(max(y - margin, 0), min(y + tile_size + margin, n_y)),
+                slice(max(x - margin, 0), min(x + tile_size + margin, n_x)),
+            )
+            if cloud_mask[window].any():
+                windows.append((tile, window))
+    return windows
+
+
+def _size(window) -> int:
+    return int(np.prod([s.stop - s.start for s in window]))
@@ -2,11 +2,29 @@ import xarray as xr
 import numpy as np
 from openeo.metadata import CubeMetadata
 
+from efast_openeo.algorithms.udf.udf_common import (
+    INSTRUMENTATION_RECORD_PREFIX,  # noqa: F401
+    _instrumented,
+)
 
+# Name of the UDF in the instrumentation records (the module has no name when run by the backend)
+UDF_NAME = "fusion"
+
+# default (NIR, red) target bands for the NDVI
+NDVI_BANDS = ["B8A", "B04"]
+
+
+@_instrumented
 def apply_datacube(cube: xr.DataArray, context: dict) -> xr.DataArray:
     """
     Computes the main fusion procedure, equation (3) in [1].
 
+    If ``"dtype"`` is set in ``context`` (e.g. ``"float32"``), the inputs are converted to this data type
+    and the fusion is computed and returned in it.
+
+    If ``"output_ndvi"`` is set in ``context``, only the NIR and red bands (the target bands named in
+    ``"ndvi_bands"``, ``["B8A", "B04"]`` by default) are fused and the NDVI is returned as the only band.
+
     [1]: Senty, Paul, Radoslaw Guzinski, Kenneth Grogan, et al. “Fast Fusion of Sentinel-2 and Sentinel-3 Time Series over Rangelands.” Remote Sensing 16, no. 11 (2024): 11. https://doi.org/10.3390/rs16111833.
     """
     assert "bands" in cube.dims, (
@@ -31,14 +49,27 @@ def apply_datacube(cube: xr.DataArray, context: dict) -> xr.DataArray:
     if target_bands is None or len(target_bands) != len(hr_mosaic_bands):
         target_bands = hr_mosaic_bands
     output_ndvi = context.get("output_ndvi", False)
+    if context.get("dtype") is not None:
+        cube = cube.astype(context["dtype"], copy=False)
+
+    if output_ndvi:
+        nir_band, red_band = context.get("ndvi_bands", NDVI_BANDS)
+        assert nir_band in target_bands and red_band in target_bands, (
+            f"The NDVI bands '{nir_band}' and '{red_band}' must be fused, found target bands '{target_bands}'."
+        )
+        # only fuse the bands needed for the NDVI
+        ndvi_indices = [target_bands.index(nir_band), target_bands.index(red_band)]
+        hr_mosaic_bands = [hr_mosaic_bands[i] for i in ndvi_indices]
+        lr_mosaic_bands = [lr_mosaic_bands[i] for i in ndvi_indices]
+        lr_interpolated_bands = [lr_interpolated_bands[i] for i in ndvi_indices]
+        target_bands = [nir_band, red_band]
 
     fused = fuse(
         cube, hr_mosaic_bands, lr_mosaic_bands, lr_interpolated_bands, target_bands
     )
     if output_ndvi:
-        # TODO band selection breaks if target_bands is set
-        nir = fused.sel(bands="B8A")
-        red = fused.sel(bands="B04")
+        nir = fused.sel(bands=nir_band)
+        red = fused.sel(bands=red_band)
         ndvi = (nir - red) / (nir + red)
         # TODO may break on older version of xarray
         ndvi_formatted = ndvi.expand_dims({"bands": ["ndvi"]}, axis=fused.dims.index("bands"))
@@ -57,24 +88,47 @@ def apply_metadata(metadata: CubeMetadata, context: dict) -> CubeMetadata:
 
 
 def fuse(cube, hr_mosaic_bands, lr_mosaic_bands, lr_interpolated_bands, target_bands):
-    fused_list = [
-        # Pixels where there is no data in either lr_m or lr_p are skipped, to avoid
-        # only adding or only subtracting from the S2 composite, which would result in unusually high or low
-        # (e.g. negative values).
-        xr.where(
-            (cube.sel(bands=lr_m) == 0)
-            | np.isnan(cube.sel(bands=lr_m))
-            | (cube.sel(bands=lr_p) == 0)
-            | np.isnan(cube.sel(bands=lr_p)),
-            cube.sel(bands=hr_m).squeeze(),
-            cube.sel(bands=[hr_m, lr_p]).sum(dim="bands")
-            - cube.sel(bands=lr_m).squeeze(),
-        )
-        for (hr_m, lr_m, lr_p) in zip(
-            hr_mosaic_bands, lr_mosaic_bands, lr_interpolated_bands
-        )
-    ]
+    """
+    Computes ``hr_mosaic + lr_interpolated - lr_mosaic`` for each triplet of bands in one vectorized expression.
+    NaN values in the high resolution mosaic are treated as 0.
 
-    fused = xr.concat(fused_list, dim="bands")
-    fused = fused.assign_coords(bands=target_bands)
-    return fused
+    Pixels where there is no data in either lr_m or lr_p are skipped (the high resolution mosaic is returned), to avoid
+    only adding or only subtracting from the S2 composite, which would result in unusually high or low
+    (e.g. negative values).
+
+    The returned cube has the dimensions of ``cube``, with ``target_bands`` as labels of the ``bands`` dimension.
+    """
+    band_index = cube.indexes["bands"]
+    band_axis = cube.dims.index("bands")
+    # bands first, without a copy
+    data = np.moveaxis(cube.values, band_axis, 0)
+    hr_m = data[_band_selection(band_index.get_indexer(hr_mosaic_bands))]
+    lr_m = data[_band_selection(band_index.get_indexer(lr_mosaic_bands))]
+    lr_p = data[_band_selection(band_index.get_indexer(lr_interpolated_bands))]
+
+    dtype = cube.dtype if np.issubdtype(cube.dtype, np.floating) else np.float64
+    fused = np.empty(hr_m.shape, dtype=dtype)
+    np.copyto(fused, lr_p)
+    np.add(fused, hr_m, out=fused, where=~np.isnan(hr_m))
+    np.subtract(fused, lr_m, out=fused)
+    skip = (lr_m == 0) | np.isnan(lr_m) | (lr_p == 0) | np.isnan(lr_p)
+    np.copyto(fused, hr_m, where=skip)
+
+    coords = {
+        name: coord for name, coord in cube.coords.items() if "bands" not in coord.dims
+    }
+    return xr.DataArray(
+        np.moveaxis(fused, 0, band_axis),
+        dims=cube.dims,
+        coords={**coords, "bands": list(target_bands)},
+    )
+
+
+def _band_selection(indices: np.ndarray) -> slice | np.ndarray:
+    """
+    Selection of the bands at ``indices``, a ``slice`` (selecting a view) if they are consecutive.
+    """
+    assert (indices >= 0).all(), "Band not found in cube"
+    if len(indices) > 0 and (np.diff(indices) == 1).all():
+        return slice(indices[0], indices[-1] + 1)
+    return indices
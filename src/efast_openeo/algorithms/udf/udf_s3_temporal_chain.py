@@ -0,0 +1,81 @@
+import pandas as pd
+import xarray as xr
+from openeo.metadata import CubeMetadata
+
+from efast_openeo.algorithms.udf.udf_common import (
+    INSTRUMENTATION_RECORD_PREFIX,  # noqa: F401
+    _instrumented,
+)
+
+# Name of the UDF in the instrumentation records (the module has no name when run by the backend)
+UDF_NAME = "s3_temporal_chain"
+
+# The UDF called by the chain, inlined when the UDF is shipped as a single file (see ``udf_code``)
+from efast_openeo.algorithms.udf import udf_temporal_interpolation as interpolation_udf
+
+
+# Band marking the Sentinel-2 time stamps, merged into the input cube (see ``s3_temporal_chain``)
+S2_OBSERVATION_BAND = "s2_observation"
+
+
+@_instrumented
+def apply_datacube(cube: xr.DataArray, context: dict) -> xr.DataArray:
+    """
+    Interpolates the smoothed Sentinel-3 composite on a chunk in one pass to the target time series (see
+    ``udf_temporal_interpolation``) and to the Sentinel-2 time stamps.
+
+    The input is the composite merged with the band ``S2_OBSERVATION_BAND``, which is valid (not NaN) on the
+    Sentinel-2 time stamps, so that the time dimension is the union of the composite time series and the
+    Sentinel-2 time stamps. The Sentinel-2 time stamps are taken from the cube instead of the context, because the
+    backend does not resolve process results nested in the UDF context.
+
+    Both results are returned on the union of the two time series: the interpolation to the target time series
+    as the bands suffixed with ``"target_band_name_suffix"``, the interpolation to the Sentinel-2 time stamps as
+    the bands with their original names. Each band group is NaN on the time stamps of the other group.
+
+    ``context`` contains the parameters of the interpolation UDF, the composite time series is the target time
+    series defined by them.
+    Expects ``cube`` to be an array of dimensions (t, bands, y, x).
+
+    If ``"instrumentation"`` is set in ``context``, only the invocation of the chain is recorded, not the steps
+    within it.
+    """
+    # the steps are not instrumented separately, to not count their time twice
+    context = {key: value for key, value in context.items() if key != "instrumentation"}
+
+    s2_labels = get_s2_labels(cube)
+    t_composite = cube.indexes["t"].intersection(
+        pd.DatetimeIndex(interpolation_udf.get_t_target_from_context(context))
+    )
+    composite = cube.sel(t=t_composite).drop_sel(bands=S2_OBSERVATION_BAND)
+
+    target_interpolated = interpolation_udf.apply_datacube(composite, context)
+    # the labels are passed as the complete context, like in ``interpolate_time_series_to_target_labels``
+    s2_interpolated = interpolation_udf.apply_datacube(composite, s2_labels)
+
+    t_union = target_interpolated.indexes["t"].union(s2_interpolated.indexes["t"])
+    chained = xr.concat(
+        [target_interpolated.reindex(t=t_union), s2_interpolated.reindex(t=t_union)],
+        dim="bands",
+    )
+    return chained.transpose("t", "bands", "y", "x")
+
+
+def apply_metadata(metadata: CubeMetadata, context: dict) -> CubeMetadata:
+    # the time dimension (union of the composite time series and the Sentinel-2 time stamps) is unchanged
+    band_suffix = context.get("target_band_name_suffix", "")
+    band_names = [b for b in metadata.band_names if b != S2_OBSERVATION_BAND]
+
+    metadata = metadata.filter_bands(band_names)
+    metadata = metadata.rename_labels(
+        dimension="bands", target=[f"{b}{band_suffix}" for b in band_names] + band_names
+    )
+    return metadata
+
+
+def get_s2_labels(cube: xr.DataArray) -> pd.DatetimeIndex:
+    """
+    Time stamps on which ``S2_OBSERVATION_BAND`` is valid in any pixel of the chunk.
+    """
+    observed = cube.sel(bands=S2_OBSERVATION_BAND).notnull().any(dim=["y", "x"])
+    return cube.indexes["t"][observed.values]
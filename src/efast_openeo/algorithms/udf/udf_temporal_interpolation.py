@@ -1,10 +1,26 @@
+import numpy as np
 import pandas as pd
 import xarray as xr
 from openeo.metadata import CubeMetadata
+from typing import NamedTuple
 
 from datetime import datetime, timezone
 
+from efast_openeo.algorithms.udf.udf_common import (
+    INSTRUMENTATION_RECORD_PREFIX,  # noqa: F401
+    _freeze,
+    _instrumented,
+    _LRUCache,
+)
 
+# Name of the UDF in the instrumentation records (the module has no name when run by the backend)
+UDF_NAME = "temporal_interpolation"
+
+# Number of time axis artifacts (target time series, interpolation weights) kept per worker process
+TIME_AXIS_CACHE_SIZE = 16
+
+
+@_instrumented
 def apply_datacube(cube: xr.DataArray, context) -> xr.DataArray:
     """
     Interpolate cube to the time series passed as context.
@@ -14,7 +30,13 @@ def apply_datacube(cube: xr.DataArray, context) -> xr.DataArray:
     This UDF supports two cases: passing the target time series ``t_target`` as a pd.Datetimeidex
     (this is what happens when chaining with the dimension_labels process) and passing dictionary as a context,
     which defines the time series through the parameters ``temporal_extent`` (left incl, right excl)
-    and ``interval_days``.
+    and ``interval_days``. In the dictionary case, ``dtype`` (e.g. ``"float32"``) optionally sets the data type
+    of the interpolation and the output, and ``skip_nan`` interpolates each pixel between its closest
+    valid (non-NaN) observations instead of propagating NaN values.
+
+    The interpolation is linear, target time steps outside the input time series are NaN (as with ``xr.interp``).
+    The target time series and the interpolation weights only depend on the input time stamps and ``context``,
+    they are cached across chunks processed by the same worker process (see ``time_axis_cache_info``).
 
     Expects ``cube`` to be an array of dimensions (t, bands, y, x)
     """
@@ -22,18 +44,29 @@ def apply_datacube(cube: xr.DataArray, context) -> xr.DataArray:
         f"cube must have a 'bands' dimension, found '{cube.dims}'"
     )
 
-    t_target = get_t_target_from_context(context)
     band_suffix = get_target_band_name_suffix_from_context(context)
+    dtype = get_dtype_from_context(context)
+    if dtype is not None:
+        cube = cube.astype(dtype, copy=False)
 
-    # The Wizard passes the temporal extent as a xr.IndexVariable which cannot be understood by xr.interp
-    if isinstance(t_target, xr.IndexVariable) or isinstance(t_target, xr.DataArray):
-        t_target = t_target.values
-    t_target = pd.to_datetime(t_target)
-
-    if getattr(t_target, "tz", None) is not None:
-        t_target = t_target.tz_localize(None)
-
-    interpolated = cube.interp(t=t_target)
+    weights_dtype = np.result_type(cube.dtype, np.float32)
+    t_target, weights = _TIME_AXIS_CACHE.get(
+        (_freeze(cube.t.values), _freeze(context), weights_dtype.str),
+        lambda: _compute_time_axis(cube.indexes["t"], context, dtype=weights_dtype),
+    )
+    data = np.moveaxis(cube.values, cube.get_axis_num("t"), 0)
+    if get_skip_nan_from_context(context):
+        interpolated_data = interpolate_linear_skip_nan(data, weights)
+    else:
+        interpolated_data = interpolate_linear(data, weights)
+    coords = {
+        name: coord for name, coord in cube.coords.items() if "t" not in coord.dims
+    }
+    interpolated = xr.DataArray(
+        np.moveaxis(interpolated_data, 0, cube.get_axis_num("t")),
+        dims=cube.dims,
+        coords={**coords, "t": t_target},
+    )
     interpolated = interpolated.assign_coords(
         bands=[f"{b}{band_suffix}" for b in interpolated.coords["bands"].values]
     )
@@ -49,11 +82,55 @@ def apply_metadata(metadata: CubeMetadata, context) -> CubeMetadata:
     metadata = metadata.rename_labels(dimension="bands", target=[f"{b}{band_suffix}" for b in metadata.band_names])
     return metadata
 
+
+_TIME_AXIS_CACHE = _LRUCache(TIME_AXIS_CACHE_SIZE)
+
+
+def time_axis_cache_info() -> dict:
+    """
+    Hits, misses and size of the cache of time axis artifacts of this worker process.
+    """
+    return _TIME_AXIS_CACHE.info()
+
+
+def _compute_time_axis(t: pd.DatetimeIndex, context, dtype):
+    """
+    Target time series and interpolation weights for the input time stamps ``t``.
+    The arrays are read-only, as they are shared between chunks.
+    """
+    t_target = get_t_target_from_context(context)
+    # The Wizard passes the temporal extent as a xr.IndexVariable which cannot be understood by xr.interp
+    if isinstance(t_target, xr.IndexVariable) or isinstance(t_target, xr.DataArray):
+        t_target = t_target.values
+    t_target = pd.to_datetime(t_target)
+
+    if getattr(t_target, "tz", None) is not None:
+        t_target = t_target.tz_localize(None)
+
+    weights = compute_interpolation_weights(t, t_target, dtype=dtype)
+    for array in weights:
+        array.flags.writeable = False
+    return t_target, weights
+
+
 def get_target_band_name_suffix_from_context(context):
     if isinstance(context, dict):
         return context.get("target_band_name_suffix", "")
     return ""
 
+
+def get_skip_nan_from_context(context) -> bool:
+    if isinstance(context, dict):
+        return bool(context.get("skip_nan", False))
+    return False
+
+
+def get_dtype_from_context(context) -> np.dtype | None:
+    if isinstance(context, dict) and context.get("dtype") is not None:
+        return np.dtype(context["dtype"])
+    return None
+
+
 def get_t_target_from_context(context):
     if isinstance(context, dict):  # from user parameters
         temporal_extent = context.get("temporal_extent_target")
@@ -75,3 +152,112 @@ def compute_t_target(temporal_extent, interval_days) -> pd.DatetimeIndex:
         inclusive="left",
     )
     return t_target
+
+
+class InterpolationWeights(NamedTuple):
+    """
+    Sparse linear interpolation operator from the input to the target time series: each target time step ``j``
+    is ``(1 - weights[j]) * x[starts[j]] + weights[j] * x[stops[j]]``. ``starts[j] == stops[j]`` if the target time
+    step coincides with an input time step. Target time steps outside the input time series are not ``valid``.
+    """
+
+    t: np.ndarray
+    t_target: np.ndarray
+    starts: np.ndarray
+    stops: np.ndarray
+    weights: np.ndarray
+    valid: np.ndarray
+
+
+def compute_interpolation_weights(
+    t, t_target, dtype=np.float64
+) -> InterpolationWeights:
+    """
+    Compute the linear interpolation operator from the (sorted) time series ``t`` to ``t_target``,
+    two weights per target time step found by ``searchsorted``.
+    """
+    t = pd.to_datetime(t).values.astype("datetime64[ns]").astype(np.int64)
+    t_target = pd.to_datetime(t_target).values.astype("datetime64[ns]").astype(np.int64)
+    assert (np.diff(t) > 0).all(), "The input time series must be sorted"
+
+    # last input time step <= target time step
+    starts = np.searchsorted(t, t_target, side="right") - 1
+    exact = (starts >= 0) & (t[starts.clip(0)] == t_target)
+    stops = np.where(exact, starts, starts + 1)
+    valid = (starts >= 0) & (stops < len(t))
+    starts, stops = starts.clip(0, len(t) - 1), stops.clip(0, len(t) - 1)
+
+    span = t[stops] - t[starts]
+    weights = np.divide(
+        t_target - t[starts], span, out=np.zeros(len(t_target)), where=span > 0
+    )
+    return InterpolationWeights(
+        t, t_target, starts, stops, weights.astype(dtype), valid
+    )
+
+
+def interpolate_linear(data: np.ndarray, weights: InterpolationWeights) -> np.ndarray:
+    """
+    Apply the interpolation operator ``weights`` to ``data`` with the time axis first.
+    NaN values in ``data`` propagate to target time steps interpolated from them.
+    """
+    interpolated = np.empty(
+        (len(weights.t_target), *data.shape[1:]), dtype=weights.weights.dtype
+    )
+    buffer = np.empty(data.shape[1:], dtype=interpolated.dtype)
+    for j, (start, stop, weight, valid) in enumerate(
+        zip(weights.starts, weights.stops, weights.weights, weights.valid)
+    ):
+        if not valid:
+            interpolated[j] = np.nan
+        elif start == stop:
+            interpolated[j] = data[start]
+        else:
+            np.multiply(data[start], 1 - weight, out=interpolated[j])
+            np.multiply(data[stop], weight, out=buffer)
+            interpolated[j] += buffer
+    return interpolated
+
+
+def interpolate_linear_skip_nan(
+    data: np.ndarray, weights: InterpolationWeights
+) -> np.ndarray:
+    """
+    Linear interpolation of ``data`` with the time axis first, interpolating each pixel between its previous and
+    next valid (non-NaN) observations around each target time step. Target time steps before the first or after
+    the last valid observation of a pixel are NaN.
+    """
+    n_t = data.shape[0]
+    flat = data.reshape(n_t, -1)
+    is_valid = ~np.isnan(flat)
+    # values and times of the closest valid observation at or before / at or after each input time step
+    # (NaN values if there is no valid observation before / after)
+    previous_values, next_values = flat.copy(), flat.copy()
+    previous_t = np.broadcast_to(weights.t[:, np.newaxis], flat.shape).copy()
+    next_t = previous_t.copy()
+    for i in range(1, n_t):
+        np.copyto(previous_values[i], previous_values[i - 1], where=~is_valid[i])
+        np.copyto(previous_t[i], previous_t[i - 1], where=~is_valid[i])
+    for i in range(n_t - 2, -1, -1):
+        np.copyto(next_values[i], next_values[i + 1], where=~is_valid[i])
+        np.copyto(next_t[i], next_t[i + 1], where=~is_valid[i])
+
+    interpolated = np.full(
+        (len(weights.t_target), flat.shape[1]), np.nan, dtype=weights.weights.dtype
+    )
+    for j, (start, stop, valid) in enumerate(
+        zip(weights.starts, weights.stops, weights.valid)
+    ):
+        if not valid:
+            continue
+        # a valid observation at the target time step is its own previous and next valid observation
+        span = next_t[stop] - previous_t[start]
+        weight = np.divide(
+            weights.t_target[j] - previous_t[start],
+            span,
+            out=np.zeros(len(span)),
+            where=span > 0,
+        )
+        interpolated[j] = (1 - weight) * previous_values[start]
+        interpolated[j] += weight * next_values[stop]
+    return interpolated.reshape(len(weights.t_target), *data.shape[1:])
@@ -1,14 +1,37 @@
+from collections import deque
+from typing import List, NamedTuple
+
 import numpy as np
 import pandas as pd
 
 import xarray as xr
 from openeo.metadata import CubeMetadata
-from datetime import datetime, timezone
+from openeo.udf import inspect
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from efast_openeo.algorithms.udf.udf_common import (
+    INSTRUMENTATION_RECORD_PREFIX,  # noqa: F401
+    _freeze,
+    _instrumented,
+    _LRUCache,
+)
 
+# Name of the UDF in the instrumentation records (the module has no name when run by the backend)
+UDF_NAME = "temporal_score_aggregate"
 
 EPS = 1e-5
 
+ENGINES = ["numpy", "numba", "sliding_window"]
+
+# Number of time axis artifacts (target time series, temporal scores) kept per worker process
+TIME_AXIS_CACHE_SIZE = 16
+
 
+@_instrumented
 def apply_datacube(cube: xr.DataArray, context: dict) -> xr.DataArray:
     """
     Computes a composite time series. The input time series is converted to the time series passed
@@ -16,6 +39,22 @@ def apply_datacube(cube: xr.DataArray, context: dict) -> xr.DataArray:
     ``t_target``. The inputs are weighted by their temporal distance to the target time step and by the distance to
     cloud score (the ``"distance_score"`` band of the inputs).
 
+    If ``"memory_budget_mb"`` is set in ``context``, the composite is computed sequentially on spatial tiles of the
+    cube, which are sized such that the working memory of a tile does not exceed the budget.
+
+    If ``"dtype"`` is set in ``context`` (e.g. ``"float32"``), the inputs are converted to this data type and the
+    composite is computed and returned in it.
+
+    The composite is computed with the engine given as ``"engine"`` in ``context`` (one of ``ENGINES``, default
+    ``"numpy"``). The ``"numba"`` engine falls back to ``"numpy"`` if numba is not installed.
+    If ``"mosaic_days"`` is set, all engines only consider the inputs within ``"mosaic_days"`` days (centered)
+    around each target time step, otherwise the window is given by ``"temporal_score_truncate"``. The
+    ``"sliding_window"`` engine requires a window. It slides over the time series, keeping only the contributions
+    of the inputs in the current window in memory.
+
+    The target time series and the temporal score only depend on the input time stamps and ``context``, they are
+    cached across chunks processed by the same worker process (see ``time_axis_cache_info``).
+
     Expects ``cube`` to be an array of dimensions (t, bands, y, x)
     """
 
@@ -27,21 +66,113 @@ def apply_datacube(cube: xr.DataArray, context: dict) -> xr.DataArray:
         f"Input cube must have a band 'distance_score' in addition to the input bands. Found bands '{band_names}'"
     )
 
-    sigma_doy = context["sigma_doy"]
-    t_target = get_t_target_from_context(context)
-    temporal_score = compute_temporal_score(cube.t, t_target, sigma_doy)
+    engine = get_engine_from_context(context)
+    truncate = get_truncate_from_context(context)
+    dtype = get_dtype_from_context(context)
+    if dtype is not None:
+        cube = cube.astype(dtype, copy=False)
+    t_target, temporal_score = _TIME_AXIS_CACHE.get(
+        (_freeze(cube.t.values), _freeze(context)),
+        lambda: _compute_time_axis(cube.t, context, dtype=dtype or np.float64),
+    )
     distance_score = cube.sel(bands="distance_score")
     data_bands = cube.sel(bands=[b for b in band_names if b != "distance_score"])
 
-    composite = _compute_combined_score_no_intermediates(
-        distance_score, temporal_score, data_bands
-    )
+    if truncate is None:
+        compute_composite = _compute_combined_score_no_intermediates
+    else:
+        compute_composite = _compute_combined_score_banded
+    if engine == "numba":
+        compute_composite = _compute_combined_score_numba
+    elif engine == "sliding_window":
+        compute_composite = _compute_combined_score_sliding_window
+
+    memory_budget_mb = context.get("memory_budget_mb")
+    if memory_budget_mb is None:
+        composite = compute_composite(distance_score, temporal_score, data_bands)
+    else:
+        composite = _compute_composite_tiled(
+            compute_composite,
+            distance_score,
+            temporal_score,
+            data_bands,
+            n_t_target=len(t_target),
+            memory_budget_mb=memory_budget_mb,
+        )
 
     renamed = composite.rename({"t_target": "t"})
     dims = ("t", "bands", "y", "x")
     return renamed.transpose(*dims)
 
 
+def get_engine_from_context(context: dict) -> str:
+    engine = context.get("engine") or "numpy"
+    assert engine in ENGINES, (
+        f"Unknown composite engine '{engine}', must be one of {ENGINES}"
+    )
+    if engine == "numba" and numba is None:
+        inspect(
+            message="numba is not installed, falling back to the 'numpy' composite engine",
+            level="warning",
+        )
+        engine = "numpy"
+    return engine
+
+
+def get_truncate_from_context(context: dict) -> float | None:
+    """
+    Number of standard deviations at which the temporal score is truncated. This is derived from the window
+    length ``"mosaic_days"`` if it is set, for all engines.
+    """
+    truncate = context.get("temporal_score_truncate")
+    mosaic_days = context.get("mosaic_days")
+    if mosaic_days is not None:
+        truncate = mosaic_days / 2 / context["sigma_doy"]
+    if context.get("engine") == "sliding_window":
+        assert truncate is not None, (
+            "The 'sliding_window' engine requires 'mosaic_days' or 'temporal_score_truncate' to be set"
+        )
+    return truncate
+
+
+def get_dtype_from_context(context) -> np.dtype | None:
+    if isinstance(context, dict) and context.get("dtype") is not None:
+        return np.dtype(context["dtype"])
+    return None
+
+
+_TIME_AXIS_CACHE = _LRUCache(TIME_AXIS_CACHE_SIZE)
+
+
+def time_axis_cache_info() -> dict:
+    """
+    Hits, misses and size of the cache of time axis artifacts of this worker process.
+    """
+    return _TIME_AXIS_CACHE.info()
+
+
+def _compute_time_axis(t, context: dict, dtype):
+    """
+    Target time series and temporal score (dense or banded, depending on ``get_truncate_from_context``) for the
+    input time stamps ``t``. The arrays are read-only, as they are shared between chunks.
+    """
+    t_target = get_t_target_from_context(context)
+    truncate = get_truncate_from_context(context)
+    if truncate is None:
+        temporal_score = compute_temporal_score(
+            t, t_target, context["sigma_doy"], dtype=dtype
+        )
+        temporal_score.values.flags.writeable = False
+    else:
+        temporal_score = compute_banded_temporal_score(
+            t, t_target, context["sigma_doy"], truncate, dtype=dtype
+        )
+        arrays = [temporal_score.starts, temporal_score.stops, *temporal_score.weights]
+        for array in arrays:
+            array.flags.writeable = False
+    return t_target, temporal_score
+
+
 def apply_metadata(metadata: CubeMetadata, context: dict) -> CubeMetadata:
     t_target = get_t_target_from_context(context)
     t_target_str = [d.isoformat() for d in t_target.to_pydatetime()]
@@ -58,7 +189,10 @@ def apply_metadata(metadata: CubeMetadata, context: dict) -> CubeMetadata:
 
 
 def compute_temporal_score(
-    t: pd.DatetimeIndex, t_target: pd.DatetimeIndex, sigma_doy: float
+    t: pd.DatetimeIndex,
+    t_target: pd.DatetimeIndex,
+    sigma_doy: float,
+    dtype=np.float64,
 ) -> xr.DataArray:
     """
     Compute the temporal weight for each input and output time step.
@@ -67,12 +201,15 @@ def compute_temporal_score(
     :param t: time stamps of the input time series
     :param t_target: target time stamps for which the composites are to be computed
     :param sigma_doy: standard deviation of the gaussian window used for temporal weighting
+    :param dtype: data type of the score
     """
     t_values = t.values.astype("datetime64[D]")
     t_target_values = t_target.values.astype("datetime64[D]")
     difference_matrix = t_values[:, np.newaxis] - t_target_values[np.newaxis, :]
 
-    arr = np.exp(-0.5 * np.square(difference_matrix.astype(int)) / np.square(sigma_doy))
+    arr = np.exp(
+        -0.5 * np.square(difference_matrix.astype(int)) / np.square(sigma_doy)
+    ).astype(dtype)
     return xr.DataArray(
         arr,
         coords={"t": t, "t_target": t_target},
@@ -80,6 +217,57 @@ def compute_temporal_score(
     )
 
 
+class BandedTemporalScore(NamedTuple):
+    """
+    Temporal score truncated to the input time steps close to each target time step.
+    For the ``i``-th target time step, only the inputs ``starts[i]:stops[i]`` have a non-zero score,
+    given by ``weights[i]``.
+    """
+
+    t_target: pd.DatetimeIndex
+    starts: np.ndarray
+    stops: np.ndarray
+    weights: List[np.ndarray]
+
+
+def compute_banded_temporal_score(
+    t: pd.DatetimeIndex,
+    t_target: pd.DatetimeIndex,
+    sigma_doy: float,
+    truncate: float,
+    dtype=np.float64,
+) -> BandedTemporalScore:
+    """
+    Compute the temporal weight for each output time step and the input time steps within ``truncate`` standard
+    deviations of it. The weights are the same as the ones computed by ``compute_temporal_score``, but all
+    (effectively zero) weights outside the truncation radius are dropped.
+
+    :param t: time stamps of the input time series, sorted in ascending order
+    :param t_target: target time stamps for which the composites are to be computed
+    :param sigma_doy: standard deviation of the gaussian window used for temporal weighting
+    :param truncate: truncate the gaussian window at this many standard deviations
+    :param dtype: data type of the weights
+    """
+    t_values = t.values.astype("datetime64[D]").astype(int)
+    t_target_values = t_target.values.astype("datetime64[D]").astype(int)
+    assert (np.diff(t_values) >= 0).all(), (
+        "The input time stamps must be sorted in ascending order"
+    )
+
+    radius = truncate * sigma_doy
+    starts = np.searchsorted(t_values, t_target_values - radius, side="left")
+    stops = np.searchsorted(t_values, t_target_values + radius, side="right")
+    weights = [
+        np.exp(
+            -0.5 * np.square(t_values[start:stop] - target) / np.square(sigma_doy)
+        ).astype(dtype)
+        for (start, stop, target) in zip(starts, stops, t_target_values)
+    ]
+    return BandedTemporalScore(
+        t_target=pd.DatetimeIndex(t_target), starts=starts, stops=stops, weights=weights
+    )
+
+
 def compute_combined_score(
     distance_score: xr.DataArray, temporal_score: xr.DataArray
 ) -> xr.DataArray:
@@ -101,106 +289,368 @@ def _compute_combined_score_no_intermediates(
         bands,
         input_core_dims=[["t", "y", "x"], ["t_target", "t"], ["t", "bands", "y", "x"]],
         output_core_dims=[["t_target", "bands", "y", "x"]],
-        vectorize=True,
     )
     return res
 
 
-def _compute_normalized_composite(distance_score, temporal_score, bands, **kwargs):
-    """
-    Compute the combined distance-to-cloud and temporal score and the weighted sum applying the score by pixel and
-    input/target time stamp to generate the composites
-    """
-    score = np.einsum("tyx,Tt->Ttyx", distance_score, temporal_score)
-    # consider pixels as not-observed if the first band has a nan value
-    score_masked = np.where(np.isnan(bands[:, 0, ...]), 0, score)
+def _compute_combined_score_banded(
+    distance_score: xr.DataArray,
+    temporal_score: BandedTemporalScore,
+    bands: xr.DataArray,
+) -> xr.DataArray:
+    res = xr.apply_ufunc(
+        _compute_normalized_composite_banded,
+        distance_score,
+        bands,
+        input_core_dims=[["t", "y", "x"], ["t", "bands", "y", "x"]],
+        output_core_dims=[["t_target", "bands", "y", "x"]],
+        kwargs={"temporal_score": temporal_score},
+    )
+    return res.assign_coords(t_target=temporal_score.t_target)
 
-    normalization_flat = np.sum(score_masked, axis=1)
-    normalization = normalization_flat[:, np.newaxis, ...]
-    score_normalized = score_masked / normalization
 
-    finite_bands = np.where(np.isfinite(bands), bands, 0)
-    weighted_composite = np.einsum(
-        "Ttyx,tbyx->Tbyx", score_normalized, finite_bands
-    )  # original
+def _compute_combined_score_sliding_window(
+    distance_score: xr.DataArray,
+    temporal_score: BandedTemporalScore,
+    bands: xr.DataArray,
+) -> xr.DataArray:
+    res = xr.apply_ufunc(
+        _compute_normalized_composite_sliding_window,
+        distance_score,
+        bands,
+        input_core_dims=[["t", "y", "x"], ["t", "bands", "y", "x"]],
+        output_core_dims=[["t_target", "bands", "y", "x"]],
+        kwargs={"temporal_score": temporal_score},
+    )
+    return res.assign_coords(t_target=temporal_score.t_target)
+
 
-    no_data_mask = (normalization_flat == 0)[:, np.newaxis, ...] | (
-        weighted_composite <= 0
+def _compute_composite_tiled(
+    compute_composite,
+    distance_score: xr.DataArray,
+    temporal_score,
+    bands: xr.DataArray,
+    *,
+    n_t_target: int,
+    memory_budget_mb: float,
+) -> xr.DataArray:
+    """
+    Apply ``compute_composite`` sequentially to spatial tiles of the inputs and write the results into a
+    preallocated output. The tiles are sized such that the intermediate arrays of a tile fit into
+    ``memory_budget_mb`` megabytes, independent of the size of the inputs.
+    """
+    n_t, n_bands = bands.sizes["t"], bands.sizes["bands"]
+    n_y, n_x = bands.sizes["y"], bands.sizes["x"]
+    # masked distance score and weighted bands per input, weighted sum and normalization per target
+    bytes_per_pixel = bands.dtype.itemsize * (
+        2 * n_t * (n_bands + 1) + n_t_target * (n_bands + 1)
     )
-    weighted_composite_masked = np.where(no_data_mask, np.nan, weighted_composite)
-    return weighted_composite_masked
+    max_tile_pixels = max(1, int(memory_budget_mb * 2**20) // bytes_per_pixel)
+
+    coords = {d: bands.coords[d] for d in ["bands", "y", "x"] if d in bands.coords}
+    composite = None
+    for y_slice, x_slice in _spatial_tiles(n_y, n_x, max_tile_pixels):
+        tile = {"y": y_slice, "x": x_slice}
+        tile_composite = compute_composite(
+            distance_score.isel(tile), temporal_score, bands.isel(tile)
+        ).transpose("t_target", "bands", "y", "x")
+        if composite is None:
+            composite = xr.DataArray(
+                np.empty((n_t_target, n_bands, n_y, n_x), dtype=tile_composite.dtype),
+                dims=["t_target", "bands", "y", "x"],
+                coords={"t_target": tile_composite.t_target, **coords},
+            )
+        composite.values[:, :, y_slice, x_slice] = tile_composite.values
+    return composite
+
+
+def _spatial_tiles(n_y: int, n_x: int, max_tile_pixels: int):
+    """
+    Split a ``n_y x n_x`` raster into tiles of at most ``max_tile_pixels`` pixels. Tiles span complete rows if
+    possible, otherwise rows are split into tiles of ``max_tile_pixels`` pixels.
 
+    :return: generator of ``(y_slice, x_slice)`` tuples
+    """
+    tile_rows = max_tile_pixels // n_x
+    if tile_rows > 0:
+        for y_start in range(0, n_y, tile_rows):
+            yield slice(y_start, y_start + tile_rows), slice(0, n_x)
+    else:
+        for y_start in range(n_y):
+            for x_start in range(0, n_x, max_tile_pixels):
+                yield (
+                    slice(y_start, y_start + 1),
+                    slice(x_start, x_start + max_tile_pixels),
+                )
+
+
+def _compute_combined_score_numba(
+    distance_score: xr.DataArray,
+    temporal_score: xr.DataArray | BandedTemporalScore,
+    bands: xr.DataArray,
+) -> xr.DataArray:
+    """
+    Same as ``_compute_combined_score_no_intermediates`` and ``_compute_combined_score_banded`` (depending on the
+    type of ``temporal_score``), computed with the numba kernel ``_composite_kernel``.
+    """
+    t_target = temporal_score.t_target
+    if isinstance(temporal_score, BandedTemporalScore):
+        starts, stops = temporal_score.starts, temporal_score.stops
+        # the weights of all target time stamps, concatenated
+        weights = np.concatenate(temporal_score.weights or [np.empty(0)])
+    else:
+        n_t = temporal_score.sizes["t"]
+        starts = np.zeros(len(t_target), dtype=int)
+        stops = np.full(len(t_target), n_t)
+        weights = np.ravel(temporal_score.transpose("t_target", "t").values)
+    offsets = np.concatenate([[0], np.cumsum(stops - starts)[:-1]]).astype(int)
 
-def compute_t_target(temporal_extent, interval_days) -> pd.DatetimeIndex:
-    t_target = xr.date_range(
-        temporal_extent[0],
-        temporal_extent[1],
-        freq=f"{interval_days}D",
-        inclusive="left",
+    res = xr.apply_ufunc(
+        _compute_normalized_composite_numba,
+        distance_score,
+        bands,
+        input_core_dims=[["t", "y", "x"], ["t", "bands", "y", "x"]],
+        output_core_dims=[["t_target", "bands", "y", "x"]],
+        kwargs={
+            "weights": weights,
+            "offsets": offsets,
+            "starts": starts,
+            "stops": stops,
+        },
     )
-    return t_target
+    return res.assign_coords(t_target=t_target)
 
 
-def apply_datacube_new(cube: xr.DataArray, context: dict) -> xr.DataArray:
-    band_names = cube.get_index("bands")
-    assert "bands" in cube.dims, (
-        f"cube must have a 'bands' dimension, found '{cube.dims}'"
+def _compute_normalized_composite_numba(
+    distance_score, bands, weights, offsets, starts, stops
+):
+    """
+    Same as ``_compute_normalized_composite``, computed pixel by pixel with the numba kernel ``_composite_kernel``.
+    Only the input time stamps ``starts[i]:stops[i]`` contribute to the ``i``-th target time stamp, with the
+    temporal weights ``weights[offsets[i]:offsets[i] + stops[i] - starts[i]]``.
+    """
+    n_t, n_bands, n_y, n_x = bands.shape[-4:]
+    n_t_target = len(starts)
+    batch_shape = np.broadcast_shapes(distance_score.shape[:-3], bands.shape[:-4])
+    distance_score = np.broadcast_to(distance_score, (*batch_shape, n_t, n_y, n_x))
+    bands = np.broadcast_to(bands, (*batch_shape, n_t, n_bands, n_y, n_x))
+
+    # the target time stamps to which each input time stamp contributes (starts and stops are sorted, as the
+    # input and target time stamps are)
+    target_starts = np.searchsorted(stops, np.arange(n_t), side="right")
+    target_stops = np.searchsorted(starts, np.arange(n_t), side="right")
+
+    composite = np.empty(
+        (*batch_shape, n_t_target, n_bands, n_y, n_x),
+        dtype=np.result_type(distance_score, bands, weights),
     )
-    assert "distance_score" in band_names, (
-        f"Input cube must have a band 'distance_score' in addition to the input bands. Found bands '{band_names}'"
+    for index in np.ndindex(*batch_shape):
+        _composite_kernel(
+            distance_score[index],
+            bands[index],
+            weights,
+            offsets,
+            starts,
+            target_starts,
+            target_stops,
+            composite[index],
+        )
+    return composite
+
+
+def _composite_kernel(
+    distance_score,
+    bands,
+    weights,
+    offsets,
+    starts,
+    target_starts,
+    target_stops,
+    composite,
+):
+    """
+    Single pass composite. Walks the input time series once and accumulates the weighted sum and normalization of
+    all target time stamps within ``target_starts[t]:target_stops[t]`` for each input time stamp ``t``, with the
+    temporal weight ``weights[offsets[target] + t - starts[target]]``.
+    Applies the same masking rules as ``_compute_normalized_composite``.
+    Rows of pixels are processed in parallel, only the normalization of the current row is kept in memory.
+    """
+    n_t, n_bands, n_y, n_x = bands.shape
+    n_t_target = composite.shape[0]
+    for y in numba.prange(n_y):
+        normalization = np.zeros((n_t_target, n_x), dtype=composite.dtype)
+        pixel_score = np.empty(n_x, dtype=composite.dtype)
+        composite[:, :, y, :] = 0
+        for t in range(n_t):
+            for x in range(n_x):
+                # consider pixels as not-observed if the first band has a nan value
+                if np.isnan(bands[t, 0, y, x]):
+                    pixel_score[x] = 0
+                else:
+                    pixel_score[x] = distance_score[t, y, x]
+            for target in range(target_starts[t], target_stops[t]):
+                temporal_weight = weights[offsets[target] + t - starts[target]]
+                for x in range(n_x):
+                    normalization[target, x] += temporal_weight * pixel_score[x]
+                for band in range(n_bands):
+                    for x in range(n_x):
+                        value = bands[t, band, y, x]
+                        if not np.isfinite(value):
+                            value = 0
+                        composite[target, band, y, x] += (
+                            temporal_weight * pixel_score[x] * value
+                        )
+        for target in range(n_t_target):
+            for band in range(n_bands):
+                for x in range(n_x):
+                    if normalization[target, x] == 0:
+                        composite[target, band, y, x] = np.nan
+                    else:
+                        value = composite[target, band, y, x] / normalization[target, x]
+                        composite[target, band, y, x] = np.nan if value <= 0 else value
+
+
+if numba is not None:
+    _composite_kernel = numba.njit(parallel=True)(_composite_kernel)
+
+
+def _compute_normalized_composite(distance_score, temporal_score, bands, **kwargs):
+    """
+    Compute the combined distance-to-cloud and temporal score and the weighted sum applying the score by pixel and
+    input/target time stamp to generate the composites.
+
+    The combined score is the product of the temporal score (``t_target x t``) and the per-pixel distance score.
+    The weighted sum and its normalization are therefore computed as two matrix products of the temporal score with
+    the (masked) distance score weighted bands and the (masked) distance score, without materializing the combined
+    score for every target time stamp, input time stamp and pixel.
+
+    ``distance_score`` (``..., t, y, x``) and ``bands`` (``..., t, bands, y, x``) may have any number of leading
+    (broadcastable) dimensions, which are computed in the same matrix products.
+    """
+    n_t, n_bands, n_y, n_x = bands.shape[-4:]
+    n_t_target = temporal_score.shape[0]
+    pixel_score, weighted_bands = _mask_and_weight_inputs(distance_score, bands)
+    batch_shape = pixel_score.shape[:-3]
+
+    normalization = (
+        temporal_score @ pixel_score.reshape(*batch_shape, n_t, n_y * n_x)
+    ).reshape(*batch_shape, n_t_target, n_y, n_x)
+    weighted_sum = (
+        temporal_score @ weighted_bands.reshape(*batch_shape, n_t, n_bands * n_y * n_x)
+    ).reshape(*batch_shape, n_t_target, n_bands, n_y, n_x)
+    return _normalize_composite(weighted_sum, normalization)
+
+
+def _compute_normalized_composite_banded(distance_score, bands, temporal_score):
+    """
+    Same as ``_compute_normalized_composite``, but with a ``BandedTemporalScore``. For each target time stamp, only
+    the input time stamps within the band of the temporal score are contracted.
+    """
+    n_t, n_bands, n_y, n_x = bands.shape[-4:]
+    n_t_target = len(temporal_score.t_target)
+    pixel_score, weighted_bands = _mask_and_weight_inputs(distance_score, bands)
+    batch_shape = pixel_score.shape[:-3]
+    pixel_score = pixel_score.reshape(*batch_shape, n_t, n_y * n_x)
+    weighted_bands = weighted_bands.reshape(*batch_shape, n_t, n_bands * n_y * n_x)
+
+    normalization = np.zeros(
+        (*batch_shape, n_t_target, n_y * n_x), dtype=pixel_score.dtype
     )
-    assert "t_target" in context, (
-        f"The target time dimension 't_target' must be provided in the 'context' dict. Found keys '{context.keys()}' in 'context'."
+    weighted_sum = np.zeros(
+        (*batch_shape, n_t_target, n_bands * n_y * n_x), dtype=weighted_bands.dtype
     )
-
-    t_target = pd.DatetimeIndex(
-        [datetime.fromisoformat(t) for t in context["t_target"]]
+    for i, (start, stop, weights) in enumerate(
+        zip(temporal_score.starts, temporal_score.stops, temporal_score.weights)
+    ):
+        if start == stop:
+            continue
+        normalization[..., i, :] = weights @ pixel_score[..., start:stop, :]
+        weighted_sum[..., i, :] = weights @ weighted_bands[..., start:stop, :]
+
+    return _normalize_composite(
+        weighted_sum.reshape(*batch_shape, n_t_target, n_bands, n_y, n_x),
+        normalization.reshape(*batch_shape, n_t_target, n_y, n_x),
     )
-    sigma_doy = context.get("sigma_doy", 5)
-    temporal_score = compute_temporal_score(cube.t, t_target, sigma_doy)
-    distance_score = cube.sel(bands="distance_score")
-    data_bands = cube.sel(bands=[b for b in band_names if b != "distance_score"])
 
-    composite = _compute_combined_score_ng(distance_score, temporal_score, data_bands)
 
-    renamed = composite.rename({"t_target": "t"})
-    dims = ("t", "bands", "y", "x")
-    return renamed.transpose(*dims)
+def _compute_normalized_composite_sliding_window(
+    distance_score, bands, temporal_score: BandedTemporalScore
+):
+    """
+    Same as ``_compute_normalized_composite_banded``, but sliding a window over the input time series: the masked
+    and weighted inputs are computed when they enter the window of a target time stamp and dropped when they leave
+    it, so only the inputs of one window are kept in memory instead of the whole series.
+    """
+    n_t, n_bands, n_y, n_x = bands.shape[-4:]
+    n_t_target = len(temporal_score.t_target)
+    batch_shape = np.broadcast_shapes(distance_score.shape[:-3], bands.shape[:-4])
+    dtype = np.result_type(distance_score, bands)
+    assert (np.diff(temporal_score.starts) >= 0).all() and (
+        np.diff(temporal_score.stops) >= 0
+    ).all(), "The target time stamps must be sorted in ascending order"
+
+    normalization = np.zeros((*batch_shape, n_t_target, n_y, n_x), dtype=dtype)
+    weighted_sum = np.zeros((*batch_shape, n_t_target, n_bands, n_y, n_x), dtype=dtype)
+    # (input index, masked distance score, weighted bands) of the inputs in the current window
+    window = deque()
+    next_input = 0
+    for i, (start, stop, weights) in enumerate(
+        zip(temporal_score.starts, temporal_score.stops, temporal_score.weights)
+    ):
+        while window and window[0][0] < start:
+            window.popleft()
+        next_input = max(next_input, start)
+        while next_input < stop:
+            window.append(
+                (
+                    next_input,
+                    *_mask_and_weight_inputs(
+                        distance_score[..., next_input, :, :],
+                        bands[..., next_input, :, :, :],
+                    ),
+                )
+            )
+            next_input += 1
+        for input_index, pixel_score, weighted_bands in window:
+            weight = weights[input_index - start]
+            normalization[..., i, :, :] += weight * pixel_score
+            weighted_sum[..., i, :, :, :] += weight * weighted_bands
+
+    return _normalize_composite(weighted_sum, normalization)
+
+
+def _mask_and_weight_inputs(distance_score, bands):
+    """
+    Mask the distance score of input pixels which are not observed (nan value in the first band) and weight
+    the (finite) input bands by the masked distance score.
+    """
+    pixel_score = np.where(np.isnan(bands[..., 0, :, :]), 0, distance_score)
+    weighted_bands = np.where(np.isfinite(bands), bands, 0)
+    weighted_bands *= pixel_score[..., np.newaxis, :, :]
+    return pixel_score, weighted_bands
 
 
-def _compute_combined_score_ng(distance_score, temporal_score, bands):
-    mosaic_days = 100
-    composites = {}
+def _normalize_composite(weighted_sum, normalization):
+    """
+    Normalize the weighted sum of inputs (in place) and mask pixels without any observation or with
+    a non-positive composite value.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weighted_sum /= normalization[..., np.newaxis, :, :]
 
-    # TODO convert to "rolling"?
-    for middle_date in temporal_score.t_target:
-        window_start = middle_date - pd.Timedelta(days=mosaic_days / 2)
-        window_end = middle_date + pd.Timedelta(days=mosaic_days / 2)
+    no_data_mask = (normalization == 0)[..., np.newaxis, :, :] | (weighted_sum <= 0)
+    weighted_sum[no_data_mask] = np.nan
+    return weighted_sum
 
-        windowed_bands = bands.sel(t=slice(window_start, window_end))
-        windowed_bands = xr.where(
-            np.abs(windowed_bands.mean(dim="t")) < 5, windowed_bands, np.nan
-        )
-        windowed_distance_score = distance_score.sel(t=slice(window_start, window_end))
-        windowed_temporal_score = temporal_score.sel(
-            t=slice(window_start, window_end), t_target=middle_date
-        )
 
-        score = windowed_distance_score * windowed_temporal_score
-        score_nan_masked = xr.where(np.isnan(windowed_bands.isel(bands=0)), 0, score)
-        # score_nan_masked = score
-        normalizing_coefficient = score_nan_masked.sum(dim="t") + 1e-5
-        normalized_score = score_nan_masked / normalizing_coefficient
-
-        weighted_bands = normalized_score * windowed_bands
-        composite = weighted_bands.sum(skipna=True, dim="t")
-        composite = xr.where(normalized_score.sum(dim="t") == 0, np.nan, composite)
-        composites[pd.to_datetime(middle_date.item()).strftime("%Y-%m-%d")] = composite
-    composite_da = xr.concat(
-        [composites[t_target] for t_target in composites],
-        dim=xr.IndexVariable("t_target", list(composites.keys())),
-    )
-    return composite_da
+def compute_t_target(temporal_extent, interval_days) -> pd.DatetimeIndex:
+    t_target = xr.date_range(
+        temporal_extent[0],
+        temporal_extent[1],
+        freq=f"{interval_days}D",
+        inclusive="left",
+    )
+    return t_target
 
 
 def get_t_target_from_context(context):
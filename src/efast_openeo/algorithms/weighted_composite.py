@@ -4,6 +4,8 @@ from typing import List
 import openeo
 from openeo.api.process import Parameter
 
+from efast_openeo.algorithms.udf import udf_code
+
 UDF_TEMPORAL_SCORE = importlib.resources.files("efast_openeo.algorithms.udf").joinpath(
     "udf_temporal_score_aggregate.py"
 )
@@ -15,6 +17,12 @@ def compute_weighted_composite(
     temporal_extent_target: List[str] | Parameter | None,
     interval_days: int,
     sigma_doy: float,
+    temporal_score_truncate: float | None = None,
+    memory_budget_mb: float | None = None,
+    engine: str = "numpy",
+    mosaic_days: int | None = None,
+    dtype: str | None = None,
+    instrumentation: dict | None = None,
 ):
     """
     Computes a score weighted by the distance to the target date from the distance to cloud score.
@@ -22,16 +30,43 @@ def compute_weighted_composite(
     of ``temporal_extent_target`` (inclusive) up to the upper limit of ``temporal_extent_target`` (exclusive).
     If ``temporal_extent_target`` is not set, ``temporal_extent_input`` is used. One of these two parameters
     must be set.
+
+    If ``temporal_score_truncate`` is set, the gaussian temporal window is truncated at ``temporal_score_truncate``
+    standard deviations (``sigma_doy``) and only input time steps within the window of a target time step
+    contribute to its composite.
+
+    If ``memory_budget_mb`` is set, each chunk is processed in spatial tiles whose working memory is
+    bounded by ``memory_budget_mb`` megabytes.
+
+    ``engine`` selects the implementation used by the UDF, either ``"numpy"`` (matrix products), ``"numba"``
+    (compiled single pass per pixel) or ``"sliding_window"``. ``"numba"`` falls back to ``"numpy"`` if numba is
+    not available in the UDF runtime. ``"sliding_window"`` keeps only the inputs of the current window in memory
+    and requires ``mosaic_days`` or ``temporal_score_truncate``. If ``mosaic_days`` is set, all engines consider
+    only the input time steps within ``mosaic_days`` days (centered) around each target time step, otherwise the
+    window is given by ``temporal_score_truncate``.
+
+    If ``dtype`` is set (e.g. ``"float32"``), the composites are computed and returned in this data type.
+
+    If ``instrumentation`` is set, the UDF invocations are instrumented (see ``efast_openeo.instrumentation``).
     """
-    udf = openeo.UDF.from_file(
-        UDF_TEMPORAL_SCORE, context={"from_parameter": "context"}, runtime="Python"
+    udf = openeo.UDF(
+        code=udf_code(UDF_TEMPORAL_SCORE),
+        context={"from_parameter": "context"},
+        runtime="Python",
     )  # , version="3")
     context = dict(
         temporal_extent_input=temporal_extent,
         temporal_extent_target=temporal_extent_target,
         interval_days=interval_days,
         sigma_doy=sigma_doy,
+        temporal_score_truncate=temporal_score_truncate,
+        memory_budget_mb=memory_budget_mb,
+        engine=engine,
+        mosaic_days=mosaic_days,
+        dtype=dtype,
     )
+    if instrumentation is not None:
+        context["instrumentation"] = instrumentation
     weighted = cube_with_distance_score.apply_dimension(
         process=udf, dimension="t", context=context
     )
@@ -0,0 +1,154 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+
+import openeo
+
+from efast_openeo.util.log import logger
+
+# Expensive stages of ``efast_openeo`` which can be checkpointed, in the order of the chain
+CHECKPOINT_STAGES = (
+    "s3_distance_score",
+    "s3_composite_data_bands_smoothed",
+    "s3_temporal_chain",
+    "s2_distance_score",
+    "s2_s3_aggregate",
+)
+DEFAULT_CHECKPOINT_STAGES = (
+    "s3_composite_data_bands_smoothed",
+    "s3_temporal_chain",
+    "s2_s3_aggregate",
+)
+
+
+def content_hash(content: dict) -> str:
+    """
+    SHA-256 hash of the canonical JSON representation (sorted keys, no whitespace) of ``content``.
+    """
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def stable_flat_graph(cube, stac_urls: dict[str, str] | None = None) -> dict:
+    """
+    Flat process graph of ``cube`` (a ``DataCube`` or an ``openeo.MultiResult``), with the ``load_stac`` URLs in
+    ``stac_urls`` replaced by a stable identifier. The URLs of job results may be signed, and differ between runs
+    loading the same results.
+    """
+    graph = cube.flat_graph()
+    for node in graph.values():
+        url = node["arguments"].get("url")
+        if node["process_id"] == "load_stac" and url in (stac_urls or {}):
+            node["arguments"] = dict(node["arguments"], url=stac_urls[url])
+    return graph
+
+
+def checkpoint_key(
+    cube: openeo.DataCube,
+    stage: str,
+    parameters: dict | None = None,
+    stac_urls: dict[str, str] | None = None,
+) -> str:
+    """
+    Content hash of the graph segment computing ``cube`` (its flat process graph, which includes the parameters of
+    all processes and UDF contexts), the name of the stage and additional ``parameters``.
+
+    :param stac_urls: ``load_stac`` URLs replaced by a stable identifier in the hashed graph (see
+        ``stable_flat_graph``)
+    """
+    graph = stable_flat_graph(cube, stac_urls)
+    return content_hash(dict(stage=stage, graph=graph, parameters=parameters or {}))
+
+
+class StageCheckpoints:
+    """
+    Checkpoints of expensive stages of ``efast_openeo``, persisted as the results of batch jobs.
+
+    The first time a stage is checkpointed, its graph segment is executed as a batch job (blocking, as
+    ``save_intermediate`` in asynchronous mode) and the job is recorded in the index file under the key of the
+    segment (see ``checkpoint_key``). The chain continues from the job results, loaded with ``load_stac``. Later runs
+    computing the same segment re-enter the graph with ``load_stac`` on the recorded job, so that a run which failed
+    in a later stage (e.g. fusion) does not recompute the stages before. The keys of later stages include the
+    ``load_stac`` nodes of the earlier checkpoints, so that changing an earlier stage invalidates all later ones.
+
+    :param connection: connection executing the checkpoint jobs and loading their results
+    :param index_path: JSON file recording the checkpoint jobs
+    :param stages: names of the stages to checkpoint (see ``CHECKPOINT_STAGES``)
+    :param file_format: file format of the checkpoint results
+    :param parameters: additional parameters included in the keys, e.g. the backend URL
+    """
+
+    def __init__(
+        self,
+        connection: openeo.Connection,
+        index_path: str | Path,
+        stages: Iterable[str] = DEFAULT_CHECKPOINT_STAGES,
+        *,
+        file_format: str = "GTiff",
+        parameters: dict | None = None,
+    ):
+        stages = set(stages)
+        unknown = stages - set(CHECKPOINT_STAGES)
+        if unknown:
+            raise ValueError(
+                f"Unknown checkpoint stages {sorted(unknown)}, expected a subset of {CHECKPOINT_STAGES}"
+            )
+        self.connection = connection
+        self.index_path = Path(index_path)
+        self.stages = stages
+        self.file_format = file_format
+        self.parameters = dict(parameters or {}, file_format=file_format)
+        # URLs of the loaded checkpoints, by which they are identified in the keys of later stages
+        self.stac_urls: dict[str, str] = {}
+
+    def read_index(self) -> dict[str, dict]:
+        if not self.index_path.exists():
+            return {}
+        return json.loads(self.index_path.read_text())
+
+    def _record(self, key: str, entry: dict):
+        index = self.read_index()
+        index[key] = entry
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self.index_path.write_text(json.dumps(index, indent=2))
+
+    def checkpoint(self, cube: openeo.DataCube, stage: str) -> openeo.DataCube:
+        """
+        Continue the chain from the checkpoint of ``stage``, which is created if it does not exist yet.
+
+        :return: ``cube``, if ``stage`` is not checkpointed, otherwise the results of the checkpoint job
+            loaded with ``load_stac``
+        """
+        if stage not in self.stages:
+            return cube
+
+        key = checkpoint_key(cube, stage, self.parameters, self.stac_urls)
+        entry = self.read_index().get(key)
+        if entry is None:
+            bands = (
+                cube.metadata.band_names
+                if cube.metadata is not None and cube.metadata.has_band_dimension()
+                else None
+            )
+            logger.info(f"Execute batch: checkpoint '{stage}' ({key[:12]})")
+            job = cube.save_result(format=self.file_format).execute_batch(
+                title=f"EFAST checkpoint {stage}"
+            )
+            entry = dict(
+                stage=stage,
+                job_id=job.job_id,
+                bands=bands,
+                created=datetime.now(timezone.utc).isoformat(),
+            )
+            self._record(key, entry)
+        else:
+            logger.info(
+                f"Resuming from checkpoint '{stage}' ({key[:12]}), job '{entry['job_id']}'"
+            )
+        loaded = self.connection.load_stac_from_job(
+            entry["job_id"], bands=entry.get("bands")
+        )
+        self.stac_urls[loaded.result_node().arguments["url"]] = f"checkpoint:{key}"
+        return loaded
@@ -33,6 +33,10 @@ S3_COLLECTION = "SENTINEL3_SYN_L2_SYN"
 S2_FLAG_BAND = "SCL"
 S3_FLAG_BAND = "CLOUD_flags"
 
+# Fused bands from which the NDVI is computed
+NDVI_NIR_BAND = "B8A"
+NDVI_RED_BAND = "B04"
+
 S2_TEMPORAL_SCORE_STDDEV = 20
 S3_TEMPORAL_SCORE_STDDEV = 10
 
@@ -1,19 +1,27 @@
 from pathlib import Path
 from typing import List
 
-from efast_openeo.algorithms.fusion import fusion
+from efast_openeo.algorithms.fusion import fusion, select_ndvi_bands
+from efast_openeo.algorithms.s3_temporal_chain import (
+    s3_temporal_chain,
+    select_s2_time_series,
+    select_target_time_series,
+)
 from efast_openeo.algorithms.temporal_interpolation import (
     interpolate_time_series_to_target_extent,
     interpolate_time_series_to_target_labels,
 )
 from efast_openeo.algorithms.weighted_composite import compute_weighted_composite
+from efast_openeo.checkpoint import StageCheckpoints
 from efast_openeo.constants import S3_INTERPOLATION_BAND_NAME_SUFFIX
+from efast_openeo.instrumentation import instrumentation_context
 from efast_openeo.smoothing import smoothing_kernel
 from efast_openeo.util.log import logger
 from efast_openeo import constants
 from efast_openeo.data_loading import load_and_scale
 from efast_openeo.algorithms.distance_to_cloud import (
     distance_to_cloud,
+    distance_score_to_cloud,
     compute_cloud_mask_s3,
     compute_cloud_mask_s2,
     compute_distance_score,
@@ -72,6 +80,97 @@ def save_intermediate(
     return cube
 
 
+class IntermediateRegistry:
+    """
+    Collects the intermediate results of a run, so that all of them are computed in a single batch job.
+
+    In synchronous mode, intermediates are downloaded right away (see ``save_intermediate``). In asynchronous mode,
+    each intermediate is registered as an additional ``save_result`` leaf, and ``result`` combines them with the
+    final result into a single process graph (``openeo.MultiResult``). Executing this graph as one batch job
+    computes each stage of the chain once, instead of once per intermediate and once for the final result.
+    The results are named after the intermediates (``filename_prefix`` option of ``save_result``).
+
+    If ``collect`` is not set, asynchronous intermediates are executed as separate batch jobs when they are saved
+    (the behaviour of ``save_intermediate``).
+
+    :param out_dir: directory where intermediate results are downloaded in synchronous mode
+    :param file_format: file format of the intermediate results
+    :param synchronous: whether intermediates are downloaded directly or saved by the batch job
+    :param to_skip: names of the intermediate results which are not saved
+    :param skip_all: whether to skip all intermediate results
+    :param collect: whether to collect the asynchronous intermediates as ``save_result`` leaves
+    """
+
+    def __init__(
+        self,
+        out_dir: str | Path,
+        file_format: str,
+        synchronous: bool,
+        *,
+        to_skip: list | set | None = None,
+        skip_all: bool = False,
+        collect: bool = True,
+    ):
+        self.out_dir = out_dir
+        self.file_format = file_format
+        self.synchronous = synchronous
+        self.to_skip = set(to_skip or [])
+        self.skip_all = skip_all
+        self.collect = collect
+        self.save_results: dict[str, openeo.DataCube] = {}
+        # names of the intermediates which are saved (not skipped), in the order of the chain
+        self.saved: List[str] = []
+
+    def skips(self, name: str) -> bool:
+        return self.skip_all or name in self.to_skip
+
+    def save(self, cube, name: str):
+        """
+        Save the intermediate result ``cube`` as ``name``, unless it is skipped.
+
+        :return: the unmodified cube
+        """
+        if not self.skips(name):
+            self.saved.append(name)
+        if self.synchronous or not self.collect or self.skips(name):
+            return save_intermediate(
+                cube,
+                name,
+                out_dir=self.out_dir,
+                file_format=self.file_format,
+                synchronous=self.synchronous,
+                to_skip=self.to_skip,
+                skip_all=self.skip_all,
+            )
+        logger.info(f"Adding '{name}' to results (async)")
+        self.save_results[name] = cube.save_result(
+            format=self.file_format, options={"filename_prefix": name}
+        )
+        return cube
+
+    def result(
+        self,
+        cube: openeo.DataCube,
+        name: str = "fused",
+        connection: openeo.Connection | None = None,
+    ):
+        """
+        The final result ``cube`` (saved as ``name``) together with the collected intermediate results.
+
+        :param connection: connection executing the results, if the cubes are not bound to one
+        :return: the ``save_result`` of ``cube`` if no intermediates were collected, otherwise an
+            ``openeo.MultiResult`` of all ``save_result`` leaves. Both are executed with ``execute_batch``.
+        """
+        final = cube.save_result(
+            format=self.file_format, options={"filename_prefix": name}
+        )
+        if not self.save_results:
+            return final
+        return openeo.MultiResult(
+            [final, *self.save_results.values()], connection=connection
+        )
+
+
 def efast_openeo(
     connection: openeo.Connection,
     *,
@@ -91,6 +190,17 @@ def efast_openeo(
     interval_days: int,
     temporal_score_stddev: float | Parameter,
     output_ndvi: bool,
+    temporal_score_truncate: float | None = None,
+    composite_memory_budget_mb: float | None = None,
+    composite_engine: str = "numpy",
+    composite_mosaic_days: int | None = None,
+    distance_to_cloud_chunk_days: int = 1,
+    use_s3_temporal_chain: bool = False,
+    dtype: str | None = None,
+    instrument_udfs: bool = False,
+    udf_profile_dir: str | None = None,
+    intermediates: IntermediateRegistry | None = None,
+    checkpoints: StageCheckpoints | None = None,
 ) -> openeo.DataCube:
     """
     Main logic for the EFAST [1] Sentinel-2 / Sentinel-3 Fusion implemented as an OpenEO process graph.
@@ -122,6 +232,8 @@ def efast_openeo(
          :param s3_data_bands: Sentinel-3 SYN L2 SYN bands (names follow the SENTINEL3_SYN_L2_SYN collection).
          :param s2_data_bands: Sentinel-2 L2A bands (names follow the SENTINEL2_L2A collection).
          :param fused_band_names: Band names of the output (correspond to the sentinel-2 band names)
+         :param output_ndvi: Whether to output the NDVI instead of the fused bands. If the bands are given as lists,
+            only the bands needed for the NDVI are loaded and fused.
          :param output_dir: directory where to save intermediate results, if ``synchronous`` and ``save_intermediates``
             are set.
          :param save_intermediates: Whether to save any intermediate results
@@ -137,13 +249,82 @@ def efast_openeo(
              ``temporal_extent``. Should be entirely contained in ``temporal_extent``.
         :param interval_days: Interval at which to generate fused composites. This parameter also determines the
             interval of Sentinel-3 composites used in the computation.
+        :param temporal_score_truncate: If set, the gaussian windows used to temporally weigh observations in the
+            composites are truncated at this many standard deviations. Observations outside the window of a
+            target time step are not considered for its composite, which reduces the computational cost for long
+            time series.
+        :param composite_memory_budget_mb: If set, the composite UDFs process each chunk in spatial tiles, such that
+            the working memory of a tile does not exceed this number of megabytes.
+        :param composite_engine: Implementation of the composite UDFs, ``"numpy"``, ``"numba"`` or
+            ``"sliding_window"``.
+        :param composite_mosaic_days: Length (days) of the window around each target time step considered by the
+            composite engines. If not set, the window is given by ``temporal_score_truncate``.
+        :param distance_to_cloud_chunk_days: Number of days processed by one invocation of the distance to cloud UDF.
+        :param use_s3_temporal_chain: Compute the interpolation of the smoothed S3 composites to the target time
+            series and to the S2 time stamps in a single UDF (see ``s3_temporal_chain``). Requires lists (not
+            process parameters) for the temporal extents.
+        :param dtype: Data type (e.g. ``"float32"``) in which the UDFs (distance to cloud, composites, interpolation
+            and fusion) compute and return their chunks. If not set, distances are computed as ``float64`` and the
+            other UDFs follow the data type of their inputs.
+        :param instrument_udfs: Log the wall time, the input and output shapes and data types and the peak memory of
+            every UDF invocation, labelled with the stage of the chain (see ``efast_openeo.instrumentation``).
+            The interpolation to the Sentinel-2 time stamps (outside of the S3 temporal chain) is not instrumented,
+            because its context is the time series itself.
+        :param udf_profile_dir: If set (with ``instrument_udfs``), every UDF invocation is profiled with cProfile and
+            the stats are dumped to this directory on the worker.
+        :param intermediates: Registry collecting the intermediate results (see ``IntermediateRegistry``), which
+            replaces ``output_dir``, ``save_intermediates``, ``synchronous``, ``skip_intermediates`` and
+            ``file_format``. Pass a registry to save all intermediates of an asynchronous run with a single batch
+            job (``intermediates.result(fused).execute_batch()``). If not set, a registry is created from these
+            parameters, which executes asynchronous intermediates as separate batch jobs.
+        :param checkpoints: If set, the stages selected in ``checkpoints`` are persisted as batch job results, or
+            loaded with ``load_stac`` from the results of an earlier run computing the same graph segment (see
+            ``StageCheckpoints``). Intermediates can only be saved after the last checkpointed stage, a
+            ``ValueError`` is raised otherwise.
 
         :returns: Datacube with time series defined by the borders [incl, excl) ``termporal_extent_composites`` and step
          ``interval_days``, ``fused_band_names`` bands on S2 resolution.
     """
-    skip_all_intermediates = not save_intermediates
+    if intermediates is None:
+        intermediates = IntermediateRegistry(
+            output_dir,
+            file_format,
+            synchronous,
+            to_skip=skip_intermediates,
+            skip_all=not save_intermediates,
+            collect=False,
+        )
+
+    def checkpoint(cube, stage: str):
+        if checkpoints is None:
+            return cube
+        if stage in checkpoints.stages and intermediates.saved:
+            # the intermediates are not part of the checkpoint, every run resuming from it would recompute them
+            # (from the loaded collections)
+            raise ValueError(
+                f"The intermediates {intermediates.saved} are saved before the checkpointed stage '{stage}', "
+                "skip them or do not checkpoint the stage"
+            )
+        return checkpoints.checkpoint(cube, stage)
+
+    def instrumentation(stage: str) -> dict | None:
+        if not instrument_udfs:
+            return None
+        return instrumentation_context(stage, profile_dir=udf_profile_dir)
+
     max_distance_to_cloud_s3_px = max_distance_to_cloud_m / constants.S3_RESOLUTION_M
 
+    if output_ndvi is True and all(
+        isinstance(bands, list)
+        for bands in (s3_data_bands, s2_data_bands, fused_band_names or [])
+    ):
+        s2_data_bands, s3_data_bands, fused_band_names = select_ndvi_bands(
+            s2_data_bands, s3_data_bands, fused_band_names
+        )
+        logger.info(
+            f"Only loading the bands needed for the NDVI: {s2_data_bands=}, {s3_data_bands=}"
+        )
+
     # Separate ``load_collection`` calls must be used (not filter_bands) because of a backend bug
     # https://forum.dataspace.copernicus.eu/t/combination-of-apply-neighborhood-and-merge-cubes-leads-to-additional-labels-in-the-time-dimension/4189/3
     s3_flags = connection.load_collection(
@@ -186,16 +367,7 @@ def efast_openeo(
         temporal_extent=temporal_extent,
         bands=s2_data_bands,
     )
-    # TODO collect intermediates in a dict and run save_intermediates at the end (also, avoid repeating the parameters)
-    s2_bands = save_intermediate(
-        s2_bands,
-        "s2_bands",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
+    s2_bands = intermediates.save(s2_bands, "s2_bands")
 
     # s3 composites
     overlap_factor = 10
@@ -207,226 +379,188 @@ def efast_openeo(
     logger.info(f"Setting {s3_dtc_patch_length_px=} and {s3_dtc_overlap_length_px=}")
 
     s3_cloud_mask = s3_bands.band(0).apply(lambda x: processes.is_nodata(x))
-    s3_cloud_mask = save_intermediate(
-        s3_cloud_mask,
-        "s3_cloud_mask",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
-
-    s3_distance_to_cloud = distance_to_cloud(
-        s3_cloud_mask,
-        image_size_pixels=s3_dtc_patch_length_px,
-        max_distance_pixels=s3_dtc_overlap_length_px,
-        pixel_size_native_units=constants.S3_RESOLUTION_DEG,
-    )
-    s3_distance_to_cloud = save_intermediate(
-        s3_distance_to_cloud,
-        "s3_distance_to_cloud",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
-    s3_distance_score = compute_distance_score(
-        s3_distance_to_cloud, max_distance_to_cloud_s3_px
-    )
-    s3_distance_score = save_intermediate(
-        s3_distance_score,
-        "s3_distance_score",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
+    s3_cloud_mask = intermediates.save(s3_cloud_mask, "s3_cloud_mask")
+
+    if intermediates.skips("s3_distance_to_cloud"):
+        # The distance itself is not needed, compute the distance score in the distance to cloud UDF
+        s3_distance_score = distance_score_to_cloud(
+            s3_cloud_mask,
+            image_size_pixels=s3_dtc_patch_length_px,
+            max_distance_pixels=s3_dtc_overlap_length_px,
+            max_distance_score_pixels=max_distance_to_cloud_s3_px,
+            chunk_days=distance_to_cloud_chunk_days,
+            dtype=dtype,
+            instrumentation=instrumentation("s3_distance_score"),
+        )
+    else:
+        s3_distance_to_cloud = distance_to_cloud(
+            s3_cloud_mask,
+            image_size_pixels=s3_dtc_patch_length_px,
+            max_distance_pixels=s3_dtc_overlap_length_px,
+            pixel_size_native_units=constants.S3_RESOLUTION_DEG,
+            # Not bounded (``distance_bound_pixels``), because the distance is saved as an intermediate, which
+            # would contain ``inf`` beyond the bound
+            chunk_days=distance_to_cloud_chunk_days,
+            dtype=dtype,
+            instrumentation=instrumentation("s3_distance_to_cloud"),
+        )
+        s3_distance_to_cloud = intermediates.save(
+            s3_distance_to_cloud, "s3_distance_to_cloud"
+        )
+        s3_distance_score = compute_distance_score(
+            s3_distance_to_cloud, max_distance_to_cloud_s3_px
+        )
+    s3_distance_score = checkpoint(s3_distance_score, "s3_distance_score")
+    s3_distance_score = intermediates.save(s3_distance_score, "s3_distance_score")
 
     s3_bands_and_distance_score = s3_bands.merge_cubes(s3_distance_score)
-    s3_bands_and_distance_score = save_intermediate(
-        s3_bands_and_distance_score,
-        "s3_bands_and_distance_score",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
-    s3_composite = compute_weighted_composite(
-        s3_bands_and_distance_score,
-        temporal_extent=temporal_extent,
-        temporal_extent_target=temporal_extent_target,
-        interval_days=interval_days,
-        sigma_doy=constants.S3_TEMPORAL_SCORE_STDDEV,
-    )
-    #s3_composite_data_bands = s3_composite.filter_bands(s3_bands.dimension_labels("bands"))
-    s3_composite_data_bands = s3_composite.filter_labels(
-        dimension="bands",
-        condition= lambda b: b != "distance_score",
-    )
-    s3_composite_data_bands = save_intermediate(
-        s3_composite_data_bands,
-        "s3_composite_data_bands",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
-
-    s3_composite_data_bands_smoothed = s3_composite_data_bands.apply_kernel(
-        kernel=smoothing_kernel()
-    )
-    s3_composite_data_bands_smoothed = save_intermediate(
-        s3_composite_data_bands_smoothed,
-        "s3_composite_data_bands_smoothed",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
+    s3_bands_and_distance_score = intermediates.save(
+        s3_bands_and_distance_score, "s3_bands_and_distance_score"
+    )
+    if use_s3_temporal_chain:
+        # composite and smoothing, followed by both interpolations in a single UDF
+        s3_chain = s3_temporal_chain(
+            s3_bands_and_distance_score,
+            s2_cube=s2_flags,
+            temporal_extent=temporal_extent,
+            temporal_extent_target=temporal_extent_target,
+            interval_days=interval_days,
+            sigma_doy=constants.S3_TEMPORAL_SCORE_STDDEV,
+            smoothing_kernel=smoothing_kernel(),
+            target_band_name_suffix=S3_INTERPOLATION_BAND_NAME_SUFFIX,
+            temporal_score_truncate=temporal_score_truncate,
+            memory_budget_mb=composite_memory_budget_mb,
+            engine=composite_engine,
+            mosaic_days=composite_mosaic_days,
+            dtype=dtype,
+            instrumentation=instrumentation("s3_temporal_chain"),
+        )
+        s3_chain = checkpoint(s3_chain, "s3_temporal_chain")
+        s3_composite_target_interp = select_target_time_series(
+            s3_chain,
+            band_names=[
+                f"{b}{S3_INTERPOLATION_BAND_NAME_SUFFIX}" for b in s3_data_bands
+            ],
+            temporal_extent=temporal_extent,
+            temporal_extent_target=temporal_extent_target,
+            interval_days=interval_days,
+        )
+        # restricted to the S2 time stamps, the target time stamps would add empty time steps to the S2 composites
+        s3_composite_s2_interp = select_s2_time_series(
+            s3_chain, band_names=s3_data_bands, s2_cube=s2_flags
+        )
+    else:
+        s3_composite = compute_weighted_composite(
+            s3_bands_and_distance_score,
+            temporal_extent=temporal_extent,
+            temporal_extent_target=temporal_extent_target,
+            interval_days=interval_days,
+            sigma_doy=constants.S3_TEMPORAL_SCORE_STDDEV,
+            temporal_score_truncate=temporal_score_truncate,
+            memory_budget_mb=composite_memory_budget_mb,
+            engine=composite_engine,
+            mosaic_days=composite_mosaic_days,
+            dtype=dtype,
+            instrumentation=instrumentation("s3_composite"),
+        )
+        #s3_composite_data_bands = s3_composite.filter_bands(s3_bands.dimension_labels("bands"))
+        s3_composite_data_bands = s3_composite.filter_labels(
+            dimension="bands",
+            condition= lambda b: b != "distance_score",
+        )
+        s3_composite_data_bands = intermediates.save(
+            s3_composite_data_bands, "s3_composite_data_bands"
+        )
+
+        s3_composite_data_bands_smoothed = s3_composite_data_bands.apply_kernel(
+            kernel=smoothing_kernel()
+        )
+        s3_composite_data_bands_smoothed = checkpoint(
+            s3_composite_data_bands_smoothed, "s3_composite_data_bands_smoothed"
+        )
+        s3_composite_data_bands_smoothed = intermediates.save(
+            s3_composite_data_bands_smoothed, "s3_composite_data_bands_smoothed"
+        )
 
     # s2 pre processing
     # do not use output for next step, the conversion to int is only a workaround of a backend bug for downloads
-    save_intermediate(
-        s2_flags * 1,
-        "s2_cloud_flags",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
+    intermediates.save(s2_flags * 1, "s2_cloud_flags")
     s2_cloud_mask = (
         compute_cloud_mask_s2(s2_flags) * 1.0
     )  # convert to float for inspection and mean computation
-    s2_cloud_mask = save_intermediate(
-        s2_cloud_mask,
-        "s2_cloud_mask",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
+    s2_cloud_mask = intermediates.save(s2_cloud_mask, "s2_cloud_mask")
     s2_cloud_mask_mean = s2_cloud_mask.resample_spatial(
         resolution=300, method="average"
     )
-    s2_cloud_mask_mean = save_intermediate(
-        s2_cloud_mask_mean,
-        "s2_cloud_mask_mean",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
+    s2_cloud_mask_mean = intermediates.save(s2_cloud_mask_mean, "s2_cloud_mask_mean")
     s2_cloud_mask_coarse = s2_cloud_mask_mean >= cloud_tolerance_percentage
-    s2_cloud_mask_coarse = save_intermediate(
-        s2_cloud_mask_coarse,
-        "s2_cloud_mask_coarse",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
-
-    s2_distance_to_cloud = distance_to_cloud(
-        s2_cloud_mask_coarse,
-        image_size_pixels=s3_dtc_patch_length_px,
-        max_distance_pixels=s3_dtc_overlap_length_px,
-        pixel_size_native_units=constants.S3_RESOLUTION_DEG,
-    )
-    s2_distance_to_cloud = save_intermediate(
-        s2_distance_to_cloud,
-        "s2_distance_to_cloud",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
-
-    s2_distance_score = compute_distance_score(
-        s2_distance_to_cloud, max_distance_to_cloud_s3_px
-    )
-    s2_distance_score = save_intermediate(
-        s2_distance_score,
-        "s2_distance_score",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
+    s2_cloud_mask_coarse = intermediates.save(
+        s2_cloud_mask_coarse, "s2_cloud_mask_coarse"
+    )
+
+    if intermediates.skips("s2_distance_to_cloud"):
+        # The distance itself is not needed, compute the distance score in the distance to cloud UDF
+        s2_distance_score = distance_score_to_cloud(
+            s2_cloud_mask_coarse,
+            image_size_pixels=s3_dtc_patch_length_px,
+            max_distance_pixels=s3_dtc_overlap_length_px,
+            max_distance_score_pixels=max_distance_to_cloud_s3_px,
+            chunk_days=distance_to_cloud_chunk_days,
+            dtype=dtype,
+            instrumentation=instrumentation("s2_distance_score"),
+        )
+    else:
+        s2_distance_to_cloud = distance_to_cloud(
+            s2_cloud_mask_coarse,
+            image_size_pixels=s3_dtc_patch_length_px,
+            max_distance_pixels=s3_dtc_overlap_length_px,
+            pixel_size_native_units=constants.S3_RESOLUTION_DEG,
+            # Not bounded (``distance_bound_pixels``), because the distance is saved as an intermediate, which
+            # would contain ``inf`` beyond the bound
+            chunk_days=distance_to_cloud_chunk_days,
+            dtype=dtype,
+            instrumentation=instrumentation("s2_distance_to_cloud"),
+        )
+        s2_distance_to_cloud = intermediates.save(
+            s2_distance_to_cloud, "s2_distance_to_cloud"
+        )
+
+        s2_distance_score = compute_distance_score(
+            s2_distance_to_cloud, max_distance_to_cloud_s3_px
+        )
+    s2_distance_score = checkpoint(s2_distance_score, "s2_distance_score")
+    s2_distance_score = intermediates.save(s2_distance_score, "s2_distance_score")
 
     s2_bands_masked = s2_bands.mask(s2_cloud_mask)
-    s2_bands_masked = save_intermediate(
-        s2_bands_masked,
-        "s2_bands_masked",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
-
-    # s3 temporal resampling
-    s3_composite_target_interp = interpolate_time_series_to_target_extent(
-        s3_composite_data_bands_smoothed,
-        temporal_extent=temporal_extent,
-        temporal_extent_target=temporal_extent_target,
-        interval_days=interval_days,
-        target_band_name_suffix=S3_INTERPOLATION_BAND_NAME_SUFFIX,
-    )
-    s3_composite_target_interp = save_intermediate(
-        s3_composite_target_interp,
-        "s3_composite_target_interp",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
-
-    s3_composite_s2_interp = interpolate_time_series_to_target_labels(
-        s3_composite_data_bands_smoothed, s2_bands.dimension_labels("t")
-    )
-    s3_composite_s2_interp = save_intermediate(
-        s3_composite_s2_interp,
-        "s3_composite_s2_interp",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
+    s2_bands_masked = intermediates.save(s2_bands_masked, "s2_bands_masked")
+
+    # s3 temporal resampling (already computed by the S3 temporal chain)
+    if not use_s3_temporal_chain:
+        s3_composite_target_interp = interpolate_time_series_to_target_extent(
+            s3_composite_data_bands_smoothed,
+            temporal_extent=temporal_extent,
+            temporal_extent_target=temporal_extent_target,
+            interval_days=interval_days,
+            target_band_name_suffix=S3_INTERPOLATION_BAND_NAME_SUFFIX,
+            dtype=dtype,
+            instrumentation=instrumentation("s3_composite_target_interp"),
+        )
+        s3_composite_s2_interp = interpolate_time_series_to_target_labels(
+            s3_composite_data_bands_smoothed, s2_bands.dimension_labels("t")
+        )
+    s3_composite_target_interp = intermediates.save(
+        s3_composite_target_interp, "s3_composite_target_interp"
+    )
+    s3_composite_s2_interp = intermediates.save(
+        s3_composite_s2_interp, "s3_composite_s2_interp"
     )
 
     # s2/3 aggregate
     s2_bands_dtc_merge = s2_bands_masked.merge_cubes(s2_distance_score)
-    s2_bands_dtc_merge = save_intermediate(
-        s2_bands_dtc_merge,
-        "s2_bands_dtc_merge",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
+    s2_bands_dtc_merge = intermediates.save(s2_bands_dtc_merge, "s2_bands_dtc_merge")
     s2_s3_pre_aggregate_merge = s2_bands_dtc_merge.merge_cubes(s3_composite_s2_interp)
-    s2_s3_pre_aggregate_merge = save_intermediate(
-        s2_s3_pre_aggregate_merge,
-        "s2_s3_pre_aggregate_merge",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
+    s2_s3_pre_aggregate_merge = intermediates.save(
+        s2_s3_pre_aggregate_merge, "s2_s3_pre_aggregate_merge"
     )
 
     s2_s3_aggregate = compute_weighted_composite(
@@ -435,27 +569,18 @@ def efast_openeo(
         temporal_extent_target=temporal_extent_target,
         interval_days=interval_days,
         sigma_doy=temporal_score_stddev,
+        temporal_score_truncate=temporal_score_truncate,
+        memory_budget_mb=composite_memory_budget_mb,
+        engine=composite_engine,
+        mosaic_days=composite_mosaic_days,
+        dtype=dtype,
+        instrumentation=instrumentation("s2_s3_aggregate"),
     )
-    s2_s3_aggregate = save_intermediate(
-        s2_s3_aggregate,
-        "s2_s3_aggregate",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
+    s2_s3_aggregate = checkpoint(s2_s3_aggregate, "s2_s3_aggregate")
+    s2_s3_aggregate = intermediates.save(s2_s3_aggregate, "s2_s3_aggregate")
 
     fusion_input = s2_s3_aggregate.merge_cubes(s3_composite_target_interp)
-    fusion_input = save_intermediate(
-        fusion_input,
-        "fusion_input",
-        out_dir=output_dir,
-        file_format=file_format,
-        synchronous=synchronous,
-        to_skip=skip_intermediates,
-        skip_all=skip_all_intermediates,
-    )
+    fusion_input = intermediates.save(fusion_input, "fusion_input")
 
     fused = fusion(
         fusion_input,
@@ -464,6 +589,8 @@ def efast_openeo(
         low_resolution_interpolated_band_name_suffix=S3_INTERPOLATION_BAND_NAME_SUFFIX,
         target_band_names=fused_band_names,
         output_ndvi=output_ndvi,
+        dtype=dtype,
+        instrumentation=instrumentation("fusion"),
     )
 
     return fused
@@ -0,0 +1,400 @@
+import copy
+import json
+import operator
+from collections import Counter
+
+# Element-wise arithmetic processes with two operands ``x`` and ``y``, which are folded if both are constants
+ARITHMETIC_PROCESSES = {
+    "add": operator.add,
+    "subtract": operator.sub,
+    "multiply": operator.mul,
+    "divide": operator.truediv,
+}
+# Operand ``y`` for which ``x op y == x``
+RIGHT_IDENTITIES = {"add": 0, "subtract": 0, "multiply": 1, "divide": 1}
+# Operand ``x`` for which ``x op y == y``
+LEFT_IDENTITIES = {"add": 0, "multiply": 1}
+# Processes which are kept even if their result is not used, and never merged
+SIDE_EFFECT_PROCESSES = {"save_result"}
+
+
+def process_counts(flat_graph: dict) -> Counter:
+    """
+    Number of nodes per process (top level of ``flat_graph`` only, not counting the nodes of callbacks).
+    """
+    return Counter(node["process_id"] for node in flat_graph.values())
+
+
+def _map_references(value, function, key="from_node"):
+    """
+    Copy of the argument ``value`` with all references ``{key: ...}`` replaced by ``function(reference)``. Callbacks
+    (``process_graph``) are not entered, their references refer to the nodes of the callback.
+    """
+    if isinstance(value, dict):
+        if set(value) == {key}:
+            return function(value)
+        return {
+            k: v if k == "process_graph" else _map_references(v, function, key)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_map_references(v, function, key) for v in value]
+    return value
+
+
+def _references(value, key="from_node") -> list:
+    found = []
+
+    def collect(reference):
+        found.append(reference[key])
+        return reference
+
+    _map_references(value, collect, key)
+    return found
+
+
+def _replace_node(graph: dict, node_id: str, replacement):
+    """
+    Remove ``node_id`` from ``graph`` and replace all references to it by ``replacement`` (an argument value).
+    """
+    del graph[node_id]
+    for node in graph.values():
+        node["arguments"] = _map_references(
+            node["arguments"],
+            lambda ref: (
+                copy.deepcopy(replacement) if ref["from_node"] == node_id else ref
+            ),
+        )
+
+
+def _consumers(graph: dict) -> dict[str, list]:
+    consumers = {node_id: [] for node_id in graph}
+    for node_id, node in graph.items():
+        for reference in _references(node["arguments"]):
+            consumers[reference].append(node_id)
+    return consumers
+
+
+def _result_node(graph: dict) -> str:
+    return next(node_id for node_id, node in graph.items() if node.get("result"))
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_identity(value, identity) -> bool:
+    return _is_number(value) and value == identity
+
+
+def _fold_constants(
+    graph: dict, allow_passthrough: bool, fold_integer_identities: bool = True
+) -> tuple[int, dict | None]:
+    """
+    Fold the arithmetic nodes of the callback ``graph`` with constant operands, and remove the nodes with an
+    identity operand (``x + 0``, ``x * 1``, ...). An identity operation is only removed if its operand is an
+    integer, or if its result is the operand of another arithmetic node. Otherwise, the operation may be intended
+    to convert the data type (e.g. ``x * 1.0``).
+
+    :param allow_passthrough: whether the result node may be replaced by the parameter of the callback
+    :param fold_integer_identities: whether to remove identity operations with an integer operand, whose result
+        is not the operand of another arithmetic node
+    :return: the number of folded nodes and the parameter reference, if the callback reduces to its parameter
+    """
+    folded = 0
+    changed = True
+    while changed:
+        changed = False
+        consumers = _consumers(graph)
+        for node_id, node in list(graph.items()):
+            process_id = node["process_id"]
+            if process_id not in ARITHMETIC_PROCESSES or set(node["arguments"]) != {
+                "x",
+                "y",
+            }:
+                continue
+            x, y = node["arguments"]["x"], node["arguments"]["y"]
+            arithmetic_consumer = any(
+                graph[consumer]["process_id"] in ARITHMETIC_PROCESSES
+                for consumer in consumers[node_id]
+            )
+
+            replacement = None
+            if _is_number(x) and _is_number(y):
+                if process_id == "divide" and y == 0:
+                    continue
+                replacement = ARITHMETIC_PROCESSES[process_id](x, y)
+            elif _is_identity(y, RIGHT_IDENTITIES[process_id]) and (
+                isinstance(y, int) and fold_integer_identities or arithmetic_consumer
+            ):
+                replacement = x
+            elif _is_identity(x, LEFT_IDENTITIES.get(process_id)) and (
+                isinstance(x, int) and fold_integer_identities or arithmetic_consumer
+            ):
+                replacement = y
+            if replacement is None:
+                continue
+
+            if node.get("result"):
+                if isinstance(replacement, dict) and "from_node" in replacement:
+                    graph[replacement["from_node"]]["result"] = True
+                elif (
+                    allow_passthrough
+                    and isinstance(replacement, dict)
+                    and "from_parameter" in replacement
+                    and len(graph) == 1
+                ):
+                    return folded + 1, replacement
+                else:
+                    # a constant result cannot be expressed by a callback without nodes
+                    continue
+            _replace_node(graph, node_id, replacement)
+            folded += 1
+            changed = True
+            break
+    return folded, None
+
+
+def _simplify_callbacks(
+    node: dict, allow_passthrough: bool, fold_integer_identities: bool = True
+) -> tuple[int, dict | None]:
+    """
+    Fold the constants in all callbacks of ``node`` (recursively).
+
+    :return: the number of folded nodes and, for the ``process`` of an ``apply`` node, the parameter reference if
+        the callback reduces to its parameter
+    """
+    folded = 0
+    passthrough = None
+    for name, argument in node["arguments"].items():
+        if not (isinstance(argument, dict) and "process_graph" in argument):
+            continue
+        callback = argument["process_graph"]
+        for callback_node in callback.values():
+            folded += _simplify_callbacks(
+                callback_node,
+                allow_passthrough=False,
+                fold_integer_identities=fold_integer_identities,
+            )[0]
+        n, reference = _fold_constants(
+            callback,
+            allow_passthrough=allow_passthrough and name == "process",
+            fold_integer_identities=fold_integer_identities,
+        )
+        folded += n
+        passthrough = passthrough or reference
+    return folded, passthrough
+
+
+def _fusable_apply(node: dict) -> bool:
+    return node["process_id"] == "apply" and set(node["arguments"]) == {
+        "data",
+        "process",
+    }
+
+
+def _fuse_applies(graph: dict) -> int:
+    """
+    Fuse ``apply(apply(data, f), g)`` to ``apply(data, g(f))`` if the inner ``apply`` is only used by the outer one.
+    """
+    fused = 0
+    changed = True
+    while changed:
+        changed = False
+        consumers = _consumers(graph)
+        for outer_id, outer in list(graph.items()):
+            if not _fusable_apply(outer):
+                continue
+            inner_reference = outer["arguments"]["data"]
+            inner_id = (
+                inner_reference.get("from_node")
+                if isinstance(inner_reference, dict)
+                else None
+            )
+            if inner_id is None or not _fusable_apply(graph[inner_id]):
+                continue
+            inner = graph[inner_id]
+            if inner.get("result") or consumers[inner_id] != [outer_id]:
+                continue
+
+            inner_callback = copy.deepcopy(
+                inner["arguments"]["process"]["process_graph"]
+            )
+            outer_callback = outer["arguments"]["process"]["process_graph"]
+            # rename the nodes of the inner callback which collide with the nodes of the outer callback
+            renamed = {}
+            for node_id in inner_callback:
+                new_id = node_id
+                while new_id in outer_callback or new_id in renamed.values():
+                    new_id = f"{new_id}_fused"
+                renamed[node_id] = new_id
+            inner_callback = {
+                renamed[node_id]: dict(
+                    node,
+                    arguments=_map_references(
+                        node["arguments"],
+                        lambda ref, renamed=renamed: {
+                            "from_node": renamed[ref["from_node"]]
+                        },
+                    ),
+                )
+                for node_id, node in inner_callback.items()
+            }
+            inner_result = _result_node(inner_callback)
+            del inner_callback[inner_result]["result"]
+            for node in outer_callback.values():
+                node["arguments"] = _map_references(
+                    node["arguments"],
+                    lambda ref, inner_result=inner_result: (
+                        {"from_node": inner_result}
+                        if ref["from_parameter"] == "x"
+                        else ref
+                    ),
+                    key="from_parameter",
+                )
+            outer["arguments"]["process"]["process_graph"] = {
+                **inner_callback,
+                **outer_callback,
+            }
+            outer["arguments"]["data"] = inner["arguments"]["data"]
+            del graph[inner_id]
+            fused += 1
+            changed = True
+            break
+    return fused
+
+
+def _canonical(value):
+    """
+    Copy of the argument ``value`` with the nodes of callbacks renamed by their position, so that callbacks
+    computing the same result are equal, regardless of the names of their nodes.
+    """
+    if isinstance(value, list):
+        return [_canonical(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "process_graph" not in value:
+        return {k: _canonical(v) for k, v in value.items()}
+    callback = value["process_graph"]
+    renamed = {node_id: f"node{i}" for i, node_id in enumerate(callback)}
+    process_graph = {
+        renamed[node_id]: dict(
+            node,
+            arguments=_canonical(
+                _map_references(
+                    node["arguments"],
+                    lambda ref: {"from_node": renamed[ref["from_node"]]},
+                )
+            ),
+        )
+        for node_id, node in callback.items()
+    }
+    return dict(value, process_graph=process_graph)
+
+
+def _merge_common_subexpressions(graph: dict) -> int:
+    """
+    Merge nodes with the same process and the same arguments (including the nodes they refer to).
+    """
+    merged = 0
+    changed = True
+    while changed:
+        changed = False
+        canonical = {}
+        for node_id, node in list(graph.items()):
+            if node["process_id"] in SIDE_EFFECT_PROCESSES:
+                continue
+            signature = json.dumps(
+                [node["process_id"], _canonical(node["arguments"])],
+                sort_keys=True,
+                default=str,
+            )
+            if signature not in canonical:
+                canonical[signature] = node_id
+                continue
+            if node.get("result"):
+                graph[canonical[signature]]["result"] = True
+            _replace_node(graph, node_id, {"from_node": canonical[signature]})
+            merged += 1
+            changed = True
+            break
+    return merged
+
+
+def _remove_dead_nodes(graph: dict) -> int:
+    """
+    Remove the nodes which do not contribute to the result node or to a node with side effects (``save_result``).
+    """
+    roots = [
+        node_id
+        for node_id, node in graph.items()
+        if node.get("result") or node["process_id"] in SIDE_EFFECT_PROCESSES
+    ]
+    alive = set()
+    while roots:
+        node_id = roots.pop()
+        if node_id in alive:
+            continue
+        alive.add(node_id)
+        roots.extend(_references(graph[node_id]["arguments"]))
+    dead = [node_id for node_id in graph if node_id not in alive]
+    for node_id in dead:
+        del graph[node_id]
+    return len(dead)
+
+
+def optimize_flat_graph(flat_graph: dict) -> tuple[dict, dict]:
+    """
+    Optimize a flat process graph (e.g. ``efast_openeo(...).flat_graph()``) before it is submitted:
+
+    - Constant folding in callbacks: arithmetic with constant operands is evaluated, and identity operations (e.g.
+      ``x * 1``, or ``x + 0`` of the scale and offset in ``load_and_scale``) are removed. An ``apply`` whose callback
+      reduces to its parameter is removed.
+    - Fusion of adjacent ``apply`` nodes into a single ``apply`` with the composed callback
+    - Common-subexpression elimination: nodes with the same process and arguments are computed once
+    - Dead-branch elimination: nodes which contribute neither to the result nor to a ``save_result`` are removed
+
+    :return: the optimized copy of ``flat_graph`` and a report with the node counts (per process) before and after
+        the optimization and the number of nodes changed by each pass
+    """
+    graph = copy.deepcopy(flat_graph)
+    report = dict(
+        nodes_before=len(graph),
+        process_counts_before=process_counts(graph),
+        folded_constants=0,
+        removed_identity_applies=0,
+        fused_applies=0,
+        merged_nodes=0,
+        removed_dead_nodes=0,
+    )
+
+    def fold_constants():
+        # identity operations directly before ``save_result`` are kept, they may convert the data type of the
+        # saved result (e.g. ``s2_flags * 1``)
+        saved = {
+            reference
+            for node in graph.values()
+            if node["process_id"] == "save_result"
+            for reference in _references(node["arguments"])
+        }
+        for node_id, node in list(graph.items()):
+            folded, passthrough = _simplify_callbacks(
+                node,
+                allow_passthrough=_fusable_apply(node) and not node.get("result"),
+                fold_integer_identities=node_id not in saved,
+            )
+            report["folded_constants"] += folded
+            if passthrough is not None:
+                _replace_node(graph, node_id, node["arguments"]["data"])
+                report["removed_identity_applies"] += 1
+
+    fold_constants()
+    report["fused_applies"] = _fuse_applies(graph)
+    if report["fused_applies"]:
+        # the composed callbacks may contain new constant expressions
+        fold_constants()
+    report["merged_nodes"] = _merge_common_subexpressions(graph)
+    report["removed_dead_nodes"] = _remove_dead_nodes(graph)
+    report["nodes_after"] = len(graph)
+    report["process_counts_after"] = process_counts(graph)
+    return graph, report
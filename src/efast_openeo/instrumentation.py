@@ -0,0 +1,99 @@
+import json
+from typing import Iterable, List
+
+import pandas as pd
+
+# Must match ``INSTRUMENTATION_RECORD_PREFIX`` of the UDFs
+RECORD_PREFIX = "EFAST_UDF_RECORD"
+
+
+def instrumentation_context(
+    stage: str, profile_dir: str | None = None
+) -> dict[str, str]:
+    """
+    Value of the ``"instrumentation"`` entry of a UDF context, which enables the instrumentation of the UDF
+    invocations (see ``_instrumented`` in the UDFs). The records of the invocations are labelled with ``stage``.
+    If ``profile_dir`` is set, each invocation is profiled with cProfile and the stats are dumped to this directory
+    (on the worker running the UDF).
+    """
+    instrumentation = {"stage": stage}
+    if profile_dir is not None:
+        instrumentation["profile_dir"] = str(profile_dir)
+    return instrumentation
+
+
+def parse_udf_records(logs: Iterable[dict | str]) -> List[dict]:
+    """
+    Extract the instrumentation records of the UDF invocations from job logs. ``logs`` are either log entries (dicts
+    with a ``"message"``, as returned by ``BatchJob.logs()``) or lines of a text log. Other log entries are ignored.
+    """
+    records = []
+    for entry in logs:
+        message = entry.get("message", "") if isinstance(entry, dict) else entry
+        start = message.find(RECORD_PREFIX)
+        if start < 0:
+            continue
+        try:
+            records.append(json.loads(message[start + len(RECORD_PREFIX) :]))
+        except json.JSONDecodeError:
+            continue
+    return records
+
+
+def aggregate_udf_records(records: List[dict]) -> pd.DataFrame:
+    """
+    Aggregate the instrumentation records of UDF invocations to a table with one row per stage and UDF, with the
+    number of invocations, their total, mean and maximum wall time, the share of the stage in the total wall time,
+    the maximum peak memory of an invocation, the maximum peak resident set size of the worker processes (over their
+    lifetime, see ``_instrumented`` in the UDFs) and the most frequent input and output shapes and data types.
+    The rows are sorted by the total wall time.
+    """
+    columns = [
+        "stage",
+        "udf",
+        "invocations",
+        "wall_time_total_s",
+        "wall_time_mean_s",
+        "wall_time_max_s",
+        "wall_time_share",
+        "peak_memory_max_mb",
+        "worker_max_rss_mb",
+        "input_shape",
+        "input_dtype",
+        "output_shape",
+        "output_dtype",
+    ]
+    if not records:
+        return pd.DataFrame(columns=columns)
+
+    frame = pd.DataFrame.from_records(records)
+    for name in ("input_shape", "output_shape"):
+        frame[name] = frame[name].map(lambda shape: "x".join(map(str, shape)))
+    for name in ("peak_memory_mb", "worker_max_rss_mb"):
+        if name not in frame:
+            frame[name] = None
+        frame[name] = frame[name].astype(float)
+
+    def most_frequent(values):
+        return values.mode().iloc[0]
+
+    if "udf" not in frame:
+        frame["udf"] = None
+    # keep the records without a stage or UDF name
+    table = frame.groupby(["stage", "udf"], as_index=False, dropna=False).agg(
+        invocations=("wall_time_s", "size"),
+        wall_time_total_s=("wall_time_s", "sum"),
+        wall_time_mean_s=("wall_time_s", "mean"),
+        wall_time_max_s=("wall_time_s", "max"),
+        peak_memory_max_mb=("peak_memory_mb", "max"),
+        worker_max_rss_mb=("worker_max_rss_mb", "max"),
+        input_shape=("input_shape", most_frequent),
+        input_dtype=("input_dtype", most_frequent),
+        output_shape=("output_shape", most_frequent),
+        output_dtype=("output_dtype", most_frequent),
+    )
+    table["wall_time_share"] = (
+        table["wall_time_total_s"] / table["wall_time_total_s"].sum()
+    )
+    table = table.sort_values("wall_time_total_s", ascending=False)
+    return table[columns].reset_index(drop=True)
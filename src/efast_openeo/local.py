@@ -0,0 +1,459 @@
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+import xarray as xr
+from openeo.udf import XarrayDataCube
+from scipy.ndimage import convolve
+
+from efast_openeo import constants
+from efast_openeo.algorithms.distance_to_cloud import compute_cloud_mask_s2
+from efast_openeo.algorithms.fusion import select_ndvi_bands
+from efast_openeo.algorithms.udf import (
+    udf_distance_transform,
+    udf_fusion,
+    udf_temporal_interpolation,
+    udf_temporal_score_aggregate,
+)
+from efast_openeo.constants import S3_INTERPOLATION_BAND_NAME_SUFFIX
+from efast_openeo.smoothing import smoothing_kernel
+from efast_openeo.util.log import logger
+
+try:
+    import dask.array as da
+except ImportError:  # dask is optional, only needed for chunked (lazy) execution
+    da = None
+
+DIMS = ("t", "bands", "y", "x")
+
+
+def load_cube(path: str | Path, chunks: dict | None = None) -> xr.DataArray:
+    """
+    Open a cube from a netCDF file or a zarr store (``.zarr`` suffix) as an array of dimensions (t, bands, y, x).
+    The bands may be stored as a ``bands`` dimension of a single variable or as separate variables, as in the
+    netCDF files written by openEO.
+
+    If ``chunks`` is set (e.g. ``{"y": 1024, "x": 1024}``), the cube is opened lazily as a dask array.
+    """
+    path = Path(path)
+    if path.suffix == ".zarr":
+        dataset = xr.open_zarr(path, chunks=chunks)
+    else:
+        dataset = xr.open_dataset(path, chunks=chunks)
+    data_vars = [name for name in dataset.data_vars if dataset[name].ndim >= 3]
+    if len(data_vars) == 1 and "bands" in dataset[data_vars[0]].dims:
+        cube = dataset[data_vars[0]]
+    else:
+        cube = dataset[data_vars].to_dataarray(dim="bands")
+    return cube.transpose(*DIMS)
+
+
+def scale(cube: xr.DataArray, scale: float = 1.0, offset: float = 0.0) -> xr.DataArray:
+    """
+    Applies offset and scale factor to a cube, like ``load_and_scale``.
+    """
+    return (cube + offset) * scale
+
+
+def resample_average(cube: xr.DataArray, like: xr.DataArray) -> xr.DataArray:
+    """
+    Resample ``cube`` to the coarser spatial grid of ``like`` by averaging all pixels whose center falls into a pixel
+    of ``like`` (``resample_spatial(method="average")``). Both grids must use the same coordinate reference system.
+    Pixels of ``like`` without any pixel of ``cube`` are NaN.
+    """
+    averaging_y = _averaging_matrix(cube.y.values, like.y.values)
+    averaging_x = _averaging_matrix(cube.x.values, like.x.values)
+    resampled = xr.apply_ufunc(
+        lambda data: np.einsum(
+            "...yx,Yy,Xx->...YX", data, averaging_y, averaging_x, optimize=True
+        ),
+        cube,
+        input_core_dims=[["y", "x"]],
+        output_core_dims=[["y_coarse", "x_coarse"]],
+        # np.einsum dispatches to dask.array.einsum for dask arrays
+        dask="allowed",
+    )
+    resampled = resampled.rename({"y_coarse": "y", "x_coarse": "x"})
+    return resampled.assign_coords(y=like.y.values, x=like.x.values)
+
+
+def resample_nearest(cube: xr.DataArray, like: xr.DataArray) -> xr.DataArray:
+    """
+    Resample ``cube`` to the spatial grid of ``like`` with nearest neighbour resampling, as ``merge_cubes`` does
+    for cubes of different resolutions. Both grids must use the same coordinate reference system.
+    """
+    resampled = cube.isel(
+        y=_nearest_index(like.y.values, cube.y.values),
+        x=_nearest_index(like.x.values, cube.x.values),
+    )
+    return resampled.assign_coords(y=like.y.values, x=like.x.values)
+
+
+def _nearest_index(source: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """
+    Index of the nearest coordinate in ``target`` (sorted ascending or descending) for each of ``source``.
+    """
+    order = np.argsort(target)
+    sorted_target = target[order]
+    midpoints = (sorted_target[1:] + sorted_target[:-1]) / 2
+    return order[np.searchsorted(midpoints, source)]
+
+
+def _averaging_matrix(source: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """
+    Matrix (target, source) averaging the source pixels whose center lies within each target pixel.
+    """
+    index = _nearest_index(source, target)
+    pixel_size = np.abs(np.diff(target)).min() if len(target) > 1 else np.inf
+    inside = np.abs(source - target[index]) <= pixel_size / 2
+    matrix = np.zeros((len(target), len(source)))
+    matrix[index[inside], np.flatnonzero(inside)] = 1
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return matrix / matrix.sum(axis=1, keepdims=True)
+
+
+def distance_score(
+    cloud_mask: xr.DataArray,
+    max_distance_score_pixels: float,
+    dtype: str | None = None,
+    halo_pixels: int | None = None,
+) -> xr.DataArray:
+    """
+    Distance to cloud score of ``cloud_mask`` (dimensions (t, y, x)) computed with the distance transform UDF
+    (see ``distance_score_to_cloud``), with a single ``distance_score`` band.
+
+    Numpy cubes are processed as a whole. Dask cubes are processed per chunk with ``map_overlap``, each chunk is
+    extended by ``halo_pixels`` pixels of its neighbours (like the overlap of ``apply_neighborhood`` in
+    ``distance_to_cloud``) and padded with ``False`` (no cloud) on the borders of the raster. Distances are bounded
+    at ``max_distance_score_pixels + 1``, so the result is exact if ``halo_pixels`` is at least that large.
+    """
+    context = {
+        "dtype": dtype,
+        "max_distance": None,
+        "output": "distance_score",
+        "max_distance_score": max_distance_score_pixels,
+    }
+
+    def compute_score(mask: np.ndarray) -> np.ndarray:
+        score = udf_distance_transform.apply_datacube(
+            XarrayDataCube(xr.DataArray(mask, dims=["t", "y", "x"])), context
+        )
+        return score.get_array().values
+
+    cloud_mask = cloud_mask.transpose("t", "y", "x")
+    if cloud_mask.chunks is None:
+        data = compute_score(cloud_mask.values)
+    else:
+        assert halo_pixels is not None, "'halo_pixels' must be set for dask cubes"
+        # a halo beyond the raster only adds padding without clouds
+        depth_y = min(halo_pixels, cloud_mask.sizes["y"])
+        depth_x = min(halo_pixels, cloud_mask.sizes["x"])
+        data = cloud_mask.data.map_overlap(
+            compute_score,
+            depth={0: 0, 1: depth_y, 2: depth_x},
+            boundary=False,
+            dtype=np.dtype(dtype or np.float64),
+        )
+    score = xr.DataArray(data, dims=cloud_mask.dims, coords=cloud_mask.coords)
+    return score.expand_dims(bands=["distance_score"], axis=1)
+
+
+def smooth(cube: xr.DataArray) -> xr.DataArray:
+    """
+    Spatial smoothing with ``smoothing_kernel``, with zero padding on the borders (like ``apply_kernel``).
+    Dask cubes are smoothed per chunk with ``map_overlap``.
+    """
+    cube = cube.transpose(*DIMS)
+    kernel = smoothing_kernel().astype(cube.dtype, copy=False)
+
+    def convolve_kernel(data: np.ndarray) -> np.ndarray:
+        return convolve(data, kernel[np.newaxis, np.newaxis], mode="constant", cval=0.0)
+
+    if cube.chunks is None:
+        return cube.copy(data=convolve_kernel(cube.values))
+    radius = kernel.shape[0] // 2
+    return cube.copy(
+        data=cube.data.map_overlap(
+            convolve_kernel,
+            depth={0: 0, 1: 0, 2: radius, 3: radius},
+            boundary=0.0,
+            dtype=cube.dtype,
+        )
+    )
+
+
+def map_time_blocks(
+    apply_datacube: Callable, cube: xr.DataArray, context
+) -> xr.DataArray:
+    """
+    Apply the ``apply_datacube`` function of a UDF with ``context`` to ``cube`` of dimensions (t, bands, y, x).
+    Dask cubes are processed with ``map_blocks`` on spatial chunks spanning the complete time series and all bands,
+    like ``apply_dimension`` over ``t`` or ``bands``.
+    """
+    cube = cube.transpose(*DIMS)
+    if cube.chunks is None:
+        return apply_datacube(cube, context)
+    cube = cube.chunk({"t": -1, "bands": -1})
+    # the output labels of t and bands are taken from a single pixel
+    sample = apply_datacube(cube.isel(y=slice(0, 1), x=slice(0, 1)).compute(), context)
+    chunks = (
+        (sample.sizes["t"],),
+        (sample.sizes["bands"],),
+        *cube.chunks[2:],
+    )
+    template = xr.DataArray(
+        da.empty(tuple(sum(c) for c in chunks), chunks=chunks, dtype=sample.dtype),
+        dims=DIMS,
+        coords={
+            "t": sample.t.values,
+            "bands": sample.bands.values,
+            "y": cube.y.values,
+            "x": cube.x.values,
+        },
+    )
+    # the context is passed as an argument (not bound), so that it is part of the names of the dask tasks
+    return xr.map_blocks(
+        apply_datacube, cube, kwargs={"context": context}, template=template
+    )
+
+
+def _chunk_spatially(
+    s2_cube: xr.DataArray, s3_cube: xr.DataArray, chunk_size_pixels: int
+) -> tuple[xr.DataArray, xr.DataArray]:
+    """
+    Chunk the S2 cube into spatial chunks of ``chunk_size_pixels`` pixels and the S3 cube into chunks covering
+    (approximately) the same area, each chunk spans the complete time series and all bands.
+    """
+    s2_pixel_size = np.abs(np.diff(s2_cube.x.values)).min()
+    s3_pixel_size = np.abs(np.diff(s3_cube.x.values)).min()
+    s3_chunk_size_pixels = max(
+        1, round(chunk_size_pixels * s2_pixel_size / s3_pixel_size)
+    )
+    s2_cube = s2_cube.chunk(
+        {"t": -1, "bands": -1, "y": chunk_size_pixels, "x": chunk_size_pixels}
+    )
+    s3_cube = s3_cube.chunk(
+        {"t": -1, "bands": -1, "y": s3_chunk_size_pixels, "x": s3_chunk_size_pixels}
+    )
+    return s2_cube, s3_cube
+
+
+def save_intermediate(
+    cube: xr.DataArray,
+    name: str,
+    out_dir: str | Path | None,
+    *,
+    to_skip: list | set | None = None,
+):
+    """
+    Save an intermediate result as netCDF to ``out_dir``, unless ``out_dir`` is not set or ``name`` is in
+    ``to_skip`` (the names are the same as the intermediates of ``efast_openeo``).
+    """
+    if out_dir is None or (to_skip is not None and name in to_skip):
+        return cube
+    path = (Path(out_dir) / name).with_suffix(".nc")
+    logger.info(f"Saving '{path}' (local)")
+    # netCDF does not support booleans
+    saved = cube.astype(np.uint8) if cube.dtype == bool else cube
+    if "bands" in saved.dims:
+        saved = saved.to_dataset(dim="bands")
+    else:
+        saved = saved.to_dataset(name=name)
+    saved.to_netcdf(path)
+    return cube
+
+
+def efast_local(
+    s2_cube: xr.DataArray,
+    s3_cube: xr.DataArray,
+    *,
+    max_distance_to_cloud_m: int,
+    temporal_extent: List[str],
+    s3_data_bands: List[str],
+    s2_data_bands: List[str],
+    fused_band_names: List[str] | None,
+    cloud_tolerance_percentage: float,
+    temporal_extent_target: List[str] | None,
+    interval_days: int,
+    temporal_score_stddev: float,
+    output_ndvi: bool,
+    s2_scale: float = 1.0,
+    s2_offset: float = 0.0,
+    s3_scale: float = 1.0,
+    s3_offset: float = 0.0,
+    s3_flag_bitmask: int = 0xFF,
+    temporal_score_truncate: float | None = None,
+    composite_memory_budget_mb: float | None = None,
+    composite_engine: str = "numpy",
+    composite_mosaic_days: int | None = None,
+    dtype: str | None = None,
+    chunk_size_pixels: int | None = None,
+    output_dir: str | Path | None = None,
+    skip_intermediates: List[str] | None = None,
+) -> xr.DataArray:
+    """
+    Runs the EFAST chain of ``efast_openeo`` locally on xarray cubes, without an openEO backend, by calling the
+    UDFs directly. The stages and their parameters are the same as in ``efast_openeo``.
+
+    The inputs are arrays of dimensions (t, bands, y, x) (see ``load_cube``), with the Sentinel-2 and Sentinel-3 bands
+    named as in the openEO collections. ``s2_cube`` must contain ``constants.S2_FLAG_BAND``. If ``s3_cube``
+    contains ``constants.S3_FLAG_BAND``, pixels with flags in ``s3_flag_bitmask`` are masked (like the binning of
+    the backend), otherwise the S3 cloud mask is taken from the missing values of the S3 data. Both cubes must be
+    on grids of the same coordinate reference system, the S3 grid is the coarse grid on which the distance to cloud
+    is computed. Data values are scaled with ``(x + offset) * scale``.
+
+    If ``chunk_size_pixels`` is set (requires dask), the cubes are chunked spatially into chunks of
+    ``chunk_size_pixels`` S2 pixels (and S3 chunks covering the same area), and the chain is built lazily on dask
+    arrays: the distance to cloud is computed with ``map_overlap`` with the same overlap as ``distance_to_cloud``
+    in ``efast_openeo``, the UDFs along the time axis (composites, interpolation) and the fusion with ``map_blocks``
+    on chunks spanning the complete time series. The returned cube is then lazy, it is computed chunk by chunk
+    (e.g. by ``to_netcdf``), in parallel on all cores, so that areas larger than the memory can be processed.
+    Otherwise, the chain is computed eagerly and the distance to cloud on the complete raster.
+
+    If ``output_dir`` is set, the intermediate results which are not in ``skip_intermediates`` are saved there as
+    netCDF files.
+
+    :returns: fused cube on the target time series and the S2 grid, with ``fused_band_names`` bands (or the NDVI)
+    """
+    max_distance_to_cloud_s3_px = max_distance_to_cloud_m / constants.S3_RESOLUTION_M
+    if fused_band_names is None:
+        fused_band_names = s2_data_bands
+    if output_ndvi:
+        s2_data_bands, s3_data_bands, fused_band_names = select_ndvi_bands(
+            s2_data_bands, s3_data_bands, fused_band_names
+        )
+
+    def save(cube, name):
+        return save_intermediate(cube, name, output_dir, to_skip=skip_intermediates)
+
+    t_slice = slice(
+        np.datetime64(temporal_extent[0]),
+        np.datetime64(temporal_extent[1]) - np.timedelta64(1, "ns"),
+    )
+    s2_cube = s2_cube.transpose(*DIMS).sel(t=t_slice)
+    s3_cube = s3_cube.transpose(*DIMS).sel(t=t_slice)
+    # overlap of the distance to cloud chunks, as in ``efast_openeo``
+    s3_dtc_overlap_length_px = (
+        int(max_distance_to_cloud_m * 10) // constants.S3_RESOLUTION_M
+    )
+    if chunk_size_pixels is not None:
+        assert da is not None, "dask must be installed for chunked execution"
+        s2_cube, s3_cube = _chunk_spatially(s2_cube, s3_cube, chunk_size_pixels)
+
+    # s3 composites
+    s3_bands = scale(s3_cube.sel(bands=s3_data_bands), s3_scale, s3_offset)
+    if constants.S3_FLAG_BAND in s3_cube.bands:
+        s3_flags = s3_cube.sel(bands=constants.S3_FLAG_BAND).astype(int)
+        s3_bands = s3_bands.where((s3_flags & s3_flag_bitmask) == 0)
+    s3_cloud_mask = save(s3_bands.isel(bands=0).isnull(), "s3_cloud_mask")
+    s3_distance_score = save(
+        distance_score(
+            s3_cloud_mask,
+            max_distance_to_cloud_s3_px,
+            dtype=dtype,
+            halo_pixels=s3_dtc_overlap_length_px,
+        ),
+        "s3_distance_score",
+    )
+
+    composite_context = dict(
+        temporal_extent_input=temporal_extent,
+        temporal_extent_target=temporal_extent_target,
+        interval_days=interval_days,
+        temporal_score_truncate=temporal_score_truncate,
+        memory_budget_mb=composite_memory_budget_mb,
+        engine=composite_engine,
+        mosaic_days=composite_mosaic_days,
+        dtype=dtype,
+    )
+    s3_composite = map_time_blocks(
+        udf_temporal_score_aggregate.apply_datacube,
+        xr.concat([s3_bands, s3_distance_score], dim="bands"),
+        {**composite_context, "sigma_doy": constants.S3_TEMPORAL_SCORE_STDDEV},
+    )
+    s3_composite_data_bands = save(s3_composite, "s3_composite_data_bands")
+    s3_composite_data_bands_smoothed = save(
+        smooth(s3_composite_data_bands), "s3_composite_data_bands_smoothed"
+    )
+
+    # s2 pre processing
+    s2_bands = save(
+        scale(s2_cube.sel(bands=s2_data_bands), s2_scale, s2_offset), "s2_bands"
+    )
+    s2_cloud_mask = compute_cloud_mask_s2(s2_cube.sel(bands=constants.S2_FLAG_BAND))
+    s2_cloud_mask_mean = resample_average(s2_cloud_mask * 1.0, s3_bands)
+    s2_cloud_mask_coarse = save(
+        s2_cloud_mask_mean >= cloud_tolerance_percentage, "s2_cloud_mask_coarse"
+    )
+    s2_distance_score = save(
+        distance_score(
+            s2_cloud_mask_coarse,
+            max_distance_to_cloud_s3_px,
+            dtype=dtype,
+            halo_pixels=s3_dtc_overlap_length_px,
+        ),
+        "s2_distance_score",
+    )
+    s2_bands_masked = save(s2_bands.where(~s2_cloud_mask), "s2_bands_masked")
+
+    # s3 temporal resampling
+    s3_composite_target_interp = save(
+        map_time_blocks(
+            udf_temporal_interpolation.apply_datacube,
+            s3_composite_data_bands_smoothed,
+            dict(
+                temporal_extent_input=temporal_extent,
+                temporal_extent_target=temporal_extent_target,
+                interval_days=interval_days,
+                target_band_name_suffix=S3_INTERPOLATION_BAND_NAME_SUFFIX,
+                skip_nan=False,
+                dtype=dtype,
+            ),
+        ),
+        "s3_composite_target_interp",
+    )
+    s3_composite_s2_interp = save(
+        map_time_blocks(
+            udf_temporal_interpolation.apply_datacube,
+            s3_composite_data_bands_smoothed,
+            s2_bands.indexes["t"],
+        ),
+        "s3_composite_s2_interp",
+    )
+
+    # s2/3 aggregate, the coarse cubes are upsampled to the S2 grid (like merge_cubes)
+    s2_s3_pre_aggregate_merge = xr.concat(
+        [
+            s2_bands_masked,
+            resample_nearest(s2_distance_score, s2_bands),
+            resample_nearest(s3_composite_s2_interp, s2_bands),
+        ],
+        dim="bands",
+    )
+    s2_s3_aggregate = save(
+        map_time_blocks(
+            udf_temporal_score_aggregate.apply_datacube,
+            s2_s3_pre_aggregate_merge,
+            {**composite_context, "sigma_doy": temporal_score_stddev},
+        ),
+        "s2_s3_aggregate",
+    )
+
+    fusion_input = xr.concat(
+        [s2_s3_aggregate, resample_nearest(s3_composite_target_interp, s2_bands)],
+        dim="bands",
+    )
+    fused = map_time_blocks(
+        udf_fusion.apply_datacube,
+        fusion_input,
+        {
+            "lr_mosaic_bands": s3_data_bands,
+            "hr_mosaic_bands": s2_data_bands,
+            "lr_interpolated_band_name_suffix": S3_INTERPOLATION_BAND_NAME_SUFFIX,
+            "output_ndvi": output_ndvi,
+            "ndvi_bands": [constants.NDVI_NIR_BAND, constants.NDVI_RED_BAND],
+            "target_bands": fused_band_names,
+            "dtype": dtype,
+        },
+    )
+    return fused.transpose(*DIMS)
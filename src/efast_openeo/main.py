@@ -1,12 +1,26 @@
 from pathlib import Path
 
+import shutil
+
 import openeo
 import click
 import xarray as xr
 
 from efast_openeo.util.log import logger
 from efast_openeo import constants
-from efast_openeo.efast import efast_openeo
+from efast_openeo.checkpoint import (
+    CHECKPOINT_STAGES,
+    DEFAULT_CHECKPOINT_STAGES,
+    StageCheckpoints,
+)
+from efast_openeo.efast import IntermediateRegistry, efast_openeo
+from efast_openeo.graph_optimizer import optimize_flat_graph
+from efast_openeo.metadata_cache import (
+    DEFAULT_CACHE_DIR,
+    CachedMetadataConnection,
+    CollectionMetadataCache,
+)
+from efast_openeo.result_cache import ResultCache, result_key
 
 
 def parse_bbox(ctx, param, value):
@@ -80,6 +94,75 @@ def parse_bands(ctx, param, value):
         "Standard deviation (in days) of the gaussian window used to temporally weigh observations in the fusion procedure"
     ),
 )
+@click.option(
+    "--temporal-score-truncate",
+    type=float,
+    required=False,
+    default=None,
+    help=(
+        "Truncate the gaussian window used to temporally weigh observations at this many standard deviations. "
+        "Observations outside the window do not contribute to a composite. Not truncated if not set."
+    ),
+)
+@click.option(
+    "--composite-memory-budget-mb",
+    type=float,
+    required=False,
+    default=None,
+    help=(
+        "Working memory (MB) for computing composites. If set, each chunk is processed in spatial tiles "
+        "that fit into the budget."
+    ),
+)
+@click.option(
+    "--composite-engine",
+    type=click.Choice(["numpy", "numba", "sliding_window"]),
+    default="numpy",
+    show_default=True,
+    help=(
+        "Implementation used to compute composites. 'numba' falls back to 'numpy' if numba is not available. "
+        "'sliding_window' requires --composite-mosaic-days or --temporal-score-truncate."
+    ),
+)
+@click.option(
+    "--composite-mosaic-days",
+    type=int,
+    required=False,
+    default=None,
+    help=(
+        "Length (days) of the window around each target date considered by the composite engines. "
+        "Uses --temporal-score-truncate if not set."
+    ),
+)
+@click.option(
+    "--distance-to-cloud-chunk-days",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of days processed by one invocation of the distance to cloud UDF.",
+)
+@click.option(
+    "--s3-temporal-chain",
+    is_flag=True,
+    help="If set, interpolate the smoothed S3 composites to the target and S2 time series in a single UDF.",
+)
+@click.option(
+    "--dtype",
+    type=click.Choice(["float32", "float64"]),
+    default=None,
+    help="Data type in which the UDFs compute and return their results. float32 halves memory and bandwidth.",
+)
+@click.option(
+    "--instrument-udfs",
+    is_flag=True,
+    help="If set, log the runtime, shapes and peak memory of every UDF invocation (see utils/udf_stats.py).",
+)
+@click.option(
+    "--udf-profile-dir",
+    type=str,
+    default=None,
+    help="Directory on the workers to dump cProfile stats of every UDF invocation to (with --instrument-udfs).",
+)
 @click.option(
     "--bbox",
     callback=parse_bbox,
@@ -136,6 +219,51 @@ def parse_bands(ctx, param, value):
     is_flag=True,
     help="If set, produce the normalized difference vegetation index (NDVI) as output instead of the fused bands",
 )
+@click.option(
+    "--optimize-graph",
+    is_flag=True,
+    help=(
+        "Optimize the process graph before submitting it (constant folding, fusion of adjacent apply nodes, "
+        "common-subexpression and dead-branch elimination)."
+    ),
+)
+@click.option(
+    "--metadata-cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=DEFAULT_CACHE_DIR,
+    show_default=True,
+    help="Directory of the cache of the collection metadata (scale factors, offsets and bands).",
+)
+@click.option(
+    "--result-cache",
+    type=click.Path(file_okay=False, path_type=Path),
+    help=(
+        "Directory of a local cache of the results of complete runs. If a run with the same process graph was "
+        "cached, its results are copied to the output directory before any job is submitted (including "
+        "checkpoints and synchronous intermediates, which are not cached)."
+    ),
+)
+@click.option(
+    "--result-cache-max-size-mb",
+    type=float,
+    help="Maximum size of the result cache (MB), the least recently used results are evicted.",
+)
+@click.option(
+    "--checkpoint-index",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help=(
+        "JSON index of stage checkpoints. If set, expensive stages are persisted as batch job results, and "
+        "resumed with load_stac by later runs computing the same stage. Cannot be combined with "
+        "--save-intermediates."
+    ),
+)
+@click.option(
+    "--checkpoint-stages",
+    callback=parse_bands,
+    default=",".join(DEFAULT_CHECKPOINT_STAGES),
+    show_default=True,
+    help=f"Stages to checkpoint (with --checkpoint-index), out of {', '.join(CHECKPOINT_STAGES)}",
+)
 def main(
     max_distance_to_cloud_m,
     t_start,
@@ -155,7 +283,28 @@ def main(
     cloud_tolerance_percentage,
     output_ndvi,
     temporal_score_stddev,
+    temporal_score_truncate,
+    composite_memory_budget_mb,
+    composite_engine,
+    composite_mosaic_days,
+    distance_to_cloud_chunk_days,
+    s3_temporal_chain,
+    dtype,
+    instrument_udfs,
+    udf_profile_dir,
+    optimize_graph,
+    metadata_cache_dir,
+    result_cache,
+    result_cache_max_size_mb,
+    checkpoint_index,
+    checkpoint_stages,
 ):
+    if checkpoint_index is not None and save_intermediates:
+        # the intermediates before a checkpoint would be recomputed from the collections by every resumed run
+        raise click.UsageError(
+            "--save-intermediates cannot be combined with --checkpoint-index"
+        )
+
     output_dir = Path(output_dir).resolve()
     output_dir.mkdir(exist_ok=True)
 
@@ -165,6 +314,9 @@ def main(
     connection = openeo.connect(
         "https://openeo.dataspace.copernicus.eu/"
     ).authenticate_oidc()
+    connection = CachedMetadataConnection(
+        connection, CollectionMetadataCache(metadata_cache_dir)
+    )
 
     max_distance_to_cloud_s3_px = max_distance_to_cloud_m / constants.S3_RESOLUTION_M
 
@@ -183,34 +335,126 @@ def main(
     else:
         temporal_extent_target=[t_target_start, t_target_end_excl]
 
-    fused = efast_openeo(
-        connection=connection,
-        max_distance_to_cloud_m=max_distance_to_cloud_m,
-        temporal_extent=[t_start, t_end_excl],
-        temporal_extent_target=temporal_extent_target,
-        interval_days=interval_days,
-        bbox=bbox,
-        s3_data_bands=s3_data_bands,
-        s2_data_bands=s2_data_bands,
-        fused_band_names=fused_band_names,
-        output_dir=output_dir,
-        save_intermediates=save_intermediates,
-        synchronous=synchronous,
-        skip_intermediates=skip_intermediates,
-        file_format=file_format,
-        cloud_tolerance_percentage=cloud_tolerance_percentage,
-        output_ndvi=output_ndvi,
-        temporal_score_stddev=temporal_score_stddev,
+    def build_result(
+        intermediates: IntermediateRegistry, checkpoints: StageCheckpoints | None
+    ):
+        fused = efast_openeo(
+            connection=connection,
+            max_distance_to_cloud_m=max_distance_to_cloud_m,
+            temporal_extent=[t_start, t_end_excl],
+            temporal_extent_target=temporal_extent_target,
+            interval_days=interval_days,
+            bbox=bbox,
+            s3_data_bands=s3_data_bands,
+            s2_data_bands=s2_data_bands,
+            fused_band_names=fused_band_names,
+            output_dir=output_dir,
+            save_intermediates=save_intermediates,
+            synchronous=synchronous,
+            skip_intermediates=skip_intermediates,
+            file_format=file_format,
+            cloud_tolerance_percentage=cloud_tolerance_percentage,
+            output_ndvi=output_ndvi,
+            temporal_score_stddev=temporal_score_stddev,
+            temporal_score_truncate=temporal_score_truncate,
+            composite_memory_budget_mb=composite_memory_budget_mb,
+            composite_engine=composite_engine,
+            composite_mosaic_days=composite_mosaic_days,
+            distance_to_cloud_chunk_days=distance_to_cloud_chunk_days,
+            use_s3_temporal_chain=s3_temporal_chain,
+            dtype=dtype,
+            instrument_udfs=instrument_udfs,
+            udf_profile_dir=udf_profile_dir,
+            intermediates=intermediates,
+            checkpoints=checkpoints,
+        )
+        if synchronous:
+            return fused, fused.save_result(format="netCDF")
+        return fused, intermediates.result(fused)
+
+    cache = None
+    if result_cache is not None:
+        cache = ResultCache(result_cache, max_size_mb=result_cache_max_size_mb)
+        # The key is computed before any job runs (checkpoints, synchronous intermediates), from the graph built
+        # without checkpoints and with the intermediates collected instead of executed
+        _, planned_result = build_result(
+            IntermediateRegistry(
+                output_dir,
+                file_format,
+                synchronous=False,
+                to_skip=skip_intermediates,
+                skip_all=not save_intermediates,
+            ),
+            checkpoints=None,
+        )
+        key = result_key(
+            planned_result,
+            parameters={"backend": connection.root_url, "synchronous": synchronous},
+        )
+        files = cache.get(key)
+        if files is not None:
+            for file in files:
+                shutil.copy2(file, output_dir / file.name)
+            logger.info("Done (cached)")
+            return
+
+    # all intermediates of an asynchronous run are saved by the batch job of the final result
+    intermediates = IntermediateRegistry(
+        output_dir,
+        file_format,
+        synchronous,
+        to_skip=skip_intermediates,
+        skip_all=not save_intermediates,
     )
+    checkpoints = None
+    if checkpoint_index is not None:
+        checkpoints = StageCheckpoints(
+            connection,
+            checkpoint_index,
+            checkpoint_stages,
+            parameters={"backend": connection.root_url},
+        )
+    fused, result = build_result(intermediates, checkpoints)
     # inputs
 
     print(fused.to_json())
-    if synchronous:
-        fused.download(output_dir / "fused.nc")
-    else:
-        fused.execute_batch(output_dir / "fused.nc", title="EFAST full chain")
-    logger.info("Done")
+    process_graph = result.flat_graph()
+    if optimize_graph:
+        process_graph, report = optimize_flat_graph(process_graph)
+        logger.info(
+            f"Optimized process graph: {report['nodes_before']} -> {report['nodes_after']} nodes "
+            f"({report['folded_constants']} constants folded, {report['removed_identity_applies']} identity applies "
+            f"removed, {report['fused_applies']} applies fused, {report['merged_nodes']} nodes merged, "
+            f"{report['removed_dead_nodes']} dead nodes removed)"
+        )
+        for process_id in sorted(report["process_counts_before"]):
+            before = report["process_counts_before"][process_id]
+            after = report["process_counts_after"][process_id]
+            if before != after:
+                logger.info(f"  {process_id}: {before} -> {after}")
 
+    def execute(target_dir: Path):
+        """
+        Execute the process graph and download the results to ``target_dir``.
+
+        :return: the job id (``None`` if synchronous) and the downloaded files
+        """
+        if synchronous:
+            connection.download(process_graph, target_dir / "fused.nc")
+            return None, [target_dir / "fused.nc"]
+        job = connection.create_job(process_graph, title="EFAST full chain")
+        job.start_and_wait()
+        return job.job_id, job.get_results().download_files(target_dir)
+
+    if cache is None:
+        execute(output_dir)
+        logger.info("Done")
+        return
+
+    files = cache.compute(key, execute)
+    for file in files:
+        shutil.copy2(file, output_dir / file.name)
+    logger.info("Done")
 
 if __name__ == "__main__":
     main()
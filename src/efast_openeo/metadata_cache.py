@@ -0,0 +1,123 @@
+import hashlib
+import json
+import time
+from pathlib import Path
+
+import openeo
+from openeo.metadata import CollectionMetadata
+
+from efast_openeo.util.log import logger
+
+DEFAULT_BACKEND_URL = "https://openeo.dataspace.copernicus.eu/"
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "efast_openeo" / "collections"
+DEFAULT_TTL_S = 7 * 24 * 3600
+
+
+class CollectionMetadataCache:
+    """
+    Persistent cache of collection metadata (``describe_collection``, including the ``summaries`` with the scale
+    factors and offsets used by ``load_and_scale``), one JSON file per backend and collection.
+
+    :param cache_dir: directory of the cached metadata
+    :param ttl_s: time (s) after which cached metadata is fetched again
+    """
+
+    def __init__(
+        self, cache_dir: str | Path = DEFAULT_CACHE_DIR, ttl_s: float = DEFAULT_TTL_S
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.ttl_s = ttl_s
+
+    def path(self, backend_url: str, collection_id: str) -> Path:
+        backend = hashlib.sha256(backend_url.rstrip("/").encode()).hexdigest()[:16]
+        return self.cache_dir / backend / f"{collection_id}.json"
+
+    def get(
+        self, backend_url: str, collection_id: str, allow_expired: bool = False
+    ) -> dict | None:
+        """
+        Cached metadata of ``collection_id``, or ``None`` if it is not cached or expired (unless ``allow_expired``).
+        """
+        path = self.path(backend_url, collection_id)
+        if not path.exists():
+            return None
+        entry = json.loads(path.read_text())
+        age_s = time.time() - entry["fetched"]
+        if age_s > self.ttl_s:
+            if not allow_expired:
+                return None
+            logger.warning(
+                f"Using expired metadata of '{collection_id}' ({age_s / 3600:.0f} h old)"
+            )
+        return entry["metadata"]
+
+    def put(self, backend_url: str, collection_id: str, metadata: dict):
+        path = self.path(backend_url, collection_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps(
+                dict(
+                    backend=backend_url,
+                    collection_id=collection_id,
+                    fetched=time.time(),
+                    metadata=dict(metadata),
+                )
+            )
+        )
+
+
+class CachedMetadataConnection:
+    """
+    Wraps an openEO connection to serve the collection metadata from a ``CollectionMetadataCache``, for
+    ``load_and_scale`` and for the band metadata of ``load_collection``. All other attributes are those of the
+    wrapped connection.
+
+    Without a connection (``connection=None``), process graphs are built offline from the cached metadata, e.g. to
+    export the UDP. Expired metadata is used in this case, missing metadata raises a ``LookupError``.
+
+    :param connection: connection to wrap, or ``None`` to build process graphs offline
+    :param cache: the metadata cache
+    :param backend_url: URL of the backend the metadata is cached for, if offline
+    """
+
+    def __init__(
+        self,
+        connection: openeo.Connection | None,
+        cache: CollectionMetadataCache | None = None,
+        backend_url: str = DEFAULT_BACKEND_URL,
+    ):
+        self.connection = connection
+        self.cache = cache if cache is not None else CollectionMetadataCache()
+        self.backend_url = (
+            connection.root_url if connection is not None else backend_url
+        )
+
+    def __getattr__(self, name):
+        if self.connection is None:
+            raise AttributeError(
+                f"'{name}' is not available without a connection (offline graph building)"
+            )
+        return getattr(self.connection, name)
+
+    def describe_collection(self, collection_id: str) -> dict:
+        offline = self.connection is None
+        metadata = self.cache.get(
+            self.backend_url, collection_id, allow_expired=offline
+        )
+        if metadata is not None:
+            return metadata
+        if offline:
+            raise LookupError(
+                f"No cached metadata of '{collection_id}' in '{self.cache.cache_dir}', "
+                "build the process graph with a connection once to fill the cache"
+            )
+        logger.info(f"Fetching metadata of '{collection_id}'")
+        metadata = self.connection.describe_collection(collection_id)
+        self.cache.put(self.backend_url, collection_id, metadata)
+        return metadata
+
+    def collection_metadata(self, collection_id: str) -> CollectionMetadata:
+        return CollectionMetadata(metadata=self.describe_collection(collection_id))
+
+    def load_collection(self, collection_id: str, **kwargs) -> openeo.DataCube:
+        return openeo.DataCube.load_collection(collection_id, connection=self, **kwargs)
@@ -0,0 +1,146 @@
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from efast_openeo.checkpoint import content_hash, stable_flat_graph
+from efast_openeo.util.log import logger
+
+
+def result_key(
+    result, parameters: dict | None = None, stac_urls: dict[str, str] | None = None
+) -> str:
+    """
+    Content hash of the flat process graph of a complete run (``result`` is a ``save_result`` node or an
+    ``openeo.MultiResult``, see ``IntermediateRegistry.result``) and additional ``parameters``, e.g. the backend.
+    Identical runs submitted from different pipelines have the same key.
+
+    :param stac_urls: ``load_stac`` URLs replaced by a stable identifier in the hashed graph, e.g.
+        ``StageCheckpoints.stac_urls`` of the checkpoints loaded by ``result`` (see ``stable_flat_graph``)
+    """
+    graph = stable_flat_graph(result, stac_urls)
+    return content_hash(dict(graph=graph, parameters=parameters or {}))
+
+
+class ResultCache:
+    """
+    Local cache of the results of complete EFAST runs, addressed by ``result_key``.
+
+    Each entry records the batch job which computed the results and the downloaded result files, which are stored
+    in a directory of the entry in ``cache_dir``. If ``max_size_mb`` is set, the least recently used entries are
+    evicted whenever the total size of the cached files exceeds it.
+
+    :param cache_dir: directory of the cached files and of the index (``index.json``)
+    :param max_size_mb: maximum total size of the cached files, in megabytes
+    """
+
+    def __init__(self, cache_dir: str | Path, max_size_mb: float | None = None):
+        self.cache_dir = Path(cache_dir)
+        self.max_size_mb = max_size_mb
+        self.index_path = self.cache_dir / "index.json"
+
+    def read_index(self) -> dict[str, dict]:
+        if not self.index_path.exists():
+            return {}
+        return json.loads(self.index_path.read_text())
+
+    def _write_index(self, index: dict[str, dict]):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path.write_text(json.dumps(index, indent=2))
+
+    def entry_dir(self, key: str) -> Path:
+        """
+        Directory to download the result files of the entry ``key`` to.
+        """
+        return self.cache_dir / key
+
+    def get(self, key: str) -> List[Path] | None:
+        """
+        The cached result files of ``key``, or ``None`` if there are none. Entries with missing files are removed.
+        """
+        index = self.read_index()
+        entry = index.get(key)
+        if entry is None:
+            return None
+
+        paths = [self.entry_dir(key) / name for name in entry["files"]]
+        if not all(path.exists() for path in paths):
+            logger.warning(f"Removing incomplete result cache entry '{key[:12]}'")
+            self._remove(index, key)
+            self._write_index(index)
+            return None
+
+        entry["last_used"] = time.time()
+        self._write_index(index)
+        logger.info(
+            f"Result cache hit '{key[:12]}' (job '{entry['job_id']}', {len(paths)} files)"
+        )
+        return paths
+
+    def compute(
+        self, key: str, execute: Callable[[Path], tuple[str | None, List[Path]]]
+    ) -> List[Path]:
+        """
+        Compute the result files of ``key`` with ``execute(entry_dir(key))``, which returns the job id and the
+        downloaded files, and record them (see ``put``). If ``execute`` fails, the directory of the entry is removed.
+
+        :return: the paths of the cached files
+        """
+        directory = self.entry_dir(key)
+        directory.mkdir(parents=True, exist_ok=True)
+        try:
+            job_id, files = execute(directory)
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return self.put(key, job_id, files)
+
+    def put(self, key: str, job_id: str | None, files: List[Path]) -> List[Path]:
+        """
+        Record the result ``files`` of the job ``job_id`` for ``key``. Files outside of ``entry_dir(key)`` are
+        copied there.
+
+        :return: the paths of the cached files
+        """
+        directory = self.entry_dir(key)
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for file in map(Path, files):
+            path = directory / file.name
+            if file.resolve() != path.resolve():
+                shutil.copy2(file, path)
+            paths.append(path)
+
+        index = self.read_index()
+        now = time.time()
+        index[key] = dict(
+            job_id=job_id,
+            files=[path.name for path in paths],
+            size_bytes=sum(path.stat().st_size for path in paths),
+            created=now,
+            last_used=now,
+        )
+        self._evict(index, keep=key)
+        self._write_index(index)
+        return paths
+
+    def size_mb(self) -> float:
+        return sum(entry["size_bytes"] for entry in self.read_index().values()) / 2**20
+
+    def _remove(self, index: dict[str, dict], key: str):
+        del index[key]
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+
+    def _evict(self, index: dict[str, dict], keep: str):
+        if self.max_size_mb is None:
+            return
+        size_bytes = sum(entry["size_bytes"] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]["last_used"]):
+            if size_bytes <= self.max_size_mb * 2**20:
+                break
+            if key == keep:
+                continue
+            logger.info(f"Evicting result cache entry '{key[:12]}'")
+            size_bytes -= index[key]["size_bytes"]
+            self._remove(index, key)
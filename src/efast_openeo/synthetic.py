@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy.ndimage import binary_dilation, gaussian_filter, zoom
+
+from efast_openeo import constants
+from efast_openeo.constants import S2Scl, S3SynCloudFlags
+
+S2_RESOLUTION_M = 10
+
+S2_DATA_BANDS = ["B02", "B03", constants.NDVI_RED_BAND, constants.NDVI_NIR_BAND]
+S3_DATA_BANDS = [
+    "Syn_Oa04_reflectance",
+    "Syn_Oa06_reflectance",
+    "Syn_Oa08_reflectance",
+    "Syn_Oa17_reflectance",
+]
+
+CLOUD_PATTERNS = ["blobs", "speckle", "none"]
+
+# reflectance of bare soil and of dense vegetation for the (blue, green, red, NIR) bands
+_SOIL_REFLECTANCE = np.array([0.08, 0.11, 0.15, 0.25])
+_VEGETATION_REFLECTANCE = np.array([0.03, 0.07, 0.04, 0.45])
+_CLOUD_REFLECTANCE = 0.7
+
+
+def synthetic_cubes(
+    n_s3_pixels: tuple[int, int] = (8, 8),
+    *,
+    temporal_extent: tuple[str, str] = ("2022-06-01", "2022-08-01"),
+    s2_revisit_days: int = 5,
+    s3_revisit_days: int = 1,
+    s2_bands: list[str] | None = None,
+    s3_bands: list[str] | None = None,
+    cloud_fraction: float = 0.3,
+    cloud_pattern: str = "blobs",
+    cloud_size_m: float = 2000,
+    s2_resolution_m: float = S2_RESOLUTION_M,
+    dtype: str = "float32",
+    seed: int = 0,
+) -> tuple[xr.DataArray, xr.DataArray]:
+    """
+    Generate a pair of synthetic Sentinel-2 (L2A) and Sentinel-3 (SYN L2 SYN) cubes of the same area, e.g. for
+    benchmarks and tests without access to an openEO backend.
+
+    Both cubes are arrays of dimensions (t, bands, y, x) with the band names of the openEO collections, the
+    S2 cube has ``s2_bands`` and the ``constants.S2_FLAG_BAND`` (SCL) band, the S3 cube has ``s3_bands`` and the
+    ``constants.S3_FLAG_BAND`` band. The S3 grid has ``n_s3_pixels`` (y, x) pixels of
+    ``constants.S3_RESOLUTION_M``, the S2 grid covers the same area with pixels of ``s2_resolution_m`` (which must
+    divide the S3 resolution). Coordinates are in metres, as in a projected coordinate reference system.
+
+    The surface is a smooth random mixture of soil and vegetation with a seasonal vegetation cycle, the S3
+    reflectances are the averages of the S2 reflectances. Matching S2 and S3 bands (``i``-th band of each) share
+    the same surface reflectance.
+
+    Each acquisition (every ``s2_revisit_days`` / ``s3_revisit_days`` days in ``temporal_extent``, end exclusive)
+    is covered by clouds with a fraction of ``cloud_fraction`` of its pixels. ``cloud_pattern`` (one of
+    ``CLOUD_PATTERNS``) selects spatially correlated clouds of about ``cloud_size_m`` (``"blobs"``), independent
+    pixels (``"speckle"``) or no clouds (``"none"``). Clouds are drawn independently for each acquisition.
+    Cloudy pixels are bright in all bands and flagged in the SCL (high probability cloud, with a cloud shadow
+    next to each cloud) and ``CLOUD_flags`` (cloud, cloud margin around clouds) bands.
+
+    :return: ``(s2_cube, s3_cube)``
+    """
+    assert cloud_pattern in CLOUD_PATTERNS, (
+        f"Unknown cloud pattern '{cloud_pattern}', must be one of {CLOUD_PATTERNS}"
+    )
+    s2_bands = s2_bands or S2_DATA_BANDS
+    s3_bands = s3_bands or S3_DATA_BANDS
+    assert len(s2_bands) == len(s3_bands), (
+        f"The S2 and S3 bands must match, found {s2_bands=} and {s3_bands=}"
+    )
+    factor = constants.S3_RESOLUTION_M / s2_resolution_m
+    assert factor == int(factor), (
+        f"The S2 resolution must divide the S3 resolution, found {s2_resolution_m=}"
+    )
+    factor = int(factor)
+    rng = np.random.default_rng(seed)
+    n_s2_pixels = (n_s3_pixels[0] * factor, n_s3_pixels[1] * factor)
+
+    t_s2 = _acquisition_times(temporal_extent, s2_revisit_days)
+    t_s3 = _acquisition_times(temporal_extent, s3_revisit_days)
+    # fraction of vegetation cover and its seasonal amplitude
+    vegetation = _smooth_field(rng, n_s2_pixels, 1000 / s2_resolution_m)
+    amplitude = _smooth_field(rng, n_s2_pixels, 3000 / s2_resolution_m)
+
+    n_bands = len(s2_bands)
+    soil = _band_reflectance(_SOIL_REFLECTANCE, n_bands)[:, None, None]
+    canopy = _band_reflectance(_VEGETATION_REFLECTANCE, n_bands)[:, None, None]
+
+    def reflectance(t, shape):
+        # computed per day, to bound the memory to the size of the output
+        season = 0.5 - 0.5 * np.cos(2 * np.pi * (t.dayofyear.values - 100) / 365)
+        data = np.empty((len(t), n_bands, *shape), dtype=dtype)
+        for i, season_i in enumerate(season):
+            cover = np.clip(vegetation + amplitude * season_i, 0, 1)
+            if shape != n_s2_pixels:
+                cover = cover.reshape(shape[0], factor, shape[1], factor).mean(
+                    axis=(1, 3)
+                )
+            data[i] = (1 - cover) * soil + cover * canopy
+        return data
+
+    s2_clouds = _clouds(
+        rng,
+        len(t_s2),
+        n_s2_pixels,
+        cloud_fraction,
+        cloud_pattern,
+        cloud_size_m / s2_resolution_m,
+    )
+    s2_data = reflectance(t_s2, n_s2_pixels)
+    s2_data[np.broadcast_to(s2_clouds[:, np.newaxis], s2_data.shape)] = (
+        _CLOUD_REFLECTANCE
+    )
+    scl = np.where(
+        rng.uniform(size=n_s2_pixels) < 0.5, S2Scl.VEGETATION, S2Scl.NOT_VEGETATED
+    )
+    scl = np.broadcast_to(scl, s2_clouds.shape).copy()
+    # shadows are cast next to the clouds
+    shadow_offset = max(1, int(round(cloud_size_m / 4 / s2_resolution_m)))
+    scl[np.roll(s2_clouds, shadow_offset, axis=(1, 2))] = S2Scl.CLOUD_SHADOW
+    scl[s2_clouds] = S2Scl.CLOUD_HIGH
+    s2_cube = _cube(
+        np.concatenate([s2_data, scl[:, np.newaxis].astype(dtype)], axis=1),
+        t_s2,
+        [*s2_bands, constants.S2_FLAG_BAND],
+        n_s2_pixels,
+        s2_resolution_m,
+    )
+
+    s3_clouds = _clouds(
+        rng,
+        len(t_s3),
+        n_s3_pixels,
+        cloud_fraction,
+        cloud_pattern,
+        cloud_size_m / constants.S3_RESOLUTION_M,
+    )
+    s3_data = reflectance(t_s3, n_s3_pixels)
+    s3_data[np.broadcast_to(s3_clouds[:, np.newaxis], s3_data.shape)] = (
+        _CLOUD_REFLECTANCE
+    )
+    margin = np.stack([binary_dilation(c) for c in s3_clouds]) & ~s3_clouds
+    flags = np.full(s3_clouds.shape, S3SynCloudFlags.CLEAR, dtype=np.uint8)
+    flags[margin] = S3SynCloudFlags.CLOUD_MARGIN
+    flags[s3_clouds] = S3SynCloudFlags.CLOUD
+    s3_cube = _cube(
+        np.concatenate([s3_data, flags[:, np.newaxis].astype(dtype)], axis=1),
+        t_s3,
+        [*s3_bands, constants.S3_FLAG_BAND],
+        n_s3_pixels,
+        constants.S3_RESOLUTION_M,
+    )
+    return s2_cube, s3_cube
+
+
+def _acquisition_times(temporal_extent, revisit_days) -> pd.DatetimeIndex:
+    return pd.date_range(
+        temporal_extent[0],
+        temporal_extent[1],
+        freq=f"{revisit_days}D",
+        inclusive="left",
+    )
+
+
+def _smooth_field(rng, shape, sigma_pixels) -> np.ndarray:
+    """
+    Spatially correlated random field with values in [0, 1].
+    """
+    field = _smooth_noise(rng, shape, sigma_pixels)
+    field -= field.min()
+    return field / max(field.max(), np.finfo(field.dtype).tiny)
+
+
+def _smooth_noise(rng, shape, sigma_pixels) -> np.ndarray:
+    """
+    Gaussian noise smoothed with a gaussian kernel of ``sigma_pixels`` pixels. Large kernels are applied to
+    noise on a coarser grid, which is then interpolated linearly to ``shape``, so that the cost does not grow with
+    the kernel size.
+    """
+    step = max(1, int(sigma_pixels // 2))
+    coarse_shape = tuple(n // step + 2 for n in shape)
+    noise = gaussian_filter(rng.normal(size=coarse_shape), sigma_pixels / step)
+    if step == 1:
+        return noise[tuple(slice(n) for n in shape)]
+    return zoom(noise, step, order=1)[tuple(slice(n) for n in shape)]
+
+
+def _band_reflectance(reflectance: np.ndarray, n_bands: int) -> np.ndarray:
+    """
+    Reflectance of ``n_bands`` bands, interpolated from the (blue, green, red, NIR) reflectances.
+    """
+    if n_bands == len(reflectance):
+        return reflectance
+    return np.interp(
+        np.linspace(0, len(reflectance) - 1, n_bands),
+        np.arange(len(reflectance)),
+        reflectance,
+    )
+
+
+def _clouds(rng, n_t, shape, cloud_fraction, cloud_pattern, cloud_size_pixels):
+    """
+    Cloud masks of ``n_t`` acquisitions, each with a fraction of ``cloud_fraction`` cloudy pixels.
+    """
+    if cloud_pattern == "none" or cloud_fraction <= 0:
+        return np.zeros((n_t, *shape), dtype=bool)
+    if cloud_pattern == "blobs":
+        noise = np.stack(
+            [_smooth_noise(rng, shape, cloud_size_pixels / 2) for _ in range(n_t)]
+        )
+    else:
+        noise = rng.uniform(size=(n_t, *shape))
+    # threshold each acquisition at its quantile, so that the cloud fraction is exact
+    threshold = np.quantile(noise, 1 - cloud_fraction, axis=(1, 2), keepdims=True)
+    return noise > threshold
+
+
+def _cube(data, t, bands, shape, resolution_m) -> xr.DataArray:
+    x = (np.arange(shape[1]) + 0.5) * resolution_m
+    y = (np.arange(shape[0]) + 0.5)[::-1] * resolution_m
+    return xr.DataArray(
+        data,
+        dims=["t", "bands", "y", "x"],
+        coords={"t": t, "bands": bands, "y": y, "x": x},
+    )
@@ -5,6 +5,7 @@ import json
 
 import pytest
 import openeo
+from openeo.internal.graph_building import PGNode
 import pandas as pd
 
 
@@ -159,3 +160,48 @@ def overlap_size_pixels() -> int:
 @pytest.fixture()
 def dtc_max_distance() -> float:
     return 400
+
+
+class OfflineConnection:
+    """
+    Builds ``load_collection`` nodes without a backend (and without collection metadata), to test process graphs
+    offline.
+    """
+
+    def describe_collection(self, collection_id):
+        return {}
+
+    def load_collection(self, collection_id, **kwargs):
+        return openeo.DataCube.load_collection(collection_id, connection=None, **kwargs)
+
+    def load_stac_from_job(self, job, bands=None):
+        # without fetching the STAC metadata of the results
+        url = f"https://offline.invalid/jobs/{job}/results"
+        return openeo.DataCube(PGNode("load_stac", url=url, bands=bands))
+
+
+@pytest.fixture
+def offline_connection():
+    return OfflineConnection()
+
+
+@pytest.fixture
+def efast_parameters(aoi_bounding_box):
+    return dict(
+        max_distance_to_cloud_m=5000,
+        temporal_extent=["2022-06-01", "2022-07-01"],
+        bbox=aoi_bounding_box,
+        s3_data_bands=["Syn_Oa08_reflectance", "Syn_Oa17_reflectance"],
+        s2_data_bands=["B04", "B8A"],
+        fused_band_names=None,
+        output_dir=".",
+        save_intermediates=False,
+        synchronous=False,
+        skip_intermediates=[],
+        file_format="netcdf",
+        cloud_tolerance_percentage=0.05,
+        temporal_extent_target=None,
+        interval_days=5,
+        temporal_score_stddev=5,
+        output_ndvi=False,
+    )
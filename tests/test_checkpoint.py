@@ -0,0 +1,173 @@
+import json
+from itertools import count
+
+import pytest
+
+from efast_openeo.checkpoint import StageCheckpoints, checkpoint_key
+from efast_openeo.efast import IntermediateRegistry, efast_openeo
+
+
+class SigningConnection:
+    """
+    Loads job results from URLs with a different signature on every call, as the canonical links of job results.
+    """
+
+    def __init__(self, offline_connection):
+        self.offline_connection = offline_connection
+        self.signatures = count()
+
+    def load_stac_from_job(self, job, bands=None):
+        cube = self.offline_connection.load_stac_from_job(job, bands=bands)
+        cube.result_node().arguments["url"] += f"?signature={next(self.signatures)}"
+        return cube
+
+
+def _cube(offline_connection, bands=("B04",)):
+    return offline_connection.load_collection("SENTINEL2_L2A", bands=list(bands)).apply(
+        lambda x: x * 2
+    )
+
+
+def test_checkpoint_key(offline_connection):
+    key = checkpoint_key(_cube(offline_connection), "s2_s3_aggregate")
+
+    assert key == checkpoint_key(_cube(offline_connection), "s2_s3_aggregate")
+    assert key != checkpoint_key(_cube(offline_connection), "s2_distance_score")
+    assert key != checkpoint_key(
+        _cube(offline_connection, bands=("B8A",)), "s2_s3_aggregate"
+    )
+    assert key != checkpoint_key(
+        _cube(offline_connection), "s2_s3_aggregate", {"backend": "other"}
+    )
+
+
+def test_resume_from_checkpoint(offline_connection, tmp_path):
+    index_path = tmp_path / "checkpoints.json"
+    checkpoints = StageCheckpoints(
+        offline_connection, index_path, stages=["s2_distance_score"]
+    )
+    cube = _cube(offline_connection)
+    key = checkpoint_key(cube, "s2_distance_score", checkpoints.parameters)
+    index_path.write_text(
+        json.dumps({key: {"stage": "s2_distance_score", "job_id": "j-1"}})
+    )
+
+    resumed = checkpoints.checkpoint(cube, "s2_distance_score")
+
+    (node,) = resumed.flat_graph().values()
+    assert node["process_id"] == "load_stac"
+    assert "j-1" in node["arguments"]["url"]
+    # stages which are not checkpointed are not modified
+    assert checkpoints.checkpoint(cube, "s2_s3_aggregate") is cube
+
+
+def test_keys_of_later_stages_are_stable_across_runs(offline_connection, tmp_path):
+    index_path = tmp_path / "checkpoints.json"
+    stages = ["s2_distance_score", "s2_s3_aggregate"]
+    cube = _cube(offline_connection)
+    key = checkpoint_key(
+        cube, "s2_distance_score", StageCheckpoints(None, index_path).parameters
+    )
+    index_path.write_text(
+        json.dumps({key: {"stage": "s2_distance_score", "job_id": "j-1"}})
+    )
+
+    connection = SigningConnection(offline_connection)
+    later_keys = []
+    for _ in range(2):
+        checkpoints = StageCheckpoints(connection, index_path, stages)
+        resumed = checkpoints.checkpoint(cube, "s2_distance_score")
+        later = resumed.apply(lambda x: x + 1)
+        later_keys.append(
+            checkpoint_key(
+                later,
+                "s2_s3_aggregate",
+                checkpoints.parameters,
+                checkpoints.stac_urls,
+            )
+        )
+
+    assert next(connection.signatures) == 2
+    assert later_keys[0] == later_keys[1]
+
+
+def test_efast_openeo_without_checkpointed_stages(
+    offline_connection, efast_parameters, tmp_path
+):
+    checkpoints = StageCheckpoints(offline_connection, tmp_path / "c.json", stages=[])
+
+    cube = efast_openeo(offline_connection, **efast_parameters, checkpoints=checkpoints)
+
+    assert (
+        cube.flat_graph()
+        == efast_openeo(offline_connection, **efast_parameters).flat_graph()
+    )
+
+
+class ResumedCheckpoints(StageCheckpoints):
+    """
+    Checkpoints of which all stages were computed by an earlier run.
+    """
+
+    def read_index(self):
+        return _AllCheckpoints()
+
+
+class _AllCheckpoints(dict):
+    def get(self, key, default=None):
+        return {"stage": "any", "job_id": f"j-{key[:8]}"}
+
+
+def test_efast_openeo_rejects_intermediates_before_checkpoints(
+    offline_connection, efast_parameters, tmp_path
+):
+    checkpoints = ResumedCheckpoints(offline_connection, tmp_path / "c.json")
+    intermediates = IntermediateRegistry(tmp_path, "netcdf", synchronous=False)
+
+    with pytest.raises(ValueError, match="s2_bands"):
+        efast_openeo(
+            offline_connection,
+            **efast_parameters,
+            intermediates=intermediates,
+            checkpoints=checkpoints,
+        )
+
+
+def test_resumed_graph_does_not_load_collections(
+    offline_connection, efast_parameters, tmp_path
+):
+    all_intermediates = IntermediateRegistry(tmp_path, "netcdf", synchronous=False)
+    efast_openeo(
+        offline_connection, **efast_parameters, intermediates=all_intermediates
+    )
+    # only the intermediates after the last checkpointed stage are saved
+    after_checkpoints = ["s2_s3_aggregate", "fusion_input"]
+    intermediates = IntermediateRegistry(
+        tmp_path,
+        "netcdf",
+        synchronous=False,
+        to_skip=set(all_intermediates.saved) - set(after_checkpoints),
+    )
+    checkpoints = ResumedCheckpoints(offline_connection, tmp_path / "c.json")
+
+    fused = efast_openeo(
+        offline_connection,
+        **efast_parameters,
+        intermediates=intermediates,
+        checkpoints=checkpoints,
+    )
+
+    assert intermediates.saved == after_checkpoints
+    process_ids = [
+        node["process_id"]
+        for node in intermediates.result(fused, connection=offline_connection)
+        .flat_graph()
+        .values()
+    ]
+    assert "load_stac" in process_ids
+    assert "load_collection" not in process_ids
+
+
+def test_unknown_stage(tmp_path):
+    with pytest.raises(ValueError, match="fused"):
+        StageCheckpoints(None, tmp_path / "c.json", stages=["fused"])
@@ -0,0 +1,145 @@
+import openeo
+import pytest
+
+from efast_openeo.data_loading import load_and_scale
+from efast_openeo.efast import IntermediateRegistry, efast_openeo
+from efast_openeo.graph_optimizer import optimize_flat_graph
+
+
+class ScaledConnection:
+    """
+    Offline connection with the scale factor and offset of the reflectance bands (``x * 0.0001 + 0``).
+    """
+
+    def describe_collection(self, collection_id):
+        return {"summaries": {"eo:bands": [{"scale": 0.0001, "offset": 0}]}}
+
+    def load_collection(self, collection_id, **kwargs):
+        return openeo.DataCube.load_collection(collection_id, connection=None, **kwargs)
+
+
+def _callback(node):
+    return node["arguments"]["process"]["process_graph"]
+
+
+def _cube(bands=("B04",)):
+    return openeo.DataCube.load_collection(
+        "SENTINEL2_L2A", connection=None, bands=list(bands)
+    )
+
+
+def test_constant_folding():
+    cube = load_and_scale(ScaledConnection(), collection_id="SENTINEL2_L2A")
+
+    graph, report = optimize_flat_graph(cube.flat_graph())
+
+    # ``(x + 0) * 0.0001`` becomes ``x * 0.0001``
+    (callback_node,) = _callback(graph["apply1"]).values()
+    assert callback_node["process_id"] == "multiply"
+    assert callback_node["arguments"] == {"x": {"from_parameter": "x"}, "y": 0.0001}
+    assert callback_node["result"]
+    assert report["folded_constants"] == 1
+
+
+@pytest.mark.parametrize(
+    "factor, removed", [(1, True), (1.0, False)], ids=["int", "float"]
+)
+def test_identity_apply_is_removed(factor, removed):
+    # multiplying with 1.0 may be used to convert the data type, and is kept
+    cube = (_cube() * factor).merge_cubes(_cube(bands=("B8A",)))
+
+    graph, report = optimize_flat_graph(cube.flat_graph())
+
+    assert ("apply1" not in graph) == removed
+    assert report["removed_identity_applies"] == int(removed)
+    assert graph["mergecubes1"]["arguments"]["cube1"] == {
+        "from_node": "loadcollection1" if removed else "apply1"
+    }
+
+
+@pytest.mark.parametrize("band", [False, True])
+def test_identity_before_save_result_is_kept(band):
+    cube = _cube()
+    cube = (cube.band("B04") if band else cube) * 1
+    cube = cube.save_result(format="netCDF")
+
+    graph, report = optimize_flat_graph(cube.flat_graph())
+
+    assert graph == cube.flat_graph()
+    assert report["removed_identity_applies"] == 0
+
+
+def test_adjacent_applies_are_fused():
+    cube = _cube().apply(lambda x: x * 3).apply(lambda x: x + 2)
+
+    graph, report = optimize_flat_graph(cube.flat_graph())
+
+    assert report["fused_applies"] == 1
+    assert report["process_counts_before"]["apply"] == 2
+    assert report["process_counts_after"]["apply"] == 1
+    (apply_node,) = [node for node in graph.values() if node["process_id"] == "apply"]
+    assert apply_node["result"]
+    assert apply_node["arguments"]["data"] == {"from_node": "loadcollection1"}
+    callback = _callback(apply_node)
+    assert callback["multiply1"]["arguments"]["x"] == {"from_parameter": "x"}
+    assert callback["add1"]["arguments"] == {"x": {"from_node": "multiply1"}, "y": 2}
+    assert callback["add1"]["result"] and "result" not in callback["multiply1"]
+
+
+def test_shared_apply_is_not_fused():
+    scaled = _cube().apply(lambda x: x * 3)
+    cube = scaled.apply(lambda x: x + 2).merge_cubes(scaled)
+
+    _, report = optimize_flat_graph(cube.flat_graph())
+
+    assert report["fused_applies"] == 0
+
+
+def test_common_subexpressions_are_merged():
+    # two ``load_collection`` nodes with the same arguments, and the identical nodes computed from them
+    cube = _cube().apply(lambda x: x * 3).merge_cubes(_cube().apply(lambda x: x * 3))
+
+    graph, report = optimize_flat_graph(cube.flat_graph())
+
+    assert report["nodes_before"] == 5
+    assert report["merged_nodes"] == 2
+    assert report["nodes_after"] == 3
+    assert (
+        graph["mergecubes1"]["arguments"]["cube1"]
+        == graph["mergecubes1"]["arguments"]["cube2"]
+    )
+
+
+def test_dead_branches_are_removed():
+    graph = _cube().apply(lambda x: x * 3).flat_graph()
+    graph["unused"] = {
+        "process_id": "apply",
+        "arguments": {"data": {"from_node": "loadcollection1"}},
+    }
+
+    graph, report = optimize_flat_graph(graph)
+
+    assert "unused" not in graph
+    assert report["removed_dead_nodes"] == 1
+
+
+def test_optimize_efast_graph(efast_parameters):
+    connection = ScaledConnection()
+    intermediates = IntermediateRegistry(
+        ".", "netcdf", synchronous=False, to_skip=["s2_distance_to_cloud"]
+    )
+    fused = efast_openeo(connection, **efast_parameters, intermediates=intermediates)
+    flat_graph = intermediates.result(fused, connection=connection).flat_graph()
+
+    graph, report = optimize_flat_graph(flat_graph)
+
+    # the offsets of the S2 and S3 bands, but not ``s2_flags * 1`` before its ``save_result``
+    assert report["folded_constants"] == 2
+    # the computation of the S3 distance score and its clipping
+    assert report["fused_applies"] == 1
+    assert report["nodes_after"] == report["nodes_before"] - 1
+    assert (
+        report["process_counts_after"]["save_result"]
+        == report["process_counts_before"]["save_result"]
+    )
+    assert set(graph) == set(flat_graph) - {"apply5"}
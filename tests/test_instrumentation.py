@@ -0,0 +1,248 @@
+import inspect
+import logging
+import pstats
+import types
+
+import numpy as np
+import pytest
+import xarray as xr
+from openeo.udf.run_code import load_module_from_string
+
+from efast_openeo.algorithms.udf import (
+    udf_code,
+    udf_distance_transform,
+    udf_fusion,
+    udf_temporal_interpolation,
+    udf_temporal_score_aggregate,
+)
+from efast_openeo.efast import efast_openeo
+from efast_openeo.instrumentation import (
+    RECORD_PREFIX,
+    aggregate_udf_records,
+    instrumentation_context,
+    parse_udf_records,
+)
+
+UDFS = [
+    udf_distance_transform,
+    udf_fusion,
+    udf_temporal_interpolation,
+    udf_temporal_score_aggregate,
+]
+
+
+def _composite_input():
+    rng = np.random.default_rng(0)
+    t = xr.date_range("2022-09-01", periods=10, freq="D")
+    data = rng.uniform(size=(len(t), 3, 4, 5))
+    data[:, 0][rng.uniform(size=(len(t), 4, 5)) < 0.3] = np.nan
+    cube = xr.DataArray(
+        data,
+        dims=["t", "bands", "y", "x"],
+        coords={"t": t, "bands": ["B02", "B03", "distance_score"]},
+    )
+    context = dict(
+        temporal_extent_input=["2022-09-01", "2022-09-11"],
+        temporal_extent_target=None,
+        interval_days=2,
+        sigma_doy=5,
+    )
+    return cube, context
+
+
+def _records(caplog):
+    return parse_udf_records(record.getMessage() for record in caplog.records)
+
+
+@pytest.mark.parametrize("udf", UDFS)
+def test_udfs_share_record_prefix_and_signature(udf):
+    assert udf.INSTRUMENTATION_RECORD_PREFIX == RECORD_PREFIX
+    # the backend selects the UDF entry point by the annotations of its signature
+    parameters = inspect.signature(udf.apply_datacube).parameters
+    assert parameters["cube"].annotation in (
+        xr.DataArray,
+        udf_distance_transform.XarrayDataCube,
+    )
+
+
+@pytest.mark.parametrize("udf", UDFS)
+def test_udf_code_inlines_common_helpers(udf):
+    code = udf_code(udf.__file__)
+    assert "import efast_openeo" not in code and "from efast_openeo" not in code
+
+    module = types.ModuleType(udf.__name__)
+    exec(compile(code, udf.__name__, "exec"), module.__dict__)
+    assert module.INSTRUMENTATION_RECORD_PREFIX == RECORD_PREFIX
+    assert module.UDF_NAME == udf.__name__.rsplit(".udf_", 1)[1]
+    assert callable(module.apply_datacube)
+
+
+def test_instrumented_udf_logs_record(caplog):
+    cube, context = _composite_input()
+    expected = udf_temporal_score_aggregate.apply_datacube(cube, context)
+
+    with caplog.at_level(logging.INFO):
+        composite = udf_temporal_score_aggregate.apply_datacube(
+            cube,
+            {**context, "instrumentation": instrumentation_context("s3_composite")},
+        )
+
+    xr.testing.assert_equal(composite, expected)
+    (record,) = _records(caplog)
+    assert record["stage"] == "s3_composite"
+    assert record["input_shape"] == [10, 3, 4, 5]
+    assert record["output_shape"] == [5, 2, 4, 5]
+    assert record["output_dims"] == ["t", "bands", "y", "x"]
+    assert record["input_dtype"] == record["output_dtype"] == "float64"
+    assert record["wall_time_s"] > 0
+    # the peak memory of the invocation includes the composite (0.8 kB), not the memory of the worker process
+    assert composite.nbytes / 2**20 <= record["peak_memory_mb"] < 10
+    assert record["worker_max_rss_mb"] > record["peak_memory_mb"]
+
+
+def test_udf_without_instrumentation_logs_nothing(caplog):
+    cube, context = _composite_input()
+
+    with caplog.at_level(logging.INFO):
+        udf_temporal_score_aggregate.apply_datacube(cube, context)
+        # the time series passed as the complete context cannot enable the instrumentation
+        udf_temporal_interpolation.apply_datacube(cube, cube.indexes["t"][::2])
+
+    assert _records(caplog) == []
+
+
+def test_instrumented_udf_dumps_profile(caplog, tmp_path):
+    mask = xr.DataArray(
+        np.random.default_rng(0).uniform(size=(2, 8, 8)) < 0.1, dims=["t", "y", "x"]
+    )
+    context = {
+        "output": "distance_score",
+        "max_distance_score": 3,
+        "instrumentation": instrumentation_context("s3_distance_score", tmp_path),
+    }
+
+    with caplog.at_level(logging.INFO):
+        udf_distance_transform.apply_datacube(
+            udf_distance_transform.XarrayDataCube(mask), context
+        )
+
+    (record,) = _records(caplog)
+    assert record["input_dtype"] == "bool"
+    stats = pstats.Stats(record["profile"])
+    assert any(name == "distance_transform_2d" for _, _, name in stats.stats.keys())
+
+
+def test_parse_and_aggregate_records():
+    logs = [
+        {"message": "unrelated"},
+        {"message": f"{RECORD_PREFIX} not json"},
+        *(
+            {
+                "message": f'{RECORD_PREFIX} {{"stage": "{stage}", "udf": "u", "wall_time_s": {wall_time}, '
+                f'"input_shape": [2, 3], "input_dtype": "float32", "output_shape": [1, 3], '
+                f'"output_dtype": "float32", "peak_memory_mb": {memory}, "worker_max_rss_mb": {rss}}}'
+            }
+            for stage, wall_time, memory, rss in [
+                ("a", 1, 10, 100),
+                ("b", 3, 20, 50),
+                ("b", 5, 5, 70),
+            ]
+        ),
+        f"2025-01-01 [INFO] {RECORD_PREFIX} "
+        '{"stage": "a", "udf": "u", "wall_time_s": 1, "input_shape": [2, 3], "input_dtype": "float32", '
+        '"output_shape": [1, 3], "output_dtype": "float32", "peak_memory_mb": null, "worker_max_rss_mb": null}',
+    ]
+
+    records = parse_udf_records(logs)
+    table = aggregate_udf_records(records)
+
+    assert len(records) == 4
+    assert list(table.stage) == ["b", "a"]
+    assert list(table.invocations) == [2, 2]
+    assert list(table.wall_time_total_s) == [8, 2]
+    assert list(table.wall_time_max_s) == [5, 1]
+    assert np.allclose(table.wall_time_share, [0.8, 0.2])
+    assert list(table.peak_memory_max_mb) == [20, 10]
+    assert list(table.worker_max_rss_mb) == [70, 100]
+    assert table.input_shape[0] == "2x3"
+    assert aggregate_udf_records([]).empty
+
+
+def test_shipped_udf_records_are_aggregated(caplog):
+    # the backend executes the shipped code without a module name
+    module = load_module_from_string(udf_code(udf_distance_transform.__file__))
+    mask = xr.DataArray(
+        np.random.default_rng(0).uniform(size=(2, 8, 8)) < 0.1, dims=["t", "y", "x"]
+    )
+    context = {
+        "output": "distance_score",
+        "max_distance_score": 3,
+        "instrumentation": instrumentation_context("s3_distance_score"),
+    }
+
+    with caplog.at_level(logging.INFO):
+        module["apply_datacube"](module["XarrayDataCube"](mask), context)
+
+    records = _records(caplog)
+    (record,) = records
+    assert record["udf"] == "distance_transform"
+    (row,) = aggregate_udf_records(records).itertuples()
+    assert (row.stage, row.udf, row.invocations) == (
+        "s3_distance_score",
+        "distance_transform",
+        1,
+    )
+
+
+def test_aggregate_records_without_udf_name():
+    record = dict(
+        stage="a",
+        udf=None,
+        wall_time_s=1,
+        input_shape=[2, 3],
+        input_dtype="float32",
+        output_shape=[1, 3],
+        output_dtype="float32",
+    )
+
+    table = aggregate_udf_records([record, record])
+
+    assert list(table.stage) == ["a"]
+    assert list(table.invocations) == [2]
+
+
+def _udf_contexts(cube):
+    contexts = []
+    for node in cube.flat_graph().values():
+        if node["process_id"] in ("apply_dimension", "apply_neighborhood"):
+            contexts.append(node["arguments"].get("context", {}))
+    return contexts
+
+
+@pytest.mark.parametrize("instrument_udfs", [False, True])
+def test_efast_openeo_instrumentation_context(
+    offline_connection, efast_parameters, instrument_udfs
+):
+    cube = efast_openeo(
+        offline_connection,
+        **efast_parameters,
+        instrument_udfs=instrument_udfs,
+        udf_profile_dir="/tmp/profiles" if instrument_udfs else None,
+    )
+
+    stages = [
+        context["instrumentation"]["stage"]
+        for context in _udf_contexts(cube)
+        if isinstance(context, dict) and "instrumentation" in context
+    ]
+    if instrument_udfs:
+        assert sorted(stages) == [
+            "fusion",
+            "s2_distance_score",
+            "s2_s3_aggregate",
+            "s3_composite",
+            "s3_composite_target_interp",
+            "s3_distance_score",
+        ]
+    else:
+        assert stages == []
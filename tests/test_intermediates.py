@@ -0,0 +1,95 @@
+from collections import Counter
+
+import openeo
+import pytest
+
+from efast_openeo.efast import IntermediateRegistry, efast_openeo
+
+
+def _process_counts(graph) -> Counter:
+    return Counter(node["process_id"] for node in graph.flat_graph().values())
+
+
+def _saved_names(graph) -> list:
+    return sorted(
+        node["arguments"]["options"]["filename_prefix"]
+        for node in graph.flat_graph().values()
+        if node["process_id"] == "save_result"
+    )
+
+
+def test_registry_collects_intermediates_in_single_graph(
+    offline_connection, efast_parameters
+):
+    intermediates = IntermediateRegistry(
+        ".",
+        "netcdf",
+        synchronous=False,
+        # skipping the distances to cloud computes the same stages as without intermediates
+        to_skip=["s2_cloud_flags", "s3_distance_to_cloud", "s2_distance_to_cloud"],
+    )
+
+    fused = efast_openeo(
+        offline_connection, **efast_parameters, intermediates=intermediates
+    )
+    result = intermediates.result(fused, connection=offline_connection)
+
+    assert isinstance(result, openeo.MultiResult)
+    assert "s2_cloud_flags" not in intermediates.save_results
+    assert _saved_names(result) == sorted(["fused", *intermediates.save_results])
+    assert len(intermediates.save_results) == 17
+    # the intermediates share the nodes of the final result, each stage is computed once
+    counts = _process_counts(result)
+    expected_counts = _process_counts(
+        efast_openeo(offline_connection, **efast_parameters)
+    )
+    assert counts["save_result"] == len(intermediates.save_results) + 1
+    assert counts - Counter({"save_result": counts["save_result"]}) == expected_counts
+    assert counts["load_collection"] == 3
+
+
+def test_registry_without_intermediates_returns_final_result(
+    offline_connection, efast_parameters
+):
+    intermediates = IntermediateRegistry(
+        ".", "netcdf", synchronous=False, skip_all=True
+    )
+
+    fused = efast_openeo(
+        offline_connection, **efast_parameters, intermediates=intermediates
+    )
+    result = intermediates.result(fused, connection=offline_connection)
+
+    assert not isinstance(result, openeo.MultiResult)
+    assert _saved_names(result) == ["fused"]
+
+
+@pytest.mark.parametrize("skip_all", [False, True])
+def test_registry_skips(skip_all):
+    intermediates = IntermediateRegistry(
+        ".", "netcdf", synchronous=False, to_skip={"a"}, skip_all=skip_all
+    )
+
+    assert intermediates.skips("a")
+    assert intermediates.skips("b") == skip_all
+
+
+def test_saved_distances_to_cloud_are_not_bounded(offline_connection, efast_parameters):
+    intermediates = IntermediateRegistry(".", "netcdf", synchronous=False)
+
+    fused = efast_openeo(
+        offline_connection, **efast_parameters, intermediates=intermediates
+    )
+    result = intermediates.result(fused, connection=offline_connection)
+
+    assert {"s3_distance_to_cloud", "s2_distance_to_cloud"} <= set(
+        intermediates.save_results
+    )
+    contexts = [
+        node["arguments"]["context"]
+        for node in result.flat_graph().values()
+        if node["process_id"] == "apply_neighborhood"
+    ]
+    assert len(contexts) == 2
+    # a bounded distance transform would save inf beyond the bound
+    assert all(context["max_distance"] is None for context in contexts)
@@ -0,0 +1,186 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from efast_openeo import constants
+from efast_openeo.constants import S2Scl
+from efast_openeo.local import (
+    distance_score,
+    efast_local,
+    load_cube,
+    resample_average,
+    resample_nearest,
+    save_intermediate,
+)
+
+S2_PIXEL_SIZE = 100
+S3_PIXEL_SIZE = constants.S3_RESOLUTION_M
+
+
+def _grid(n_pixels, pixel_size):
+    x = np.arange(n_pixels) * pixel_size + pixel_size / 2
+    return {"y": x[::-1], "x": x}
+
+
+def _synthetic_inputs(n_s3_pixels=6, seed=0):
+    """
+    Cloudy S2 and S3 time series of a landscape which does not change over time. The S3 data is the average of
+    the S2 data.
+    """
+    rng = np.random.default_rng(seed)
+    factor = S3_PIXEL_SIZE // S2_PIXEL_SIZE
+    n_s2_pixels = n_s3_pixels * factor
+    s2_bands = ["B04", "B8A"]
+    s3_bands = ["Syn_Oa08_reflectance", "Syn_Oa17_reflectance"]
+
+    t_s2 = xr.date_range("2022-09-01", periods=8, freq="5D")
+    landscape = rng.uniform(0.05, 0.5, size=(len(s2_bands), n_s2_pixels, n_s2_pixels))
+    scl = np.full((len(t_s2), n_s2_pixels, n_s2_pixels), S2Scl.VEGETATION)
+    scl[2, :8, :8] = S2Scl.CLOUD_HIGH
+    scl[5, 4:, 6:] = S2Scl.CLOUD_SHADOW
+    s2 = xr.DataArray(
+        np.concatenate(
+            [np.broadcast_to(landscape, (len(t_s2), *landscape.shape)), scl[:, None]],
+            axis=1,
+        ),
+        dims=["t", "bands", "y", "x"],
+        coords={
+            "t": t_s2,
+            "bands": s2_bands + [constants.S2_FLAG_BAND],
+            **_grid(n_s2_pixels, S2_PIXEL_SIZE),
+        },
+    )
+
+    t_s3 = xr.date_range("2022-09-01", periods=40, freq="D")
+    coarse = landscape.reshape(
+        len(s2_bands), n_s3_pixels, factor, n_s3_pixels, factor
+    ).mean(axis=(2, 4))
+    s3_clouds = rng.uniform(size=(len(t_s3), 1, n_s3_pixels, n_s3_pixels)) < 0.2
+    s3_data = np.where(s3_clouds, np.nan, coarse)
+    s3 = xr.DataArray(
+        s3_data,
+        dims=["t", "bands", "y", "x"],
+        coords={"t": t_s3, "bands": s3_bands, **_grid(n_s3_pixels, S3_PIXEL_SIZE)},
+    )
+    return s2, s3, landscape
+
+
+def _run(s2, s3, **kwargs):
+    parameters = dict(
+        max_distance_to_cloud_m=600,
+        temporal_extent=["2022-09-01", "2022-10-11"],
+        s3_data_bands=["Syn_Oa08_reflectance", "Syn_Oa17_reflectance"],
+        s2_data_bands=["B04", "B8A"],
+        fused_band_names=None,
+        cloud_tolerance_percentage=0.05,
+        # covers all S2 observations, so that S3 can be interpolated to all of them
+        temporal_extent_target=["2022-09-01", "2022-10-10"],
+        interval_days=3,
+        temporal_score_stddev=constants.S2_TEMPORAL_SCORE_STDDEV,
+        output_ndvi=False,
+    )
+    return efast_local(s2, s3, **{**parameters, **kwargs})
+
+
+def test_resample_average_equals_block_mean():
+    cube = xr.DataArray(
+        np.random.default_rng(0).uniform(size=(2, 12, 12)),
+        dims=["t", "y", "x"],
+        coords={"t": [0, 1], **_grid(12, S2_PIXEL_SIZE)},
+    )
+    like = xr.DataArray(
+        np.zeros((4, 4)), dims=["y", "x"], coords=_grid(4, S3_PIXEL_SIZE)
+    )
+
+    resampled = resample_average(cube, like)
+
+    assert resampled.dims == ("t", "y", "x")
+    assert np.allclose(resampled, cube.coarsen(y=3, x=3).mean())
+    assert (resampled.y == like.y).all() and (resampled.x == like.x).all()
+
+
+def test_resample_nearest_repeats_coarse_pixels():
+    coarse = xr.DataArray(
+        np.arange(16.0).reshape(4, 4), dims=["y", "x"], coords=_grid(4, S3_PIXEL_SIZE)
+    )
+    like = xr.DataArray(
+        np.zeros((12, 12)), dims=["y", "x"], coords=_grid(12, S2_PIXEL_SIZE)
+    )
+
+    resampled = resample_nearest(coarse, like)
+
+    assert np.array_equal(resampled, coarse.values.repeat(3, axis=0).repeat(3, axis=1))
+    assert (resampled.y == like.y).all() and (resampled.x == like.x).all()
+
+
+def test_efast_local_reconstructs_static_landscape():
+    s2, s3, landscape = _synthetic_inputs()
+
+    fused = _run(s2, s3)
+
+    assert fused.dims == ("t", "bands", "y", "x")
+    assert list(fused.bands.values) == ["B04", "B8A"]
+    assert len(fused.t) == 13
+    assert fused.t[0] == np.datetime64("2022-09-01")
+    valid = np.isfinite(fused.values)
+    assert valid.mean() > 0.9
+    # S3 does not change over time, so the fusion reproduces the S2 composite
+    expected = np.broadcast_to(landscape, fused.shape)
+    assert np.allclose(fused.values[valid], expected[valid])
+
+
+def test_efast_local_ndvi():
+    s2, s3, landscape = _synthetic_inputs()
+
+    ndvi = _run(s2, s3, output_ndvi=True, dtype="float32")
+
+    assert list(ndvi.bands.values) == ["ndvi"]
+    assert ndvi.dtype == np.float32
+    nir, red = landscape[1], landscape[0]
+    expected = np.broadcast_to((nir - red) / (nir + red), ndvi.isel(bands=0).shape)
+    valid = np.isfinite(ndvi.isel(bands=0).values)
+    assert np.allclose(ndvi.isel(bands=0).values[valid], expected[valid], atol=1e-5)
+
+
+def test_saved_intermediate_can_be_loaded(tmp_path):
+    s2, _, _ = _synthetic_inputs()
+
+    save_intermediate(s2, "s2_bands", tmp_path, to_skip=["s2_cloud_mask"])
+    save_intermediate(s2, "s2_cloud_mask", tmp_path, to_skip=["s2_cloud_mask"])
+
+    assert not (tmp_path / "s2_cloud_mask.nc").exists()
+    loaded = load_cube(tmp_path / "s2_bands.nc")
+    xr.testing.assert_allclose(loaded, s2)
+
+
+@pytest.mark.parametrize("output_ndvi", [False, True])
+def test_chunked_efast_local_equals_eager_efast_local(output_ndvi):
+    pytest.importorskip("dask")
+    s2, s3, _ = _synthetic_inputs(n_s3_pixels=8)
+
+    expected = _run(s2, s3, output_ndvi=output_ndvi)
+    fused = _run(s2, s3, output_ndvi=output_ndvi, chunk_size_pixels=12)
+
+    assert fused.chunks is not None
+    assert len(fused.chunks[2]) > 1
+    xr.testing.assert_allclose(fused.compute(), expected)
+
+
+def test_chunked_distance_score_equals_full_raster_distance_score():
+    pytest.importorskip("dask")
+    rng = np.random.default_rng(0)
+    cloud_mask = xr.DataArray(
+        rng.uniform(size=(3, 40, 50)) < 0.02,
+        dims=["t", "y", "x"],
+        coords={"t": xr.date_range("2022-09-01", periods=3, freq="D")},
+    )
+    cloud_mask[1] = False
+
+    expected = distance_score(cloud_mask, max_distance_score_pixels=5)
+    score = distance_score(
+        cloud_mask.chunk({"t": 1, "y": 16, "x": 16}),
+        max_distance_score_pixels=5,
+        halo_pixels=6,
+    )
+
+    xr.testing.assert_allclose(score.compute(), expected)
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from efast_openeo.data_loading import load_and_scale
+from efast_openeo.metadata_cache import (
+    DEFAULT_BACKEND_URL,
+    CachedMetadataConnection,
+    CollectionMetadataCache,
+)
+
+BACKEND_URL = "https://openeo.invalid/"
+
+
+def _metadata(collection_id, bands=("B04", "B8A", "SCL")):
+    return {
+        "id": collection_id,
+        "cube:dimensions": {
+            "x": {"type": "spatial", "axis": "x"},
+            "y": {"type": "spatial", "axis": "y"},
+            "t": {"type": "temporal"},
+            "bands": {"type": "bands", "values": list(bands)},
+        },
+        "summaries": {
+            "eo:bands": [{"name": b, "scale": 0.5, "offset": -2} for b in bands]
+        },
+    }
+
+
+class CountingConnection:
+    root_url = BACKEND_URL
+
+    def __init__(self):
+        self.describe_calls = []
+
+    def describe_collection(self, collection_id):
+        self.describe_calls.append(collection_id)
+        return _metadata(collection_id)
+
+
+def test_cache_ttl(tmp_path):
+    cache = CollectionMetadataCache(tmp_path, ttl_s=60)
+    cache.put(BACKEND_URL, "SENTINEL2_L2A", _metadata("SENTINEL2_L2A"))
+
+    assert cache.get(BACKEND_URL, "SENTINEL2_L2A") == _metadata("SENTINEL2_L2A")
+    assert cache.get(DEFAULT_BACKEND_URL, "SENTINEL2_L2A") is None
+
+    cache.ttl_s = 0
+    time.sleep(0.01)
+    assert cache.get(BACKEND_URL, "SENTINEL2_L2A") is None
+    assert cache.get(BACKEND_URL, "SENTINEL2_L2A", allow_expired=True) is not None
+
+
+def test_metadata_is_fetched_once(tmp_path):
+    backend = CountingConnection()
+    connection = CachedMetadataConnection(backend, CollectionMetadataCache(tmp_path))
+
+    for _ in range(2):
+        load_and_scale(connection, collection_id="SENTINEL2_L2A", bands=["B04", "B8A"])
+    # a new connection (next run) uses the persisted metadata
+    CachedMetadataConnection(
+        backend, CollectionMetadataCache(tmp_path)
+    ).describe_collection("SENTINEL2_L2A")
+
+    assert backend.describe_calls == ["SENTINEL2_L2A"]
+    assert connection.root_url == BACKEND_URL
+
+
+def test_offline_graph_building(tmp_path):
+    cache = CollectionMetadataCache(tmp_path, ttl_s=0)
+    connection = CachedMetadataConnection(None, cache, backend_url=BACKEND_URL)
+
+    with pytest.raises(LookupError, match="SENTINEL2_L2A"):
+        connection.describe_collection("SENTINEL2_L2A")
+
+    cache.put(BACKEND_URL, "SENTINEL2_L2A", _metadata("SENTINEL2_L2A"))
+    cube = load_and_scale(connection, collection_id="SENTINEL2_L2A", bands=["B8A"])
+
+    assert cube.metadata.band_names == ["B8A"]
+    graph = cube.flat_graph()
+    (apply_node,) = [node for node in graph.values() if node["process_id"] == "apply"]
+    callback = apply_node["arguments"]["process"]["process_graph"]
+    assert {"x": {"from_parameter": "x"}, "y": -2} in [
+        node["arguments"] for node in callback.values()
+    ]
+    with pytest.raises(AttributeError, match="offline"):
+        connection.create_job
@@ -0,0 +1,112 @@
+import pytest
+
+from efast_openeo.efast import IntermediateRegistry, efast_openeo
+from efast_openeo.result_cache import ResultCache, result_key
+
+
+def _write(path, size_bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"0" * size_bytes)
+    return path
+
+
+def _result(offline_connection, efast_parameters, **overrides):
+    fused = efast_openeo(
+        offline_connection,
+        **{**efast_parameters, **overrides},
+        intermediates=IntermediateRegistry(".", "netcdf", False, skip_all=True),
+    )
+    return fused.save_result(format="netcdf")
+
+
+def test_result_key(offline_connection, efast_parameters):
+    key = result_key(_result(offline_connection, efast_parameters))
+
+    assert key == result_key(_result(offline_connection, efast_parameters))
+    assert key != result_key(
+        _result(offline_connection, efast_parameters, interval_days=10)
+    )
+    assert key != result_key(
+        _result(offline_connection, efast_parameters), {"backend": "other"}
+    )
+
+
+def test_result_key_replaces_checkpoint_urls(offline_connection):
+    def result(job_id):
+        # the URL of the results of a checkpoint job (signed, different for each run)
+        loaded = offline_connection.load_stac_from_job(job_id)
+        return loaded.save_result(format="netcdf")
+
+    stac_urls = {
+        "https://offline.invalid/jobs/j-1/results": "checkpoint:a",
+        "https://offline.invalid/jobs/j-2/results": "checkpoint:a",
+    }
+
+    assert result_key(result("j-1")) != result_key(result("j-2"))
+    assert result_key(result("j-1"), stac_urls=stac_urls) == result_key(
+        result("j-2"), stac_urls=stac_urls
+    )
+
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    download = _write(tmp_path / "download" / "fused.nc", 10)
+
+    assert cache.get("a") is None
+    (path,) = cache.put("a", "j-1", [download])
+
+    assert path.parent == cache.entry_dir("a")
+    assert cache.get("a") == [path]
+    assert cache.read_index()["a"]["job_id"] == "j-1"
+    assert ResultCache(tmp_path / "cache").get("a") == [path]
+
+
+def test_compute(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+
+    (path,) = cache.compute(
+        "a", lambda directory: ("j-1", [_write(directory / "f", 10)])
+    )
+
+    assert cache.get("a") == [path]
+    assert cache.read_index()["a"]["job_id"] == "j-1"
+
+
+def test_failed_compute_removes_entry(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+
+    def execute(directory):
+        _write(directory / "partial.nc", 10)
+        raise RuntimeError("job failed")
+
+    with pytest.raises(RuntimeError):
+        cache.compute("a", execute)
+
+    assert not cache.entry_dir("a").exists()
+    assert cache.get("a") is None
+
+
+def test_incomplete_entry_is_removed(tmp_path):
+    cache = ResultCache(tmp_path)
+    (path,) = cache.put("a", "j-1", [_write(cache.entry_dir("a") / "fused.nc", 10)])
+    path.unlink()
+
+    assert cache.get("a") is None
+    assert "a" not in cache.read_index()
+
+
+@pytest.mark.parametrize("used_first", ["a", "b"])
+def test_least_recently_used_entries_are_evicted(tmp_path, used_first):
+    cache = ResultCache(tmp_path, max_size_mb=2.5)
+    for key in ["a", "b"]:
+        cache.put(key, key, [_write(tmp_path / "download" / key, 2**20)])
+    # "a" was put first, but is used more recently if it is read after "b"
+    for key in sorted(["a", "b"], key=lambda k: k != used_first):
+        cache.get(key)
+
+    cache.put("c", "c", [_write(tmp_path / "download" / "c", 2**20)])
+
+    evicted = used_first
+    assert sorted(cache.read_index()) == sorted({"a", "b", "c"} - {evicted})
+    assert not cache.entry_dir(evicted).exists()
+    assert cache.size_mb() == 2
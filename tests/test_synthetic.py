@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from efast_openeo import constants
+from efast_openeo.constants import S2Scl
+from efast_openeo.local import efast_local
+from efast_openeo.synthetic import (
+    S2_DATA_BANDS,
+    S3_DATA_BANDS,
+    synthetic_cubes,
+)
+
+
+def test_synthetic_cubes_shape_and_bands():
+    s2, s3 = synthetic_cubes(
+        (4, 5), temporal_extent=("2022-06-01", "2022-06-21"), s2_resolution_m=20
+    )
+
+    assert s2.dims == s3.dims == ("t", "bands", "y", "x")
+    assert s2.shape == (4, len(S2_DATA_BANDS) + 1, 60, 75)
+    assert s3.shape == (20, len(S3_DATA_BANDS) + 1, 4, 5)
+    assert list(s2.bands.values) == [*S2_DATA_BANDS, constants.S2_FLAG_BAND]
+    assert list(s3.bands.values) == [*S3_DATA_BANDS, constants.S3_FLAG_BAND]
+    # both grids cover the same area
+    assert s2.x.min() - 10 == s3.x.min() - 150
+    assert s2.y.max() + 10 == s3.y.max() + 150
+
+
+@pytest.mark.parametrize("cloud_pattern", ["blobs", "speckle"])
+@pytest.mark.parametrize("cloud_fraction", [0.1, 0.5])
+def test_synthetic_cloud_fraction(cloud_pattern, cloud_fraction):
+    s2, s3 = synthetic_cubes(
+        (10, 10),
+        s2_resolution_m=50,
+        cloud_fraction=cloud_fraction,
+        cloud_pattern=cloud_pattern,
+    )
+
+    s2_clouds = s2.sel(bands=constants.S2_FLAG_BAND) == S2Scl.CLOUD_HIGH
+    s3_clouds = s3.sel(bands=constants.S3_FLAG_BAND) == constants.S3SynCloudFlags.CLOUD
+    assert np.isclose(s2_clouds.mean(), cloud_fraction, atol=0.01)
+    assert np.isclose(s3_clouds.mean(), cloud_fraction, atol=0.01)
+
+
+def test_synthetic_s3_is_average_of_s2():
+    s2, s3 = synthetic_cubes((3, 3), s2_resolution_m=50, cloud_pattern="none", seed=3)
+
+    s2_data = s2.sel(bands=S2_DATA_BANDS).coarsen(y=6, x=6).mean()
+    s3_data = s3.sel(t=s2.t, bands=S3_DATA_BANDS)
+    assert np.allclose(s2_data, s3_data, atol=1e-6)
+    assert (s2.sel(bands=constants.S2_FLAG_BAND) < S2Scl.UNCLASSIFIED).all()
+    assert (s3.sel(bands=constants.S3_FLAG_BAND) == 0).all()
+
+
+def test_synthetic_cubes_are_reproducible():
+    first = synthetic_cubes((3, 3), s2_resolution_m=100, seed=1)
+    second = synthetic_cubes((3, 3), s2_resolution_m=100, seed=1)
+    other = synthetic_cubes((3, 3), s2_resolution_m=100, seed=2)
+
+    assert all(a.equals(b) for a, b in zip(first, second))
+    assert not first[0].equals(other[0])
+
+
+def test_synthetic_cubes_run_through_local_chain():
+    s2, s3 = synthetic_cubes(
+        (8, 8), s2_resolution_m=100, cloud_fraction=0.1, cloud_size_m=600
+    )
+
+    fused = efast_local(
+        s2,
+        s3,
+        max_distance_to_cloud_m=600,
+        temporal_extent=["2022-06-01", "2022-08-01"],
+        s3_data_bands=S3_DATA_BANDS,
+        s2_data_bands=S2_DATA_BANDS,
+        fused_band_names=None,
+        cloud_tolerance_percentage=0.05,
+        # covers all S2 observations, so that S3 can be interpolated to all of them
+        temporal_extent_target=["2022-06-01", "2022-08-01"],
+        interval_days=5,
+        temporal_score_stddev=constants.S2_TEMPORAL_SCORE_STDDEV,
+        output_ndvi=True,
+    )
+
+    assert fused.shape == (13, 1, 24, 24)
+    ndvi = fused.values
+    assert np.isfinite(ndvi).all()
+    # clouds are masked, the NDVI of the surface is positive
+    assert (ndvi > 0).all()
@@ -3,14 +3,72 @@ from scipy.ndimage import distance_transform_edt
 
 import xarray as xr
 import numpy as np
+from efast_openeo.algorithms.udf import udf_temporal_score_aggregate
 from efast_openeo.algorithms.udf.udf_temporal_score_aggregate import (
     compute_temporal_score,
+    compute_banded_temporal_score,
+    _compute_normalized_composite_banded,
+    _compute_normalized_composite_sliding_window,
     compute_combined_score,
     _compute_combined_score_no_intermediates,
+    _compute_normalized_composite,
+    _spatial_tiles,
     apply_datacube,
 )
 
 
+def _compute_normalized_composite_einsum(distance_score, temporal_score, bands):
+    """
+    Reference implementation of the composite, materializing the combined score for every
+    target time stamp, input time stamp and pixel.
+    """
+    score = np.einsum("tyx,Tt->Ttyx", distance_score, temporal_score)
+    score_masked = np.where(np.isnan(bands[:, 0, ...]), 0, score)
+
+    normalization_flat = np.sum(score_masked, axis=1)
+    normalization = normalization_flat[:, np.newaxis, ...]
+    score_normalized = score_masked / normalization
+
+    finite_bands = np.where(np.isfinite(bands), bands, 0)
+    weighted_composite = np.einsum("Ttyx,tbyx->Tbyx", score_normalized, finite_bands)
+
+    no_data_mask = (normalization_flat == 0)[:, np.newaxis, ...] | (
+        weighted_composite <= 0
+    )
+    return np.where(no_data_mask, np.nan, weighted_composite)
+
+
+def _random_composite_inputs(n_t=9, n_bands=3, n_y=6, n_x=7, seed=0):
+    rng = np.random.default_rng(seed)
+    t = xr.date_range("2022-09-01", periods=n_t, freq="3D")
+    t_target = xr.date_range("2022-09-01", periods=2 * n_t, freq="D")
+    temporal_score = compute_temporal_score(t, t_target, 5)
+
+    distance_score = rng.uniform(0, 1, size=(n_t, n_y, n_x))
+    distance_score[rng.uniform(size=distance_score.shape) < 0.2] = 0
+    bands = rng.uniform(-0.1, 1, size=(n_t, n_bands, n_y, n_x))
+    bands[rng.uniform(size=bands.shape) < 0.2] = np.nan
+    # a pixel without any observation
+    bands[:, 0, 0, 0] = np.nan
+    return t, t_target, temporal_score, distance_score, bands
+
+
+def _random_composite_cube():
+    t, t_target, _, distance_score, bands = _random_composite_inputs()
+    band_names = [f"band{i}" for i in range(bands.shape[1])]
+    cube = xr.DataArray(
+        np.concatenate([bands, distance_score[:, np.newaxis]], axis=1),
+        dims=["t", "bands", "y", "x"],
+        coords={"t": t, "bands": band_names + ["distance_score"]},
+    )
+    context = {
+        "temporal_extent_input": [str(t[0].date()), str(t_target[-1].date())],
+        "interval_days": 1,
+        "sigma_doy": 5,
+    }
+    return cube, context
+
+
 def test_temporal_score_shape():
     t_start = "2022-09-01"
     t_end = "2022-09-30"
@@ -153,3 +211,246 @@ def test_composite_masking():
         composite.sum(dim="t").isel(bands=0), composite.sizes["t"], atol=0.1
     )
     assert (nan_mask | close_to_number_of_time_steps).all()
+
+
+def test_factorized_composite_equals_einsum_reference():
+    _, _, temporal_score, distance_score, bands = _random_composite_inputs()
+    temporal_score = temporal_score.transpose("t_target", "t")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expected = _compute_normalized_composite_einsum(
+            distance_score, temporal_score.values, bands
+        )
+    composite = _compute_normalized_composite(
+        distance_score, temporal_score.values, bands
+    )
+
+    assert composite.shape == expected.shape
+    assert np.array_equal(np.isnan(composite), np.isnan(expected))
+    assert np.allclose(composite, expected, equal_nan=True)
+
+
+def test_banded_temporal_score_matches_dense_score():
+    t = xr.date_range("2022-01-01", "2022-12-31", freq="3D")
+    t_target = xr.date_range("2022-01-01", "2022-12-31", freq="10D")
+    sigma_doy, truncate = 10, 4
+
+    dense = compute_temporal_score(t, t_target, sigma_doy).transpose("t_target", "t")
+    banded = compute_banded_temporal_score(t, t_target, sigma_doy, truncate)
+
+    assert len(banded.weights) == len(t_target)
+    for i, (start, stop, weights) in enumerate(
+        zip(banded.starts, banded.stops, banded.weights)
+    ):
+        assert np.allclose(weights, dense.values[i, start:stop])
+        # everything outside the band is below the truncation threshold
+        outside = np.concatenate([dense.values[i, :start], dense.values[i, stop:]])
+        assert (outside < np.exp(-0.5 * truncate**2)).all()
+    assert (banded.stops - banded.starts).max() < len(t) / 4
+
+
+def test_banded_composite_equals_dense_composite():
+    cube, context = _random_composite_cube()
+
+    dense = apply_datacube(cube, context)
+    # a truncation radius larger than the time series yields the dense result
+    banded_full = apply_datacube(cube, {**context, "temporal_score_truncate": 100})
+    banded = apply_datacube(cube, {**context, "temporal_score_truncate": 4})
+
+    assert banded_full.dims == dense.dims
+    assert (banded_full.t == dense.t).all()
+    assert np.allclose(banded_full, dense, equal_nan=True)
+    # the truncated weights are below exp(-8), the composites only differ slightly
+    assert np.allclose(banded, dense, equal_nan=True, atol=1e-2)
+
+
+@pytest.mark.parametrize("max_tile_pixels", [1, 3, 7, 15, 100])
+def test_spatial_tiles_cover_raster(max_tile_pixels):
+    n_y, n_x = 6, 7
+    covered = np.zeros((n_y, n_x), dtype=int)
+    for y_slice, x_slice in _spatial_tiles(n_y, n_x, max_tile_pixels):
+        assert covered[y_slice, x_slice].size <= max_tile_pixels
+        covered[y_slice, x_slice] += 1
+    assert (covered == 1).all()
+
+
+@pytest.mark.parametrize("truncate", [None, 4])
+@pytest.mark.parametrize("memory_budget_mb", [1e-4, 1e-2, 100])
+def test_tiled_composite_equals_untiled_composite(truncate, memory_budget_mb):
+    cube, context = _random_composite_cube()
+    context["temporal_score_truncate"] = truncate
+
+    untiled = apply_datacube(cube, context)
+    tiled = apply_datacube(cube, {**context, "memory_budget_mb": memory_budget_mb})
+
+    assert tiled.dims == untiled.dims
+    assert (tiled.t == untiled.t).all()
+    assert (tiled.bands == untiled.bands).all()
+    assert np.array_equal(np.isnan(tiled.values), np.isnan(untiled.values))
+    assert np.allclose(tiled, untiled, equal_nan=True, rtol=1e-12, atol=0)
+
+
+def test_composite_with_leading_dimensions_equals_per_slice_composite():
+    t, _, temporal_score, distance_score, bands = _random_composite_inputs()
+    n_groups = 3
+    distance_score = xr.DataArray(distance_score, dims=["t", "y", "x"], coords={"t": t})
+    grouped_bands = xr.DataArray(
+        np.stack([bands * (i + 1) for i in range(n_groups)]),
+        dims=["group", "t", "bands", "y", "x"],
+        coords={"t": t},
+    )
+
+    composite = _compute_combined_score_no_intermediates(
+        distance_score, temporal_score, grouped_bands
+    )
+
+    assert composite.dims == ("group", "t_target", "bands", "y", "x")
+    for i in range(n_groups):
+        expected = _compute_combined_score_no_intermediates(
+            distance_score, temporal_score, grouped_bands.isel(group=i)
+        )
+        assert np.allclose(composite.isel(group=i), expected, equal_nan=True)
+
+
+@pytest.mark.parametrize("truncate", [None, 2])
+def test_numba_composite_equals_numpy_composite(truncate):
+    pytest.importorskip("numba")
+    cube, context = _random_composite_cube()
+    context["temporal_score_truncate"] = truncate
+
+    expected = apply_datacube(cube, {**context, "engine": "numpy"})
+    composite = apply_datacube(cube, {**context, "engine": "numba"})
+
+    assert composite.dims == expected.dims
+    assert (composite.t == expected.t).all()
+    assert np.array_equal(np.isnan(composite), np.isnan(expected))
+    assert np.allclose(composite, expected, equal_nan=True)
+
+
+def test_numba_composite_keeps_temporal_score_banded(monkeypatch):
+    pytest.importorskip("numba")
+    cube, context = _random_composite_cube()
+    # a gap in the input time series, leaving target time stamps without inputs
+    cube = cube.isel(t=[i for i in range(cube.sizes["t"]) if not 3 <= i < 9])
+    context = {**context, "temporal_score_truncate": 0.3}
+    calls = []
+
+    def compute_normalized_composite_numba(*args, **kwargs):
+        calls.append(kwargs)
+        return compute_normalized_composite(*args, **kwargs)
+
+    compute_normalized_composite = (
+        udf_temporal_score_aggregate._compute_normalized_composite_numba
+    )
+    monkeypatch.setattr(
+        udf_temporal_score_aggregate,
+        "_compute_normalized_composite_numba",
+        compute_normalized_composite_numba,
+    )
+    expected = apply_datacube(cube, {**context, "engine": "numpy"})
+    composite = apply_datacube(cube, {**context, "engine": "numba"})
+
+    (kwargs,) = calls
+    assert len(kwargs["weights"]) == (kwargs["stops"] - kwargs["starts"]).sum()
+    assert len(kwargs["weights"]) < len(composite.t) * cube.sizes["t"]
+    assert np.isnan(expected).any()
+    assert np.array_equal(np.isnan(composite), np.isnan(expected))
+    assert np.allclose(composite, expected, equal_nan=True)
+
+
+@pytest.mark.parametrize("mosaic_days", [4, 10, 1000])
+def test_sliding_window_composite_equals_banded_composite(mosaic_days):
+    cube, context = _random_composite_cube()
+    truncate = mosaic_days / 2 / context["sigma_doy"]
+
+    expected = apply_datacube(cube, {**context, "temporal_score_truncate": truncate})
+    composite = apply_datacube(
+        cube, {**context, "engine": "sliding_window", "mosaic_days": mosaic_days}
+    )
+
+    assert composite.dims == expected.dims
+    assert (composite.t == expected.t).all()
+    assert np.array_equal(np.isnan(composite), np.isnan(expected))
+    assert np.allclose(composite, expected, equal_nan=True)
+    if mosaic_days == 1000:
+        dense = apply_datacube(cube, context)
+        assert np.allclose(composite, dense, equal_nan=True)
+
+
+@pytest.mark.parametrize("engine", ["numpy", "numba"])
+def test_mosaic_days_limits_the_window_of_all_engines(engine):
+    if engine == "numba":
+        pytest.importorskip("numba")
+    cube, context = _random_composite_cube()
+    mosaic_days = 4
+
+    expected = apply_datacube(
+        cube, {**context, "engine": "sliding_window", "mosaic_days": mosaic_days}
+    )
+    composite = apply_datacube(
+        cube, {**context, "engine": engine, "mosaic_days": mosaic_days}
+    )
+    dense = apply_datacube(cube, {**context, "engine": engine})
+
+    assert np.array_equal(np.isnan(composite), np.isnan(expected))
+    assert np.allclose(composite, expected, equal_nan=True)
+    assert not np.allclose(composite, dense, equal_nan=True)
+
+
+def test_sliding_window_composite_with_leading_dimensions():
+    t, t_target, _, distance_score, bands = _random_composite_inputs()
+    temporal_score = compute_banded_temporal_score(t, t_target, 5, 1)
+    bands = np.stack([bands, 2 * bands])
+
+    composite = _compute_normalized_composite_sliding_window(
+        distance_score, bands, temporal_score
+    )
+
+    for i in range(len(bands)):
+        expected = _compute_normalized_composite_banded(
+            distance_score, bands[i], temporal_score
+        )
+        assert np.allclose(composite[i], expected, equal_nan=True)
+
+
+def test_numba_engine_falls_back_to_numpy(monkeypatch):
+    cube, context = _random_composite_cube()
+    monkeypatch.setattr(udf_temporal_score_aggregate, "numba", None)
+
+    expected = apply_datacube(cube, context)
+    composite = apply_datacube(cube, {**context, "engine": "numba"})
+
+    assert np.array_equal(composite, expected, equal_nan=True)
+
+
+@pytest.mark.parametrize("engine", ["numpy", "numba"])
+@pytest.mark.parametrize("truncate", [None, 4])
+def test_float32_composite_matches_float64_composite(engine, truncate):
+    if engine == "numba":
+        pytest.importorskip("numba")
+    cube, context = _random_composite_cube()
+    context = {**context, "engine": engine, "temporal_score_truncate": truncate}
+
+    expected = apply_datacube(cube, {**context, "dtype": "float64"})
+    composite = apply_datacube(cube, {**context, "dtype": "float32"})
+
+    assert expected.dtype == np.float64
+    assert composite.dtype == np.float32
+    assert np.array_equal(np.isnan(composite), np.isnan(expected))
+    assert np.allclose(composite, expected, equal_nan=True, rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("truncate", [None, 4])
+def test_time_axis_is_cached_across_chunks(truncate):
+    cube, context = _random_composite_cube()
+    context["temporal_score_truncate"] = truncate
+    udf_temporal_score_aggregate._TIME_AXIS_CACHE.clear()
+
+    first = apply_datacube(cube, context)
+    second = apply_datacube(cube.copy(), dict(context))
+    apply_datacube(cube, {**context, "sigma_doy": 3})
+
+    cache_info = udf_temporal_score_aggregate.time_axis_cache_info()
+    assert cache_info["hits"] == 1
+    assert cache_info["misses"] == 2
+    xr.testing.assert_equal(first, second)
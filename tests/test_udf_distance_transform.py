@@ -0,0 +1,152 @@
+import numpy as np
+import xarray as xr
+from openeo.udf import XarrayDataCube
+from scipy.ndimage import distance_transform_edt
+
+from efast_openeo.algorithms.udf import udf_distance_transform
+from efast_openeo.algorithms.udf.udf_distance_transform import apply_datacube
+
+
+def _random_cloud_mask(shape=(1, 40, 30), cloud_fraction=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    return xr.DataArray(rng.uniform(size=shape) < cloud_fraction, dims=["t", "y", "x"])
+
+
+def test_distance_transform():
+    cloud_mask = _random_cloud_mask()
+
+    distance = apply_datacube(XarrayDataCube(cloud_mask), {}).get_array()
+
+    assert distance.dtype == np.float64
+    assert (distance.values == distance_transform_edt(~cloud_mask.values)).all()
+
+
+def test_float32_distance_transform_matches_float64_distance_transform():
+    cloud_mask = XarrayDataCube(_random_cloud_mask())
+
+    expected = apply_datacube(cloud_mask, {"dtype": "float64"}).get_array()
+    distance = apply_datacube(cloud_mask, {"dtype": "float32"}).get_array()
+
+    assert expected.dtype == np.float64
+    assert distance.dtype == np.float32
+    assert np.allclose(distance, expected, rtol=1e-6)
+
+
+def test_float32_distance_transform_without_clouds():
+    cloud_mask = XarrayDataCube(_random_cloud_mask(cloud_fraction=0))
+
+    distance = apply_datacube(cloud_mask, {"dtype": "float32"}).get_array()
+
+    assert distance.dtype == np.float32
+    assert np.isinf(distance).all()
+
+
+def test_bounded_distance_transform_matches_distance_transform():
+    max_distance = 4.5
+    cloud_mask = _random_cloud_mask(shape=(3, 60, 50), cloud_fraction=0.002, seed=1)
+    cloud_mask[1] = False
+    cloud_mask[2] = True
+
+    expected = np.stack(
+        [distance_transform_edt(~mask_slice) for mask_slice in cloud_mask.values]
+    )
+    expected[expected > max_distance] = np.inf
+    expected[1] = np.inf  # no clouds
+    distance = apply_datacube(
+        XarrayDataCube(cloud_mask), {"max_distance": max_distance}
+    ).get_array()
+
+    assert (distance.values == expected).all()
+    assert np.isinf(distance[1]).all()
+    assert (distance[2] == 0).all()
+
+
+def _count_transformed_pixels(monkeypatch) -> list:
+    """
+    Record the number of pixels of each ``distance_transform_edt`` call of the UDF.
+    """
+    transformed_pixels = []
+
+    def counting_distance_transform_edt(input):
+        transformed_pixels.append(input.size)
+        return distance_transform_edt(input)
+
+    monkeypatch.setattr(
+        udf_distance_transform,
+        "distance_transform_edt",
+        counting_distance_transform_edt,
+    )
+    return transformed_pixels
+
+
+def test_bounded_distance_transform_of_scattered_clouds_skips_cloud_free_tiles(
+    monkeypatch,
+):
+    max_distance = 4.5
+    cloud_mask = np.zeros((400, 400), dtype=bool)
+    # clouds in opposite corners, their bounding box is the whole image
+    cloud_mask[[3, 10, 200, 390, 396], [5, 390, 210, 4, 398]] = True
+    expected = distance_transform_edt(~cloud_mask)
+    expected[expected > max_distance] = np.inf
+
+    transformed_pixels = _count_transformed_pixels(monkeypatch)
+    distance = udf_distance_transform.distance_transform_2d(cloud_mask, max_distance)
+
+    assert (distance == expected).all()
+    # only the windows around the tiles close to the clouds are transformed
+    assert sum(transformed_pixels) < 0.05 * cloud_mask.size
+
+
+def test_bounded_distance_transform_of_dense_clouds_transforms_image_once(
+    monkeypatch,
+):
+    max_distance = 4.5
+    cloud_mask = _random_cloud_mask(shape=(1, 100, 90), cloud_fraction=0.05).values[0]
+    expected = distance_transform_edt(~cloud_mask)
+    expected[expected > max_distance] = np.inf
+
+    transformed_pixels = _count_transformed_pixels(monkeypatch)
+    distance = udf_distance_transform.distance_transform_2d(cloud_mask, max_distance)
+
+    assert (distance == expected).all()
+    assert transformed_pixels == [cloud_mask.size]
+
+
+def test_distance_transform_all_cloud():
+    cloud_mask = XarrayDataCube(_random_cloud_mask(cloud_fraction=1.1))
+
+    distance = apply_datacube(cloud_mask, {}).get_array()
+
+    assert (distance == 0).all()
+
+
+def test_multi_day_distance_transform_is_computed_per_day():
+    cloud_mask = _random_cloud_mask(shape=(16, 40, 30), cloud_fraction=0.01)
+    cloud_mask[3] = False
+
+    distance = apply_datacube(XarrayDataCube(cloud_mask), {}).get_array()
+
+    for t in range(cloud_mask.sizes["t"]):
+        if t == 3:
+            assert np.isinf(distance[t]).all()
+        else:
+            expected = distance_transform_edt(~cloud_mask[t].values)
+            assert (distance[t].values == expected).all()
+
+
+def test_distance_score_output_matches_distance_score():
+    max_distance_score = 3.5
+    cloud_mask = _random_cloud_mask(shape=(4, 40, 30), cloud_fraction=0.01)
+    cloud_mask[1] = False
+    cloud_mask[2] = True
+
+    distance = apply_datacube(XarrayDataCube(cloud_mask), {}).get_array()
+    expected = np.clip((distance - 1) / max_distance_score, 0, 1)
+    score = apply_datacube(
+        XarrayDataCube(cloud_mask),
+        {"output": "distance_score", "max_distance_score": max_distance_score},
+    ).get_array()
+
+    assert np.allclose(score, expected, rtol=0, atol=1e-12)
+    assert (score[1] == 1).all()
+    assert (score[2] == 0).all()
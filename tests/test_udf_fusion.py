@@ -3,6 +3,7 @@ from scipy.ndimage import distance_transform_edt
 
 import xarray as xr
 import numpy as np
+from efast_openeo.algorithms.fusion import select_ndvi_bands
 from efast_openeo.algorithms.udf.udf_fusion import apply_datacube, fuse
 
 
@@ -53,3 +54,139 @@ def test_fuse():
     assert all([b in target_bands for b in fused["bands"]])
     target_value = lr_interp_val + hr_m_val - lr_m_val
     assert (fused.sel(bands=target_bands) == target_value).all()
+
+
+def _fuse_per_band(
+    cube, hr_mosaic_bands, lr_mosaic_bands, lr_interpolated_bands, target_bands
+):
+    """
+    Reference implementation of ``fuse``, looping over the bands.
+    """
+    fused_list = [
+        xr.where(
+            (cube.sel(bands=lr_m) == 0)
+            | np.isnan(cube.sel(bands=lr_m))
+            | (cube.sel(bands=lr_p) == 0)
+            | np.isnan(cube.sel(bands=lr_p)),
+            cube.sel(bands=hr_m).squeeze(),
+            cube.sel(bands=[hr_m, lr_p]).sum(dim="bands")
+            - cube.sel(bands=lr_m).squeeze(),
+        )
+        for (hr_m, lr_m, lr_p) in zip(
+            hr_mosaic_bands, lr_mosaic_bands, lr_interpolated_bands
+        )
+    ]
+    fused = xr.concat(fused_list, dim="bands")
+    return fused.assign_coords(bands=target_bands)
+
+
+@pytest.mark.parametrize("shuffle_bands", [False, True])
+def test_fuse_matches_per_band_fusion(shuffle_bands):
+    t = xr.date_range("2022-09-01", "2022-09-30", freq="5D")
+    hr_mosaic_bands = ["HRM1", "HRM2", "HRM3"]
+    lr_mosaic_bands = ["LRM1", "LRM2", "LRM3"]
+    lr_interp_bands = ["LRP1", "LRP2", "LRP3"]
+    target_bands = ["TGT1", "TGT2", "TGT3"]
+    input_bands = hr_mosaic_bands + lr_mosaic_bands + lr_interp_bands
+    if shuffle_bands:
+        input_bands = list(np.random.default_rng(1).permutation(input_bands))
+
+    rng = np.random.default_rng(0)
+    data = rng.uniform(size=(len(t), len(input_bands), 4, 3))
+    data[rng.uniform(size=data.shape) < 0.2] = np.nan
+    data[rng.uniform(size=data.shape) < 0.1] = 0
+    cube = xr.DataArray(
+        data, coords={"t": t, "bands": input_bands}, dims=["t", "bands", "y", "x"]
+    )
+
+    expected = _fuse_per_band(
+        cube, hr_mosaic_bands, lr_mosaic_bands, lr_interp_bands, target_bands
+    )
+    fused = fuse(cube, hr_mosaic_bands, lr_mosaic_bands, lr_interp_bands, target_bands)
+
+    assert fused.dims == cube.dims
+    assert list(fused.bands.values) == target_bands
+    xr.testing.assert_equal(fused, expected.transpose(*cube.dims))
+
+
+def test_float32_fusion_matches_float64_fusion():
+    t = xr.date_range("2022-09-01", "2022-09-30", freq="5D")
+    hr_mosaic_bands = ["HRM1", "HRM2"]
+    lr_mosaic_bands = ["LRM1", "LRM2"]
+    rng = np.random.default_rng(0)
+    data = rng.uniform(size=(len(t), 6, 3, 2))
+    data[rng.uniform(size=data.shape) < 0.2] = np.nan
+    cube = xr.DataArray(
+        data,
+        coords={
+            "t": t,
+            "bands": hr_mosaic_bands
+            + lr_mosaic_bands
+            + [f"{b}_interp" for b in lr_mosaic_bands],
+        },
+        dims=["t", "bands", "y", "x"],
+    )
+    context = {
+        "hr_mosaic_bands": hr_mosaic_bands,
+        "lr_mosaic_bands": lr_mosaic_bands,
+        "lr_interpolated_band_name_suffix": "_interp",
+    }
+
+    expected = apply_datacube(cube, {**context, "dtype": "float64"})
+    fused = apply_datacube(cube, {**context, "dtype": "float32"})
+
+    assert expected.dtype == np.float64
+    assert fused.dtype == np.float32
+    assert np.allclose(fused, expected, equal_nan=True, rtol=1e-6, atol=1e-6)
+
+
+def test_ndvi_fuses_only_ndvi_bands():
+    t = xr.date_range("2022-09-01", "2022-09-30", freq="5D")
+    hr_mosaic_bands = ["B02", "B04", "B8A"]
+    lr_mosaic_bands = ["Oa04", "Oa08", "Oa17"]
+    rng = np.random.default_rng(0)
+    cube = xr.DataArray(
+        rng.uniform(size=(len(t), 9, 3, 2)),
+        coords={
+            "t": t,
+            "bands": hr_mosaic_bands
+            + lr_mosaic_bands
+            + [f"{b}_interp" for b in lr_mosaic_bands],
+        },
+        dims=["t", "bands", "y", "x"],
+    )
+    context = {
+        "hr_mosaic_bands": hr_mosaic_bands,
+        "lr_mosaic_bands": lr_mosaic_bands,
+        "lr_interpolated_band_name_suffix": "_interp",
+    }
+
+    fused = apply_datacube(cube, context)
+    expected = (fused.sel(bands="B8A") - fused.sel(bands="B04")) / (
+        fused.sel(bands="B8A") + fused.sel(bands="B04")
+    )
+    ndvi = apply_datacube(cube, {**context, "output_ndvi": True})
+    # only the NIR and red bands are needed
+    ndvi_only_bands = apply_datacube(
+        cube.drop_sel(bands=["B02", "Oa04", "Oa04_interp"]),
+        {
+            **context,
+            "hr_mosaic_bands": ["B04", "B8A"],
+            "lr_mosaic_bands": ["Oa08", "Oa17"],
+            "output_ndvi": True,
+        },
+    )
+
+    assert list(ndvi.bands.values) == ["ndvi"]
+    assert np.allclose(ndvi.sel(bands="ndvi"), expected)
+    xr.testing.assert_equal(ndvi, ndvi_only_bands)
+
+
+def test_select_ndvi_bands():
+    hr_bands, lr_bands, target_bands = select_ndvi_bands(
+        ["B02", "B04", "B8A"], ["Oa04", "Oa08", "Oa17"]
+    )
+
+    assert hr_bands == ["B04", "B8A"]
+    assert lr_bands == ["Oa08", "Oa17"]
+    assert target_bands == ["B04", "B8A"]
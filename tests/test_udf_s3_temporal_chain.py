@@ -0,0 +1,253 @@
+import logging
+import types
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import openeo
+import pytest
+
+from efast_openeo.algorithms.s3_temporal_chain import (
+    S2_OBSERVATION_BAND,
+    s3_temporal_chain,
+    s3_temporal_chain_udf_code,
+    select_target_time_series,
+)
+from efast_openeo.algorithms.udf import (
+    udf_s3_temporal_chain,
+    udf_temporal_interpolation,
+    udf_temporal_score_aggregate,
+)
+from efast_openeo.efast import efast_openeo
+from efast_openeo.instrumentation import instrumentation_context, parse_udf_records
+from efast_openeo.local import smooth
+from efast_openeo.smoothing import smoothing_kernel
+
+
+def _load_chain_udf() -> types.ModuleType:
+    module = types.ModuleType("udf_s3_temporal_chain")
+    exec(s3_temporal_chain_udf_code(), module.__dict__)
+    return module
+
+
+def _random_s3_cube(n_t=12, n_bands=2, n_y=8, n_x=9, seed=0):
+    rng = np.random.default_rng(seed)
+    t = xr.date_range("2022-09-01", periods=n_t, freq="2D")
+    data = rng.uniform(0, 1, size=(n_t, n_bands + 1, n_y, n_x))
+    data[:, :n_bands][rng.uniform(size=data[:, :n_bands].shape) < 0.2] = np.nan
+    band_names = [f"Oa{i:02}" for i in range(n_bands)]
+    return xr.DataArray(
+        data,
+        dims=["t", "bands", "y", "x"],
+        coords={"t": t, "bands": band_names + ["distance_score"]},
+    )
+
+
+def test_s3_temporal_chain_udf_is_self_contained():
+    code = s3_temporal_chain_udf_code()
+    assert "import efast_openeo" not in code and "from efast_openeo" not in code
+
+    chain_udf = _load_chain_udf()
+    assert chain_udf.interpolation_udf.__name__ == "udf_temporal_interpolation"
+    # the UDF called by the chain is imported as a module if the chain is not shipped
+    assert udf_s3_temporal_chain.interpolation_udf is udf_temporal_interpolation
+
+
+def _with_s2_observations(composite, s2_labels):
+    """
+    Merge the band marking the S2 time stamps into ``composite``, as ``s3_temporal_chain`` does.
+    """
+    s2_t = pd.to_datetime(s2_labels).tz_localize(None)
+    observations = xr.ones_like(composite.isel(t=0, bands=0, drop=True)).expand_dims(
+        t=s2_t, bands=[S2_OBSERVATION_BAND]
+    )
+    t_union = composite.indexes["t"].union(s2_t)
+    return xr.concat(
+        [composite.reindex(t=t_union), observations.reindex(t=t_union)], dim="bands"
+    ).transpose("t", "bands", "y", "x")
+
+
+def _apply_in_spatial_chunks(apply_datacube, cube, context, chunk_size):
+    """
+    Apply a UDF to spatial chunks of ``cube`` without overlap, as ``apply_dimension`` over ``t`` does.
+    """
+    rows = []
+    for y in range(0, len(cube.y), chunk_size):
+        row = [
+            apply_datacube(
+                cube.isel(y=slice(y, y + chunk_size), x=slice(x, x + chunk_size)),
+                context,
+            )
+            for x in range(0, len(cube.x), chunk_size)
+        ]
+        rows.append(xr.concat(row, dim="x"))
+    return xr.concat(rows, dim="y")
+
+
+def test_s3_temporal_chain_matches_separate_steps_on_several_chunks():
+    cube = _random_s3_cube(n_y=11, n_x=13)
+    # not on the target time series (every 4 days from 2022-09-03)
+    s2_labels = ["2022-09-02T00:00:00Z", "2022-09-08T00:00:00Z", "2022-09-12T00:00:00Z"]
+    context = {
+        "temporal_extent_input": ["2022-09-01", "2022-09-24"],
+        "temporal_extent_target": ["2022-09-03", "2022-09-20"],
+        "interval_days": 4,
+        "sigma_doy": 5,
+        "target_band_name_suffix": "_interpolated",
+    }
+    # the composite and the smoothing (``apply_kernel``) precede the chain UDF
+    composite = udf_temporal_score_aggregate.apply_datacube(cube, context)
+    smoothed = smooth(composite)
+
+    chain_udf = _load_chain_udf()
+    chained = _apply_in_spatial_chunks(
+        chain_udf.apply_datacube,
+        _with_s2_observations(smoothed, s2_labels),
+        context,
+        chunk_size=4,
+    )
+
+    target_interpolated = udf_temporal_interpolation.apply_datacube(smoothed, context)
+    s2_interpolated = udf_temporal_interpolation.apply_datacube(
+        smoothed, pd.to_datetime(s2_labels).tz_localize(None)
+    )
+
+    assert chained.dims == ("t", "bands", "y", "x")
+    expected_bands = ["Oa00_interpolated", "Oa01_interpolated", "Oa00", "Oa01"]
+    assert list(chained.bands.values) == expected_bands
+    assert len(chained.t) == len(target_interpolated.t) + len(s2_labels)
+    xr.testing.assert_allclose(
+        chained.sel(t=target_interpolated.t, bands=target_interpolated.bands),
+        target_interpolated,
+    )
+    xr.testing.assert_allclose(
+        chained.sel(t=s2_interpolated.t, bands=s2_interpolated.bands), s2_interpolated
+    )
+    assert (
+        chained.sel(t=s2_interpolated.t, bands=target_interpolated.bands).isnull().all()
+    )
+
+
+def test_s3_temporal_chain_graph():
+    s3_cube = openeo.DataCube.load_collection("S3", connection=None)
+    s2_flags = openeo.DataCube.load_collection("S2", connection=None).band("SCL")
+
+    chained = s3_temporal_chain(
+        s3_cube,
+        s2_cube=s2_flags,
+        temporal_extent=["2022-09-01", "2022-09-24"],
+        temporal_extent_target=None,
+        interval_days=4,
+        sigma_doy=5,
+        smoothing_kernel=smoothing_kernel(),
+        target_band_name_suffix="_interpolated",
+    )
+
+    graph = chained.flat_graph()
+    process_ids = [node["process_id"] for node in graph.values()]
+    # the composite is smoothed with ``apply_kernel`` before the chain UDF
+    assert process_ids.index("apply_kernel") < process_ids.index("merge_cubes")
+    # the S2 time stamps are merged into the cube as a band, not passed in the context
+    (add_dimension,) = [n for n in graph.values() if n["process_id"] == "add_dimension"]
+    assert add_dimension["arguments"]["label"] == S2_OBSERVATION_BAND
+    (chain_node,) = [n for n in graph.values() if n.get("result")]
+    assert chain_node["process_id"] == "apply_dimension"
+    assert "s2_labels" not in chain_node["arguments"]["context"]
+
+
+def _upstream_process_ids(graph, node_id):
+    process_ids = set()
+    nodes = [node_id]
+    while nodes:
+        node = graph[nodes.pop()]
+        process_ids.add(node["process_id"])
+        nodes.extend(
+            argument["from_node"]
+            for argument in node["arguments"].values()
+            if isinstance(argument, dict) and "from_node" in argument
+        )
+    return process_ids
+
+
+@pytest.mark.parametrize("use_s3_temporal_chain", [False, True])
+def test_s3_temporal_chain_does_not_grow_s2_aggregate_input(
+    offline_connection, efast_parameters, use_s3_temporal_chain
+):
+    fused = efast_openeo(
+        offline_connection,
+        **efast_parameters,
+        use_s3_temporal_chain=use_s3_temporal_chain,
+        instrument_udfs=True,
+    )
+
+    graph = fused.flat_graph()
+    (s2_s3_aggregate,) = [
+        node
+        for node in graph.values()
+        if node["process_id"] == "apply_dimension"
+        and "instrumentation" in node["arguments"]["context"]
+        and node["arguments"]["context"]["instrumentation"]["stage"]
+        == "s2_s3_aggregate"
+    ]
+    merge = graph[s2_s3_aggregate["arguments"]["data"]["from_node"]]
+    assert merge["process_id"] == "merge_cubes"
+    s3_input_id = merge["arguments"]["cube2"]["from_node"]
+    if use_s3_temporal_chain:
+        # the output of the chain (on the target and S2 time stamps) is restricted to the S2 time stamps
+        s3_input = graph[s3_input_id]
+        assert s3_input["process_id"] == "resample_cube_temporal"
+        target_id = s3_input["arguments"]["target"]["from_node"]
+        assert "apply_dimension" not in _upstream_process_ids(graph, target_id)
+        assert "add_dimension" in _upstream_process_ids(graph, s3_input_id)
+    else:
+        # interpolated to the S2 time stamps
+        s3_input = graph[s3_input_id]
+        assert s3_input["process_id"] == "apply_dimension"
+        labels = graph[s3_input["arguments"]["context"]["from_node"]]
+        assert labels["process_id"] == "dimension_labels"
+
+
+def test_select_target_time_series_compares_dates():
+    chained = openeo.DataCube.load_collection("S3", connection=None)
+
+    selected = select_target_time_series(
+        chained,
+        band_names=["Oa00_interpolated"],
+        temporal_extent=["2022-09-01", "2022-09-24"],
+        temporal_extent_target=["2022-09-03", "2022-09-20"],
+        interval_days=4,
+    )
+
+    graph = selected.flat_graph()
+    (filter_temporal,) = [
+        n for n in graph.values() if n["process_id"] == "filter_temporal"
+    ]
+    assert filter_temporal["arguments"]["extent"] == ["2022-09-03", "2022-09-20"]
+    (filter_labels,) = [n for n in graph.values() if n["process_id"] == "filter_labels"]
+    condition = filter_labels["arguments"]["condition"]["process_graph"]
+    (date_difference,) = [
+        n for n in condition.values() if n["process_id"] == "date_difference"
+    ]
+    assert date_difference["arguments"]["date1"] == "2022-09-03"
+    assert date_difference["arguments"]["unit"] == "day"
+
+
+def test_s3_temporal_chain_instrumentation_records_chain_only(caplog):
+    cube = _random_s3_cube().drop_sel(bands="distance_score")
+    context = {
+        "temporal_extent_input": ["2022-09-01", "2022-09-24"],
+        "temporal_extent_target": ["2022-09-03", "2022-09-20"],
+        "interval_days": 4,
+        "target_band_name_suffix": "_interpolated",
+        "instrumentation": instrumentation_context("s3_temporal_chain"),
+    }
+    cube = _with_s2_observations(cube, ["2022-09-02T00:00:00Z"])
+
+    with caplog.at_level(logging.INFO):
+        _load_chain_udf().apply_datacube(cube, context)
+
+    records = parse_udf_records(record.getMessage() for record in caplog.records)
+    # the interpolation steps within the chain are not recorded separately
+    assert [(record["udf"], record["stage"]) for record in records] == [
+        ("s3_temporal_chain", "s3_temporal_chain")
+    ]
@@ -2,7 +2,11 @@ import pytest
 
 import xarray as xr
 import numpy as np
-from efast_openeo.algorithms.udf.udf_temporal_interpolation import apply_datacube
+from efast_openeo.algorithms.udf.udf_temporal_interpolation import (
+    _TIME_AXIS_CACHE,
+    apply_datacube,
+    time_axis_cache_info,
+)
 
 
 def test_temporal_interpolation_shape():
@@ -42,3 +46,100 @@ def test_temporal_interpolation_shape():
     assert (interpolated.t == t_target).all()
     assert np.isclose(interpolated.isel(bands=0), band0[0]).all()
     assert np.logical_not(np.isclose(interpolated.isel(bands=1), data[0, 1]).all())
+
+
+def test_float32_interpolation_matches_float64_interpolation():
+    t = xr.date_range("2022-09-01", "2022-09-30", freq="3D")
+    rng = np.random.default_rng(0)
+    cube = xr.DataArray(
+        rng.uniform(size=(len(t), 2, 3, 4)),
+        dims=["t", "bands", "y", "x"],
+        coords={"t": t, "bands": ["b1", "b2"]},
+    )
+    context = dict(temporal_extent_target=["2022-09-01", "2022-09-28"], interval_days=2)
+
+    expected = apply_datacube(cube, {**context, "dtype": "float64"})
+    interpolated = apply_datacube(cube, {**context, "dtype": "float32"})
+
+    assert expected.dtype == np.float64
+    assert interpolated.dtype == np.float32
+    assert np.allclose(interpolated, expected, equal_nan=True, rtol=1e-6)
+
+
+@pytest.mark.parametrize("nan_fraction", [0, 0.3])
+def test_interpolation_matches_xarray_interpolation(nan_fraction):
+    t = xr.date_range("2022-09-01", "2022-10-30", freq="3D")
+    rng = np.random.default_rng(0)
+    data = rng.uniform(size=(len(t), 2, 3, 4))
+    data[rng.uniform(size=data.shape) < nan_fraction] = np.nan
+    cube = xr.DataArray(
+        data, dims=["t", "bands", "y", "x"], coords={"t": t, "bands": ["b1", "b2"]}
+    )
+    # extends beyond the input time series on both sides
+    context = dict(temporal_extent_target=["2022-08-28", "2022-11-05"], interval_days=2)
+
+    interpolated = apply_datacube(cube, context)
+    expected = cube.interp(t=interpolated.t.values)
+
+    assert np.isnan(interpolated[0]).all() and np.isnan(interpolated[-1]).all()
+    # NaN inputs propagate, except on target time steps that coincide with a valid input,
+    # which xr.interp sets to NaN if a neighbouring input is NaN
+    finite = np.isfinite(expected.values)
+    on_input = np.isin(interpolated.t, t)[:, np.newaxis, np.newaxis, np.newaxis]
+    assert (finite | np.isnan(interpolated.values) | on_input).all()
+    assert np.allclose(interpolated.values[finite], expected.values[finite], rtol=1e-12)
+
+
+def test_interpolation_skip_nan():
+    t = xr.date_range("2022-09-01", "2022-10-30", freq="3D")
+    rng = np.random.default_rng(0)
+    data = rng.uniform(size=(len(t), 2, 3, 4))
+    data[rng.uniform(size=data.shape) < 0.3] = np.nan
+    cube = xr.DataArray(
+        data, dims=["t", "bands", "y", "x"], coords={"t": t, "bands": ["b1", "b2"]}
+    )
+    context = dict(
+        temporal_extent_target=["2022-08-28", "2022-11-05"],
+        interval_days=2,
+        skip_nan=True,
+    )
+
+    interpolated = apply_datacube(cube, context)
+
+    t_num = t.values.astype(np.int64)
+    t_target_num = interpolated.t.values.astype("datetime64[ns]").astype(np.int64)
+    for band in range(2):
+        for y in range(3):
+            for x in range(4):
+                values = data[:, band, y, x]
+                valid = ~np.isnan(values)
+                expected = np.interp(
+                    t_target_num,
+                    t_num[valid],
+                    values[valid],
+                    left=np.nan,
+                    right=np.nan,
+                )
+                assert np.allclose(
+                    interpolated[:, band, y, x], expected, equal_nan=True
+                )
+
+
+def test_time_axis_is_cached_across_chunks():
+    t = xr.date_range("2022-09-01", "2022-09-30", freq="3D")
+    rng = np.random.default_rng(0)
+    cube = xr.DataArray(
+        rng.uniform(size=(len(t), 2, 3, 4)),
+        dims=["t", "bands", "y", "x"],
+        coords={"t": t, "bands": ["b1", "b2"]},
+    )
+    context = dict(temporal_extent_target=["2022-09-01", "2022-09-28"], interval_days=2)
+    _TIME_AXIS_CACHE.clear()
+
+    first = apply_datacube(cube, context)
+    second = apply_datacube(cube + 1, dict(context))
+    apply_datacube(cube.isel(t=slice(1, None)), context)
+
+    assert time_axis_cache_info()["hits"] == 1
+    assert time_axis_cache_info()["misses"] == 2
+    assert np.allclose(second, first + 1, equal_nan=True)
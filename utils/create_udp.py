@@ -7,6 +7,11 @@ import importlib
 import click
 import openeo
 from efast_openeo.define_udp import create_efast_udp
+from efast_openeo.metadata_cache import (
+    DEFAULT_CACHE_DIR,
+    CachedMetadataConnection,
+    CollectionMetadataCache,
+)
 
 
 @click.group()
@@ -16,10 +21,27 @@ def cli():
 
 @cli.command()
 @click.argument("json_path", type=click.Path(path_type=Path))
-def export(json_path: Path):
-    connection = openeo.connect(
-        "https://openeo.dataspace.copernicus.eu/"
-    ).authenticate_oidc()
+@click.option(
+    "--offline",
+    is_flag=True,
+    help="Build the process graph from the cached collection metadata, without connecting to the backend.",
+)
+@click.option(
+    "--metadata-cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=DEFAULT_CACHE_DIR,
+    show_default=True,
+    help="Directory of the collection metadata cache.",
+)
+def export(json_path: Path, offline: bool, metadata_cache_dir: Path):
+    connection = None
+    if not offline:
+        connection = openeo.connect(
+            "https://openeo.dataspace.copernicus.eu/"
+        ).authenticate_oidc()
+    connection = CachedMetadataConnection(
+        connection, CollectionMetadataCache(metadata_cache_dir)
+    )
     params, process_graph = create_efast_udp(connection)
     process_description_resource = importlib.resources.files("efast_openeo.data").joinpath("process-description.md")
     process_description = process_description_resource.read_text(encoding="utf-8")
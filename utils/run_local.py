@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Run the EFAST chain locally (see ``efast_openeo.local``) on Sentinel-2 and Sentinel-3 cubes stored as
+netCDF or zarr, without an openEO backend.
+"""
+
+from pathlib import Path
+
+import click
+
+from efast_openeo import constants
+from efast_openeo.local import efast_local, load_cube
+from efast_openeo.main import parse_bands
+from efast_openeo.util.log import logger
+
+
+@click.command()
+@click.argument("s2_path", type=click.Path(exists=True, path_type=Path))
+@click.argument("s3_path", type=click.Path(exists=True, path_type=Path))
+@click.option("--max-distance-to-cloud-m", type=float, default=5000, show_default=True)
+@click.option("--t-start", required=True, type=str)
+@click.option("--t-end-excl", required=True, type=str)
+@click.option("--t-target-start", type=str)
+@click.option("--t-target-end-excl", type=str)
+@click.option("--interval-days", type=int, default=1, show_default=True)
+@click.option(
+    "--temporal-score-stddev",
+    type=float,
+    default=constants.S2_TEMPORAL_SCORE_STDDEV,
+    show_default=True,
+)
+@click.option("--temporal-score-truncate", type=float, default=None)
+@click.option("--composite-memory-budget-mb", type=float, default=None)
+@click.option(
+    "--composite-engine",
+    type=click.Choice(["numpy", "numba", "sliding_window"]),
+    default="numpy",
+    show_default=True,
+)
+@click.option("--composite-mosaic-days", type=int, default=None)
+@click.option(
+    "--s3-data-bands",
+    callback=parse_bands,
+    default="Syn_Oa04_reflectance,Syn_Oa06_reflectance",
+)
+@click.option("--s2-data-bands", callback=parse_bands, default="B02,B03")
+@click.option("--fused-band-names", callback=parse_bands)
+@click.option("--s2-scale", type=float, default=1.0, show_default=True)
+@click.option("--s2-offset", type=float, default=0.0, show_default=True)
+@click.option("--s3-scale", type=float, default=1.0, show_default=True)
+@click.option("--s3-offset", type=float, default=0.0, show_default=True)
+@click.option("--cloud-tolerance-percentage", type=float, default=0.05)
+@click.option("--output-ndvi", is_flag=True)
+@click.option("--dtype", type=click.Choice(["float32", "float64"]), default=None)
+@click.option(
+    "--chunk-size-pixels",
+    type=int,
+    default=None,
+    help="If set, process lazily with dask in spatial chunks of this many S2 pixels.",
+)
+@click.option("--save-intermediates", is_flag=True)
+@click.option("--skip-intermediates", callback=parse_bands)
+@click.option("-o", "--output-dir", default="local_output", help="Output directory.")
+def main(
+    s2_path,
+    s3_path,
+    max_distance_to_cloud_m,
+    t_start,
+    t_end_excl,
+    t_target_start,
+    t_target_end_excl,
+    interval_days,
+    temporal_score_stddev,
+    temporal_score_truncate,
+    composite_memory_budget_mb,
+    composite_engine,
+    composite_mosaic_days,
+    s3_data_bands,
+    s2_data_bands,
+    fused_band_names,
+    s2_scale,
+    s2_offset,
+    s3_scale,
+    s3_offset,
+    cloud_tolerance_percentage,
+    output_ndvi,
+    dtype,
+    chunk_size_pixels,
+    save_intermediates,
+    skip_intermediates,
+    output_dir,
+):
+    output_dir = Path(output_dir).resolve()
+    output_dir.mkdir(exist_ok=True, parents=True)
+
+    temporal_extent_target = None
+    if t_target_start and t_target_end_excl:
+        temporal_extent_target = [t_target_start, t_target_end_excl]
+
+    # open lazily, the cubes are rechunked spatially by ``efast_local``
+    chunks = None if chunk_size_pixels is None else {}
+    logger.info(f"Running EFAST locally on '{s2_path}' and '{s3_path}'")
+    fused = efast_local(
+        load_cube(s2_path, chunks=chunks),
+        load_cube(s3_path, chunks=chunks),
+        max_distance_to_cloud_m=max_distance_to_cloud_m,
+        temporal_extent=[t_start, t_end_excl],
+        temporal_extent_target=temporal_extent_target,
+        interval_days=interval_days,
+        s3_data_bands=s3_data_bands,
+        s2_data_bands=s2_data_bands,
+        fused_band_names=fused_band_names,
+        cloud_tolerance_percentage=cloud_tolerance_percentage,
+        temporal_score_stddev=temporal_score_stddev,
+        output_ndvi=output_ndvi,
+        s2_scale=s2_scale,
+        s2_offset=s2_offset,
+        s3_scale=s3_scale,
+        s3_offset=s3_offset,
+        temporal_score_truncate=temporal_score_truncate,
+        composite_memory_budget_mb=composite_memory_budget_mb,
+        composite_engine=composite_engine,
+        composite_mosaic_days=composite_mosaic_days,
+        dtype=dtype,
+        chunk_size_pixels=chunk_size_pixels,
+        output_dir=output_dir if save_intermediates else None,
+        skip_intermediates=skip_intermediates,
+    )
+    fused.to_dataset(dim="bands").to_netcdf(output_dir / "fused.nc")
+    logger.info("Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Per-stage table of the UDF invocations of an EFAST run with instrumented UDFs (``--instrument-udfs``), aggregated
+from the logs of a batch job or from log files (JSON lists of log entries, as returned by ``BatchJob.logs()``,
+or text logs).
+"""
+
+import json
+from pathlib import Path
+
+import click
+import openeo
+import pandas as pd
+
+from efast_openeo.instrumentation import aggregate_udf_records, parse_udf_records
+
+
+def read_logs(path: Path) -> list:
+    text = path.read_text()
+    try:
+        logs = json.loads(text)
+    except json.JSONDecodeError:
+        return text.splitlines()
+    return logs if isinstance(logs, list) else [logs]
+
+
+@click.command()
+@click.argument("log_files", nargs=-1, type=click.Path(exists=True, path_type=Path))
+@click.option("--job-id", help="Batch job on the CDSE backend to fetch the logs of.")
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write the table as CSV.",
+)
+def main(log_files, job_id, output):
+    if not log_files and job_id is None:
+        raise click.UsageError("Either LOG_FILES or --job-id must be given")
+
+    logs = []
+    for path in log_files:
+        logs.extend(read_logs(path))
+    if job_id is not None:
+        connection = openeo.connect(
+            "https://openeo.dataspace.copernicus.eu/"
+        ).authenticate_oidc()
+        logs.extend(connection.job(job_id).logs(level="info"))
+
+    records = parse_udf_records(logs)
+    click.echo(f"Found {len(records)} UDF invocation records")
+    table = aggregate_udf_records(records)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        click.echo(table.to_string(index=False, float_format="{:.3f}".format))
+    if output is not None:
+        table.to_csv(output, index=False)
+
+
+if __name__ == "__main__":
+    main()